@@ -0,0 +1,486 @@
+# Benchmark Dataset Creator audio file functions
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+import json
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+
+# Name of the persistent probe index, saved in the export folder
+PROBE_INDEX_FILENAME = 'audio_probe_index.json'
+
+# soundfile subtypes of the uncompressed WAV and AIFF sample formats, by (float, bytes per sample)
+WAV_SUBTYPES = {(False, 1): 'PCM_U8', (False, 2): 'PCM_16', (False, 3): 'PCM_24', (False, 4): 'PCM_32',
+                (True, 4): 'FLOAT', (True, 8): 'DOUBLE'}
+AIFF_SUBTYPES = {(False, 1): 'PCM_S8', (False, 2): 'PCM_16', (False, 3): 'PCM_24', (False, 4): 'PCM_32',
+                 (True, 4): 'FLOAT', (True, 8): 'DOUBLE'}
+
+
+# ---------------------------------
+#  Memory-mapped PCM audio functions
+def read_extended_float(data):
+    """
+    Decodes an 80-bit IEEE 754 extended precision float, as used for the AIFF sampling frequency.
+
+    Inputs:
+        - data: 10 bytes, big-endian.
+
+    Outputs:
+        - value: Decoded float.
+    """
+    exponent = ((data[0] & 0x7F) << 8) | data[1]
+    mantissa = int.from_bytes(data[2:10], 'big')
+    if exponent == 0 and mantissa == 0:
+        return 0.0
+    value = mantissa * 2.0 ** (exponent - 16383 - 63)
+    return -value if data[0] & 0x80 else value
+
+
+def iter_chunks(f, byteorder, end):
+    """
+    Walks through the chunks of a RIFF or IFF file.
+
+    Inputs:
+        - f: File opened in binary mode, positioned on the first chunk.
+        - byteorder: '<' for RIFF (WAV), '>' for IFF (AIFF).
+        - end: Position of the end of the chunks (bytes).
+
+    Outputs:
+        - Generator of (chunk id, position of the chunk data, chunk size) tuples.
+    """
+    position = f.tell()
+    while position + 8 <= end:
+        f.seek(position)
+        chunk_id, size = struct.unpack(byteorder + '4sI', f.read(8))
+        yield chunk_id, position + 8, size
+        # Chunks are padded to an even size
+        position += 8 + size + (size & 1)
+
+
+def get_pcm_header(subtypes, is_float, sample_width, channels, samplerate, byteorder):
+    """
+    Builds the header of an uncompressed audio file from its sample format.
+
+    Inputs:
+        - subtypes: WAV_SUBTYPES or AIFF_SUBTYPES.
+        - is_float: True for float samples.
+        - sample_width: Bytes per sample.
+        - channels: Number of channels.
+        - samplerate: Sampling frequency (Hz).
+        - byteorder: '<' for little-endian, '>' for big-endian samples.
+
+    Outputs:
+        - header: Dictionary, see read_pcm_header, None if the sample format is not supported.
+    """
+    subtype = subtypes.get((is_float, sample_width))
+    if subtype is None or channels <= 0 or samplerate <= 0:
+        return None
+    return {'fs (Hz)': int(samplerate), 'Channels': channels, 'Subtype': subtype, 'Sample width': sample_width,
+            'Byte order': byteorder}
+
+
+def set_pcm_data(header, data_offset, data_size, file_size):
+    """
+    Adds the position of the audio data to the header of an uncompressed audio file.
+
+    Inputs:
+        - header: Dictionary, see get_pcm_header.
+        - data_offset: Position of the first sample (bytes).
+        - data_size: Size of the audio data given by the header (bytes).
+        - file_size: Size of the file (bytes).
+
+    Outputs:
+        - header: Dictionary, see read_pcm_header.
+    """
+    # The data size of a file that was not finalized can be wrong
+    data_size = min(data_size, file_size - data_offset)
+    header['Data offset'] = data_offset
+    header['Frames'] = max(data_size, 0) // (header['Channels'] * header['Sample width'])
+    return header
+
+
+def read_wav_header(f, file_size):
+    """
+    Reads the sample format and the position of the audio data of a WAV file.
+
+    Inputs:
+        - f: File opened in binary mode, positioned after the RIFF header.
+        - file_size: Size of the file (bytes).
+
+    Outputs:
+        - header: Dictionary, see read_pcm_header, None if the file is not uncompressed PCM or float audio.
+    """
+    header = None
+    for chunk_id, position, size in iter_chunks(f, '<', file_size):
+        if chunk_id == b'fmt ':
+            f.seek(position)
+            fmt = f.read(min(size, 40))
+            if len(fmt) < 16:
+                return None
+            audio_format, channels, samplerate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+            if audio_format == 0xFFFE and len(fmt) >= 26:
+                # WAVE_FORMAT_EXTENSIBLE, the format is the start of the sub-format GUID
+                valid_bits, = struct.unpack('<H', fmt[18:20])
+                audio_format, = struct.unpack('<H', fmt[24:26])
+                if valid_bits not in (0, bits):
+                    return None
+            if audio_format not in (1, 3) or bits % 8 or block_align != channels * bits // 8:
+                return None
+            header = get_pcm_header(WAV_SUBTYPES, audio_format == 3, bits // 8, channels, samplerate, '<')
+            if header is None:
+                return None
+        elif chunk_id == b'data' and header is not None:
+            return set_pcm_data(header, position, size, file_size)
+    return None
+
+
+def read_aiff_header(f, file_size, is_aifc):
+    """
+    Reads the sample format and the position of the audio data of an AIFF or AIFF-C file.
+
+    Inputs:
+        - f: File opened in binary mode, positioned after the FORM header.
+        - file_size: Size of the file (bytes).
+        - is_aifc: True for AIFF-C files, which give the compression type.
+
+    Outputs:
+        - header: Dictionary, see read_pcm_header, None if the file is not uncompressed PCM or float audio.
+    """
+    header = None
+    for chunk_id, position, size in iter_chunks(f, '>', file_size):
+        if chunk_id == b'COMM':
+            f.seek(position)
+            comm = f.read(min(size, 22))
+            if len(comm) < 18:
+                return None
+            channels, _, bits = struct.unpack('>hIh', comm[:8])
+            samplerate = read_extended_float(comm[8:18])
+
+            # Big-endian integers, little-endian integers ('sowt') or big-endian floats
+            compression = comm[18:22] if is_aifc else b'NONE'
+            if compression == b'NONE':
+                is_float, byteorder = False, '>'
+            elif compression == b'sowt':
+                is_float, byteorder = False, '<'
+            elif compression.lower() in (b'fl32', b'fl64'):
+                is_float, byteorder = True, '>'
+                bits = int(compression[2:])
+            else:
+                return None
+            if bits <= 0 or bits % 8:
+                return None
+            header = get_pcm_header(AIFF_SUBTYPES, is_float, bits // 8, channels, samplerate, byteorder)
+            if header is None:
+                return None
+        elif chunk_id == b'SSND' and header is not None:
+            f.seek(position)
+            offset, _ = struct.unpack('>II', f.read(8))
+            return set_pcm_data(header, position + 8 + offset, size - 8 - offset, file_size)
+    return None
+
+
+def read_pcm_header(audiofile):
+    """
+    Reads the header of an uncompressed WAV or AIFF file, to memory-map its audio data.
+
+    Inputs:
+        - audiofile: Path to the audio file.
+
+    Outputs:
+        - header: Dictionary with the 'fs (Hz)', 'Channels', 'Frames', soundfile 'Subtype', 'Sample width' (bytes),
+        'Byte order' ('<' or '>') and 'Data offset' (bytes) of the audio data, None if the file is not an
+        uncompressed WAV or AIFF file.
+    """
+    file_size = os.path.getsize(audiofile)
+    try:
+        with open(audiofile, 'rb') as f:
+            form = f.read(12)
+            if len(form) < 12:
+                return None
+            if form[:4] == b'RIFF' and form[8:12] == b'WAVE':
+                return read_wav_header(f, file_size)
+            if form[:4] == b'FORM' and form[8:12] in (b'AIFF', b'AIFC'):
+                return read_aiff_header(f, file_size, form[8:12] == b'AIFC')
+    except struct.error:
+        # Truncated header
+        return None
+    return None
+
+
+class MemmapAudioFile:
+    """
+    Reader of an uncompressed WAV or AIFF file, with the interface of soundfile.SoundFile used by the export
+    engine (samplerate, channels, frames, subtype, seekable, tell, seek and read).
+
+    The audio data is memory-mapped with np.memmap for each read, so that the memory use does not depend on the
+    size of the file. The frames are returned as a view of the mapping when they are read in their stored format
+    (native byte order 16 or 32-bit integers, or floats), otherwise they are converted as soundfile does.
+    """
+
+    def __init__(self, audiofile, header):
+        """
+        Inputs:
+            - audiofile: Path to the audio file.
+            - header: Dictionary, see read_pcm_header.
+        """
+        self.name = audiofile
+        self.samplerate = header['fs (Hz)']
+        self.channels = header['Channels']
+        self.frames = header['Frames']
+        self.subtype = header['Subtype']
+        self.header = header
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # Each read maps its own frames, there is nothing to release
+        pass
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, frames):
+        self.position = min(max(int(frames), 0), self.frames)
+        return self.position
+
+    def read(self, frames=-1, dtype='float64', always_2d=False, channels=None):
+        """
+        Reads frames from the current position, see soundfile.SoundFile.read.
+
+        Inputs:
+            - frames: Number of frames to read, -1 to read up to the end of the file.
+            - dtype: 'float64', 'float32', 'int32' or 'int16', integers are left-justified as in soundfile.
+            - always_2d: If False, the frames of a single channel are returned as a 1D array.
+            - channels: Index of the channels to read (slice or list), all of the channels if None. The channels
+            are selected before the samples are converted.
+
+        Outputs:
+            - x: Array of shape (frames, channels), with fewer frames at the end of the file.
+        """
+        frames = self.frames - self.position if frames < 0 else min(frames, self.frames - self.position)
+        x = self.map_frames(max(frames, 0), np.dtype(dtype), channels)
+        self.position += x.shape[0]
+        return x if always_2d or x.shape[1] > 1 else x[:, 0]
+
+    def map_frames(self, frames, dtype, channels=None):
+        """
+        Maps frames from the current position and converts the wanted channels to dtype, see read.
+        """
+        width = self.header['Sample width']
+        order = self.header['Byte order']
+        is_float = self.subtype in ('FLOAT', 'DOUBLE')
+
+        # Only map the frames to read, the mapping is released with its last view
+        offset = self.header['Data offset'] + self.position * self.channels * width
+        if frames == 0:
+            x = np.zeros((0, self.channels, 3) if width == 3 else (0, self.channels), dtype='u1')
+        elif width == 3:
+            # Packed 24-bit samples, read byte by byte
+            x = np.memmap(self.name, dtype='u1', mode='r', offset=offset, shape=(frames, self.channels, 3))
+        else:
+            kind = 'f' if is_float else 'u' if self.subtype == 'PCM_U8' else 'i'
+            x = np.memmap(self.name, dtype=np.dtype(f'{order}{kind}{width}'), mode='r', offset=offset,
+                          shape=(frames, self.channels))
+        x = x.view(np.ndarray)
+        if channels is not None:
+            x = x[:, channels]
+
+        if is_float:
+            if dtype.kind != 'f':
+                raise ValueError(f"Float audio files can only be read as floats, not {dtype}")
+            return x if x.dtype == dtype else x.astype(dtype)
+        if x.dtype == dtype:
+            return x
+
+        if width == 3:
+            # Place the 3 bytes of each sample in the upper bytes of little-endian 32-bit integers, which gives the
+            # samples left-justified on 32 bits in a single copy
+            x32 = np.zeros(x.shape[:2], dtype='<i4')
+            x32.view('u1').reshape(x.shape[:2] + (4,))[..., 1:] = x if order == '<' else x[..., ::-1]
+            x32 = x32.astype(np.int32, copy=False)
+            if dtype.kind == 'f':
+                x = x32.astype(dtype)
+                x *= dtype.type(2.0 ** -31)
+                return x
+            return x32 if dtype == np.int32 else (x32 >> 16).astype(dtype)
+
+        if dtype.kind == 'f':
+            # Same scaling as soundfile, 1 / 2 ** (bits - 1)
+            x = x.astype(dtype)
+            if self.subtype == 'PCM_U8':
+                x -= 128
+            x *= dtype.type(2.0 ** (1 - 8 * width))
+            return x
+        if dtype.kind != 'i':
+            raise ValueError(f"Unsupported data type {dtype}")
+
+        # Integers left-justified on the bits of dtype, the lower bits are dropped as soundfile does
+        shift = 8 * (dtype.itemsize - width)
+        if shift < 0:
+            return (x >> -shift).astype(dtype)
+        x = x.astype(dtype)
+        if self.subtype == 'PCM_U8':
+            x -= 128
+        x <<= shift
+        return x
+
+
+def open_audiofile(audiofile):
+    """
+    Opens an audio file to read its clip windows: uncompressed WAV and AIFF files are memory-mapped, see
+    MemmapAudioFile, the other files are opened with soundfile.
+
+    Inputs:
+        - audiofile: Path to the audio file.
+
+    Outputs:
+        - MemmapAudioFile or soundfile.SoundFile object, to be used as a context manager.
+    """
+    header = read_pcm_header(audiofile)
+    if header is None:
+        return sf.SoundFile(audiofile)
+    return MemmapAudioFile(audiofile, header)
+
+
+# -----------------------
+#  Audio probe functions
+def probe_audiofile(audiofile):
+    """
+    Reads the header of an audio file, without decoding any audio.
+
+    Inputs:
+        - audiofile: Path to the audio file.
+
+    Outputs:
+        - probe: Dictionary with the file 'Size (bytes)', 'Mtime (ns)', 'fs (Hz)', 'Channels', 'Frames',
+        'Duration (s)', 'Format' and 'Subtype'.
+    """
+    stat = os.stat(audiofile)
+    info = sf.info(audiofile)
+
+    probe = {
+        'Size (bytes)': stat.st_size,
+        'Mtime (ns)': stat.st_mtime_ns,
+        'fs (Hz)': info.samplerate,
+        'Channels': info.channels,
+        'Frames': info.frames,
+        'Duration (s)': info.frames / info.samplerate,
+        'Format': info.format,
+        'Subtype': info.subtype
+    }
+    return probe
+
+
+def get_probe_index_file(export_settings):
+    """
+    Get the path of the persistent probe index from the export settings, the index is shared by all of the
+    projects saved in the same export folder.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+
+    Outputs:
+        - probe_index_file: Path to the probe index (.json).
+    """
+    return os.path.join(export_settings['Export folders']['Export folder'], PROBE_INDEX_FILENAME)
+
+
+def load_probe_index(probe_index_file):
+    """
+    Loads the persistent probe index.
+
+    Inputs:
+        - probe_index_file: Path to the probe index (.json).
+
+    Outputs:
+        - probe_index: Dictionary with the audio file paths as keys and their probe as values, empty if the
+        index does not exist or cannot be read.
+    """
+    if not os.path.exists(probe_index_file):
+        return {}
+
+    try:
+        with open(probe_index_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # A corrupted index is rebuilt
+        return {}
+
+
+def save_probe_index(probe_index_file, probe_index):
+    """
+    Saves the persistent probe index, the file is replaced atomically so that an interrupted save never
+    leaves a truncated index. When several exports save the index at once, the last save is kept.
+
+    Inputs:
+        - probe_index_file: Path to the probe index (.json).
+        - probe_index: Dictionary with the audio file paths as keys and their probe as values.
+    """
+    probe_index_folder = os.path.dirname(os.path.abspath(probe_index_file))
+    os.makedirs(probe_index_folder, exist_ok=True)
+
+    # Each save writes its own temporary file, so that concurrent exports sharing the index do not mix their writes
+    with tempfile.NamedTemporaryFile('w', dir=probe_index_folder, prefix=os.path.basename(probe_index_file) + '.',
+                                     suffix='.tmp', delete=False) as f:
+        json.dump(probe_index, f)
+    os.replace(f.name, probe_index_file)
+
+
+def probe_audiofiles(list_audio_files, probe_index_file=None, max_workers=16):
+    """
+    Probes the headers of a list of audio files. Probes are looked up in the persistent index first and are
+    only read again if the file size or modification time changed. Headers are read concurrently, which hides
+    the latency of network shares.
+
+    Inputs:
+        - list_audio_files: A list of audio files with their full paths.
+        - probe_index_file: Path to the probe index (.json), see get_probe_index_file. If None, the probes
+        are not saved.
+        - max_workers: Maximum number of concurrent header reads.
+
+    Outputs:
+        - probes: Dictionary with the audio file paths as keys and their probe as values, see probe_audiofile.
+    """
+    probe_index = load_probe_index(probe_index_file) if probe_index_file is not None else {}
+
+    def get_probe(audiofile):
+        # Use the indexed probe if the file did not change
+        stat = os.stat(audiofile)
+        probe = probe_index.get(audiofile)
+        if (probe is not None and probe['Size (bytes)'] == stat.st_size
+                and probe['Mtime (ns)'] == stat.st_mtime_ns):
+            return probe, False
+        return probe_audiofile(audiofile), True
+
+    list_audio_files = list(dict.fromkeys(list_audio_files))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(get_probe, list_audio_files))
+
+    probes = {}
+    updated = False
+    for audiofile, (probe, is_new) in zip(list_audio_files, results):
+        probes[audiofile] = probe
+        if is_new:
+            probe_index[audiofile] = probe
+            updated = True
+
+    # Save the new probes
+    if probe_index_file is not None and updated:
+        save_probe_index(probe_index_file, probe_index)
+
+    return probes
@@ -0,0 +1,166 @@
+# Benchmark Dataset Creator clip cache functions
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+import json
+import shutil
+import hashlib
+
+
+# Default disk budget of the clip cache (MB)
+DEFAULT_CLIP_CACHE_SIZE_MB = 10240
+
+
+# ---------------------------
+#  Clip cache key functions
+def get_clip_cache(export_settings):
+    """
+    Get the clip cache of the export settings: a folder of FLAC clips shared by the export runs, which is used
+    when export_settings['Clip cache folder'] is given.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+
+    Outputs:
+        - cache_folder: Path to the clip cache folder, None if there is no clip cache.
+        - cache_size_mb: Disk budget of the clip cache (MB), export_settings['Clip cache size (MB)'], 10240 MB if
+        missing.
+    """
+    return (export_settings.get('Clip cache folder'),
+            export_settings.get('Clip cache size (MB)', DEFAULT_CLIP_CACHE_SIZE_MB))
+
+
+def get_audiofile_key(audiofile):
+    """
+    Get the identity of a source audio file in the clip cache keys: its path, size and modification time, so that
+    the clips of a modified audio file are not reused.
+
+    Inputs:
+        - audiofile: Path to the source audio file ('Begin Path').
+
+    Outputs:
+        - audiofile_key: [path, size (bytes), modification time (ns)] list.
+    """
+    stat = os.stat(audiofile)
+    return [os.path.abspath(audiofile), stat.st_size, stat.st_mtime_ns]
+
+
+def get_clip_key(audiofile_key, channel, start_clip, settings):
+    """
+    Get the cache key of a clip: a hash of the source audio file identity, the channel, the clip start time and
+    the settings of the clip audio.
+
+    Inputs:
+        - audiofile_key: Identity of the source audio file, see get_audiofile_key.
+        - channel: Channel number (0-based).
+        - start_clip: Start time of the export clip (s).
+        - settings: List of the settings of the clip audio: duration, sampling frequency, bit depth, resampling
+        quality and context and FLAC compression level, see engine.export_audiofile.
+
+    Outputs:
+        - key: Hexadecimal SHA-256 hash.
+    """
+    return hashlib.sha256(json.dumps(audiofile_key + [channel, start_clip] + settings).encode()).hexdigest()
+
+
+def get_cache_file(cache_folder, key):
+    """
+    Get the path of a clip in the clip cache, the clips are spread over 256 subfolders.
+    """
+    return os.path.join(cache_folder, key[:2], key + '.flac')
+
+
+# ---------------------------
+#  Clip cache functions
+def link_file(filename, new_filename):
+    """
+    Hardlinks a file to a new path, or copies it if the file system does not support a hardlink between the two
+    paths. An existing file at the new path is replaced.
+    """
+    if os.path.exists(new_filename):
+        os.remove(new_filename)
+    try:
+        os.link(filename, new_filename)
+    except OSError:
+        shutil.copyfile(filename, new_filename)
+
+
+def restore_clip(cache_folder, key, export_path):
+    """
+    Links a clip of the clip cache to the export folder, if it is in the cache. The clip is marked as the most
+    recently used, see evict_clips.
+
+    Inputs:
+        - cache_folder: Path to the clip cache folder.
+        - key: Cache key of the clip, see get_clip_key.
+        - export_path: Path to the FLAC clip to export.
+
+    Outputs:
+        - hit: True if the clip was in the cache and is exported.
+    """
+    cache_file = get_cache_file(cache_folder, key)
+    try:
+        link_file(cache_file, export_path + '.part')
+    except FileNotFoundError:
+        # The clip is not in the cache, or was evicted by another export
+        return False
+
+    os.replace(export_path + '.part', export_path)
+    os.utime(cache_file)
+    return True
+
+
+def add_clip(cache_folder, key, export_path):
+    """
+    Adds an exported FLAC clip to the clip cache, by hardlinking it. A clip of the same key that is already in the
+    cache is kept.
+
+    Inputs:
+        - cache_folder: Path to the clip cache folder.
+        - key: Cache key of the clip, see get_clip_key.
+        - export_path: Path to the exported FLAC clip.
+    """
+    cache_file = get_cache_file(cache_folder, key)
+    if os.path.exists(cache_file):
+        return
+
+    # The clip is renamed once complete, several export processes can share the cache
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    part_file = f'{cache_file}.{os.getpid()}.part'
+    link_file(export_path, part_file)
+    os.replace(part_file, cache_file)
+
+
+def evict_clips(cache_folder, cache_size_mb):
+    """
+    Deletes the least recently used clips of the clip cache until the cache fits in its disk budget. The
+    modification time of the cached clips is their last use, see restore_clip.
+
+    Inputs:
+        - cache_folder: Path to the clip cache folder.
+        - cache_size_mb: Disk budget of the clip cache (MB).
+
+    Outputs:
+        - evicted: Number of deleted clips.
+    """
+    clips = []
+    for entry in os.scandir(cache_folder) if os.path.isdir(cache_folder) else []:
+        if entry.is_dir():
+            clips += [(clip_entry.stat().st_mtime_ns, clip_entry.stat().st_size, clip_entry.path)
+                      for clip_entry in os.scandir(entry.path) if clip_entry.name.endswith('.flac')]
+
+    cache_size = sum(size for _, size, _ in clips)
+    evicted = 0
+    for _, size, cache_file in sorted(clips):
+        if cache_size <= cache_size_mb * 2 ** 20:
+            break
+        try:
+            os.remove(cache_file)
+        except FileNotFoundError:
+            pass
+        cache_size -= size
+        evicted += 1
+
+    return evicted
@@ -0,0 +1,88 @@
+# Benchmark Dataset Creator clip store functions
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Folder of the clip store and its index, saved in the project export folder
+CLIP_STORE_FOLDER = 'clip_store'
+
+# Names of the clip store array and of its index, saved in the clip store folder
+CLIP_STORE_FILENAME = 'clips.npy'
+CLIP_INDEX_FILENAME = 'clip_index.parquet'
+
+
+# ---------------------------
+#  Clip store functions
+def get_clip_store_folder(export_settings):
+    """
+    Get the folder of the clip store, next to the audio and annotations folders.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+
+    Outputs:
+        - clip_store_folder: Path to the clip store folder.
+    """
+    project_folder = os.path.dirname(os.path.normpath(export_settings['Export folders']['Audio export folder']))
+    return os.path.join(project_folder, CLIP_STORE_FOLDER)
+
+
+def create_clip_store(store_file, n_clips, n_samples, dtype):
+    """
+    Preallocates the clip store: a .npy array of shape (n_clips, n_samples) filled with 0, which the export workers
+    open with numpy.load(store_file, mmap_mode='r+') to write their rows in place. An existing store is replaced.
+
+    Inputs:
+        - store_file: Path to the clip store (.npy).
+        - n_clips: Number of clips, one row per clip.
+        - n_samples: Number of samples of a clip.
+        - dtype: Data type of the samples, see engine.STORE_DTYPES.
+    """
+    os.makedirs(os.path.dirname(store_file), exist_ok=True)
+    if os.path.exists(store_file):
+        os.remove(store_file)
+
+    # The data of a new memory-mapped file is not written until it is used, the zeros take no time
+    array = np.lib.format.open_memmap(store_file, mode='w+', dtype=dtype, shape=(n_clips, n_samples))
+    array.flush()
+    del array
+
+
+def get_clip_index(plan_df, rows):
+    """
+    Get the index of the clip store: one line per row, with the clip and the labels of its selections.
+
+    Inputs:
+        - plan_df: Export plan DataFrame, without ignored selections, see dataset.plan_benchmark_exports.
+        - rows: Dictionary with the row of each export file name.
+
+    Outputs:
+        - clip_index_df: DataFrame with the 'Row', 'Export filename', 'Begin Path', 'Channel', 'Start export
+        clip' and 'Labels' (list of the labels of the clip selections, in the selection table order) of each clip,
+        sorted by row.
+    """
+    clips_df = plan_df.groupby('Export filename', sort=False).agg(
+        {'Begin Path': 'first', 'Channel': 'first', 'Start export clip': 'first', 'Label': list})
+    clips_df = clips_df.rename(columns={'Label': 'Labels'}).reset_index()
+    clips_df.insert(0, 'Row', clips_df['Export filename'].map(rows))
+
+    return clips_df.sort_values('Row', ignore_index=True)[
+        ['Row', 'Export filename', 'Begin Path', 'Channel', 'Start export clip', 'Labels']]
+
+
+def write_clip_index(index_file, clip_index_df):
+    """
+    Writes the index of the clip store as parquet, replacing the file at once.
+
+    Inputs:
+        - index_file: Path to the clip store index (.parquet).
+        - clip_index_df: Clip store index DataFrame, see get_clip_index, with the 'Samples' of each row.
+    """
+    clip_index_df.to_parquet(index_file + '.tmp', engine='pyarrow', index=False)
+    os.replace(index_file + '.tmp', index_file)
@@ -5,15 +5,35 @@
 
 import os
 import sys
+import json
 import shutil
+import hashlib
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 # from scipy import signal
+from scipy import stats
 import pandas as pd
-import librosa
-import soundfile as sf
 from tqdm import tqdm
 
+from BenchmarkDatasetCreator import audiofiles, clipstore, engine, manifest, shards
+
+
+# Data types of the selection table fields that are set explicitly, the other fields are inferred by pandas, as
+# their written values depend on it (e.g., an integer frequency is written as 100, not 100.0)
+SELECTION_TABLE_DTYPES = {'Begin Path': 'str'}
+
+# Values read as missing by pandas.read_csv, by default
+CSV_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+                 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# Folder of the parsed selection table cache, saved in the export folder
+SELECTION_TABLE_CACHE_FOLDER = 'selection_table_cache'
+
+# Folder of the selection tables partitioned by audio file in streaming mode, saved in the export folder
+SELECTION_TABLE_PARTITION_FOLDER = 'selection_table_partitions'
+
 
 # ---------------------------
 #  User interaction functions
@@ -91,11 +111,14 @@ def check_export_settings(export_settings):
     Inputs:
         - export_settings: A dictionary that should contain the audio export settings:
         'Original project name', 'Audio duration (s)', 'fs (Hz)', 'Bit depth', 'Export label', 
-        'Split export selections', and 'Export folder'.
+        'Split export selections', and 'Export folder'. 'Resampling quality', 'Resampling context (s)' and 'FLAC
+        compression level' are optional, see engine.get_resampling_quality, engine.get_resampling_context and
+        engine.get_flac_compression_level, as well as 'Export format', see shards.get_export_format.
 
     Raises:
         - ValueError: If any required field in the wanted_fields_list is missing in the export_settings 
-        dictionary.
+        dictionary, or if the resampling quality or context, FLAC compression level or export format is
+        invalid.
     """
     wanted_fields_dict = {
         'Project ID': None,
@@ -128,6 +151,10 @@ def check_export_settings(export_settings):
     if missing:
         raise ValueError(f"Error: Missing field(s) in export_settings: {missing}")
     else:
+        engine.get_resampling_quality(export_settings)
+        engine.get_resampling_context(export_settings)
+        engine.get_flac_compression_level(export_settings)
+        shards.get_export_format(export_settings)
         print(f"All required fields are filled")
 
 
@@ -271,17 +298,166 @@ def check_selection_table_folder(df):
     return missing
 
 
+def get_missing_fields_error(missing):
+    """
+    Get the error message listing the missing fields of the selection tables of a folder.
+
+    Inputs:
+        - missing: Dictionary with the selection table file names as keys and the list of their missing fields as
+        values, see check_selection_table_folder.
+
+    Output:
+        - error_msg: The error message.
+    """
+    error_msg = 'Error: The following field(s) is missing from the selection table:\n'
+    for keys, value in missing.items():
+        error_msg += f'--> in {keys}, the field(s) {value} are missing\n'
+    return error_msg
+
+
 # ----------------------------------------------
 # Manipulate existing selection tables functions
 
 
-def load_selection_table(selection_table_path):
+def read_selection_table(filename, dtypes=None):
+    """
+    Reads a tab-separated Raven Pro 1.6 selection table (.txt), with the data type of the audio file paths set
+    explicitly, see SELECTION_TABLE_DTYPES.
+
+    Inputs:
+        - filename: Path to the selection table file.
+        - dtypes: Dictionary of the data types of other fields, see partition_selection_tables. None (default)
+        infers them.
+
+    Returns:
+        - selection_table_df: A Panda DataFrame containing the selection table.
+    """
+    # The default C parser is kept, its float parsing defines the times written in the exported selection tables
+    return pd.read_csv(filename, sep='\t', dtype={**SELECTION_TABLE_DTYPES, **(dtypes or {})})
+
+
+def list_selection_table_files(selection_table_path):
+    """
+    List the selection table files of a selection table path.
+
+    Inputs:
+        - selection_table_path: A string representing the path to a selection table file or folder.
+
+    Returns:
+        - selection_table_files: List of the selection table files with their full paths, the '.txt' files in
+        the folder order if selection_table_path is a folder.
+    """
+    if os.path.isdir(selection_table_path):
+        return [os.path.join(selection_table_path, ff) for ff in os.listdir(selection_table_path)
+                if ff.endswith('.txt')]
+    return [selection_table_path]
+
+
+def get_selection_table_key(selection_table_files):
+    """
+    Get the cache key of selection table files: the path, size and modification time of each file.
+
+    Inputs:
+        - selection_table_files: List of the selection table files, see list_selection_table_files.
+
+    Returns:
+        - key: List of [path, size (bytes), modification time (ns)] lists.
+    """
+    key = []
+    for filename in selection_table_files:
+        stat = os.stat(filename)
+        key.append([os.path.abspath(filename), stat.st_size, stat.st_mtime_ns])
+    return key
+
+
+def get_selection_table_cache_file(selection_table_path, cache_folder):
+    """
+    Get the path of the parsed selection table cache (.parquet) of a selection table path. The key of the cache is
+    saved next to it (.json).
+
+    Inputs:
+        - selection_table_path: A string representing the path to a selection table file or folder.
+        - cache_folder: Folder where the cache folder is saved, e.g., the export folder.
+
+    Returns:
+        - cache_file: Path to the cache file (.parquet).
+    """
+    cache_name = hashlib.sha1(os.path.abspath(selection_table_path).encode()).hexdigest()
+    return os.path.join(cache_folder, SELECTION_TABLE_CACHE_FOLDER, cache_name + '.parquet')
+
+
+def load_cached_selection_table(cache_file, key):
+    """
+    Load a parsed selection table from the cache, the parquet file is memory-mapped.
+
+    Inputs:
+        - cache_file: Path to the cache file (.parquet), see get_selection_table_cache_file.
+        - key: Cache key of the selection table files, see get_selection_table_key.
+
+    Returns:
+        - selection_table_df: A Panda DataFrame containing the selection table, None if there is no cache or if
+        the selection table files changed.
+    """
+    key_file = os.path.splitext(cache_file)[0] + '.json'
+    if not os.path.exists(cache_file) or not os.path.exists(key_file):
+        return None
+
+    try:
+        with open(key_file, 'r') as f:
+            if json.load(f) != key:
+                return None
+        selection_table_df = pd.read_parquet(cache_file, memory_map=True)
+    except (OSError, ValueError):
+        # A corrupted cache is rebuilt
+        return None
+
+    # Missing strings are read as None from parquet files, and as NaN from the selection tables
+    for col in selection_table_df.columns[selection_table_df.dtypes == object]:
+        selection_table_df[col] = selection_table_df[col].where(selection_table_df[col].notna(), np.nan)
+
+    return selection_table_df
+
+
+def save_cached_selection_table(cache_file, key, selection_table_df):
+    """
+    Save a parsed selection table in the cache. The key is saved last, so that the cache is only valid once the
+    parquet file is complete.
+
+    Inputs:
+        - cache_file: Path to the cache file (.parquet), see get_selection_table_cache_file.
+        - key: Cache key of the selection table files, see get_selection_table_key.
+        - selection_table_df: A Panda DataFrame containing the selection table.
+    """
+    key_file = os.path.splitext(cache_file)[0] + '.json'
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    if os.path.exists(key_file):
+        os.remove(key_file)
+
+    try:
+        selection_table_df.to_parquet(cache_file + '.tmp', engine='pyarrow')
+    except (OSError, ValueError, TypeError) as error:
+        # The selection table is still loaded, only the cache is missing
+        print(f'The selection table could not be cached: {error}')
+        return
+    os.replace(cache_file + '.tmp', cache_file)
+
+    with open(key_file + '.tmp', 'w') as f:
+        json.dump(key, f)
+    os.replace(key_file + '.tmp', key_file)
+
+
+def load_selection_table(selection_table_path, max_workers=16, cache_folder=None, compact=False):
     """
     Load one or multiple selection table(s) from a file or folder. It takes tab-separated Raven Pro 1.6 
     selection tables (.txt).
 
     Inputs:
         - selection_table_path: A string representing the path to a selection table file or folder.
+        - max_workers: Maximum number of selection tables read concurrently from a folder.
+        - cache_folder: Folder where the parsed selection tables are cached (e.g., the export folder). The cache is
+        used as long as the selection table files keep the same paths, sizes and modification times. If None
+        (default), the selection tables are always parsed.
+        - compact: If True, returns the compact selection table, see compact_selection_table. Default is False.
 
     Returns:
         - selection_table_df: A Panda DataFrame containing the loaded selection table.
@@ -289,8 +465,8 @@ def load_selection_table(selection_table_path):
     This function loads the selection table from the provided selection_table_path, which can be either a 
     file or a folder containing multiple selection table files. If selection_table_path points to a file, 
     the function reads the file using pandas.read_csv(). If selection_table_path points to a folder, the 
-    function iterates through all '.csv' files in the folder, reads each file, and concatenates the data 
-    into a single DataFrame.
+    function reads all '.txt' files in the folder concurrently, and concatenates the data into a single
+    DataFrame at once.
 
     The function also checks if all necessary fields are present in the selection table(s) and raises a 
     ValueError if any field is missing. If all required fields are present, it prints a message confirming 
@@ -298,79 +474,181 @@ def load_selection_table(selection_table_path):
 
     """
 
+    # Load the selection table from the cache if the selection table files did not change
+    if cache_folder is not None and os.path.exists(selection_table_path):
+        cache_file = get_selection_table_cache_file(selection_table_path, cache_folder)
+        key = get_selection_table_key(list_selection_table_files(selection_table_path))
+        selection_table_df = load_cached_selection_table(cache_file, key)
+        if selection_table_df is not None:
+            if os.path.isdir(selection_table_path):
+                print('All required fields are in the selection tables')
+            else:
+                print('All required fields are in the selection table')
+            return compact_selection_table(selection_table_df) if compact else selection_table_df
+
     # If selection_table_path is a file
     if os.path.isfile(selection_table_path):
-        selection_table_df = pd.read_csv(selection_table_path, sep='\t')
+        selection_table_df = read_selection_table(selection_table_path)
 
         # Check if all necessary fields are present
         check_selection_table(selection_table_df)
 
     # If selection_table_path is a folder
     elif os.path.isdir(selection_table_path):
-        # Get the list of files
-        seltab_list = os.listdir(selection_table_path)
+        # Get the list of selection table files
+        seltab_list = list_selection_table_files(selection_table_path)
+        if not seltab_list:
+            raise ValueError(f'Error: No selection table (.txt) in {selection_table_path}')
 
-        # Create empty list for missing fields
-        missing = {}
-        for ff in seltab_list:
-            # Open selection table
-            selection_table_df_temp = pd.read_csv(os.path.join(selection_table_path, ff), sep='\t')
+        # Open the selection tables
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            selection_table_list = list(executor.map(read_selection_table, seltab_list))
 
-            # Check that all the files have the same fields
+        # Check that all the files have the same fields, and add the file and missing field to the dictionary
+        missing = {}
+        for ff, selection_table_df_temp in zip([os.path.basename(ff) for ff in seltab_list], selection_table_list):
             missing_file = check_selection_table_folder(selection_table_df_temp)
-
-            # Add the file and missing field to the dictionary if missing_file not empty
             if missing_file:
                 missing[ff] = missing_file
 
-            # If no entries are missing and this is the first selection table, create the output big selection table
-            elif (not missing_file) & ('selection_table_df' not in locals()):
-                selection_table_df = selection_table_df_temp
-
-            # If no entries are missing and selection_table_df exists   
-            elif (not missing_file) & ('selection_table_df' in locals()):
-                #selection_table_df = selection_table_df.append(selection_table_df_temp)
-                selection_table_df = pd.concat([selection_table_df, selection_table_df_temp], ignore_index=True)
-
-        # If all required fields are in 
+        # If all required fields are in, create the output big selection table
         if not missing:
             print('All required fields are in the selection tables')
+            selection_table_df = pd.concat(selection_table_list, ignore_index=True)
 
         else:
 
             # Raise an error indicating missing fields in the selection tables
-            error_msg = 'Error: The following field(s) is missing from the selection table:\n'
-            for keys, value in missing.items():
-                error_msg += f'--> in {keys}, the field(s) {value} are missing\n'
-            raise ValueError(error_msg)
-
-            # Empty the dataframe
-            selection_table_df = pd.DataFrame({'A': []})
+            raise ValueError(get_missing_fields_error(missing))
 
     else:
         # Raise an error for invalid selection_table_path
         raise ValueError("Please provide a valid path to an existing folder or file.")
 
-    return selection_table_df
+    # Save the parsed and checked selection table
+    if cache_folder is not None:
+        save_cached_selection_table(cache_file, key, selection_table_df)
+
+    return compact_selection_table(selection_table_df) if compact else selection_table_df
+
+
+def get_text_kind(values):
+    """
+    Get the kind of data type that pandas.read_csv infers for a field from its values read as text.
+
+    Inputs:
+        - values: Series of the values of the field (str), read without replacing the missing values.
+
+    Outputs:
+        - kind: 'i' or 'u' for integers, 'f' for floats, including numbers with missing values, 'O' otherwise.
+    """
+    missing = values.isin(CSV_NA_VALUES)
+    if missing.all():
+        return 'f'
+    numeric = pd.to_numeric(values[~missing], errors='coerce')
+    if numeric.isna().any():
+        return 'O'
+    return 'f' if missing.any() else numeric.dtype.kind
 
 
-def get_number_clips(list_audio_files, clip_duration):
+def partition_selection_tables(selection_table_path, partition_folder, chunksize=100000):
+    """
+    Splits one or multiple selection table(s) into one selection table per audio file ('Begin Path'). The
+    selection tables are read by chunks of rows, so that the whole selection table is never in memory.
+
+    The fields are copied as text and the partitions have the columns of all of the selection tables, so that
+    reading a partition with read_selection_table and the returned data types gives the rows of the audio file in
+    load_selection_table.
+
+    Inputs:
+        - selection_table_path: A string representing the path to a selection table file or folder.
+        - partition_folder: Folder where the partitions are saved, it is emptied first.
+        - chunksize: Number of selection table rows read at once.
+
+    Returns:
+        - partitions: Dictionary with the audio files as keys, in the selection table order, and the path of
+        their partition (.txt) as values.
+        - dtypes: Dictionary of the data types of the numeric fields that are floats in the concatenated selection
+        tables, e.g., a field of integers in some selection tables and of floats in others, which a partition
+        would otherwise read as integers. The kinds of values of the fields are inferred from the text of the
+        chunks (see get_text_kind), the selection tables are only read once.
+    """
+    if not os.path.exists(selection_table_path):
+        raise ValueError("Please provide a valid path to an existing folder or file.")
+
+    # Check that all the files have the required fields, from their headers
+    seltab_list = list_selection_table_files(selection_table_path)
+    header_list = [pd.read_csv(ff, sep='\t', nrows=0) for ff in seltab_list]
+    if os.path.isfile(selection_table_path):
+        check_selection_table(header_list[0])
+    else:
+        if not seltab_list:
+            raise ValueError(f'Error: No selection table (.txt) in {selection_table_path}')
+        missing = {}
+        for ff, header_df in zip(seltab_list, header_list):
+            missing_file = check_selection_table_folder(header_df)
+            if missing_file:
+                missing[os.path.basename(ff)] = missing_file
+        if missing:
+            raise ValueError(get_missing_fields_error(missing))
+        print('All required fields are in the selection tables')
+
+    # All of the columns, in the order of the concatenated selection tables
+    columns = list(dict.fromkeys([col for header_df in header_list for col in header_df.columns]))
+
+    if os.path.isdir(partition_folder):
+        shutil.rmtree(partition_folder)
+    os.makedirs(partition_folder)
+
+    # Append each chunk of rows to the partition of its audio file, and keep the kinds of values of each field
+    partitions = {}
+    kinds = {col: set() for col in columns}
+    for ff, header_df in zip(seltab_list, header_list):
+        for col in set(columns) - set(header_df.columns):
+            # The missing fields are filled with NaN when the selection tables are concatenated
+            kinds[col].add('f')
+        for chunk_df in pd.read_csv(ff, sep='\t', dtype=str, na_filter=False, chunksize=chunksize):
+            # The fields that are not numbers in a chunk are not numbers in the selection tables
+            for col in chunk_df.columns:
+                if col not in SELECTION_TABLE_DTYPES and kinds[col] <= {'i', 'u', 'f'}:
+                    kinds[col].add(get_text_kind(chunk_df[col]))
+            chunk_df = chunk_df.reindex(columns=columns)
+            for audiofile, audiofile_df in chunk_df.groupby('Begin Path', sort=False):
+                if audiofile not in partitions:
+                    partitions[audiofile] = os.path.join(partition_folder, f'{len(partitions):06d}.txt')
+                    audiofile_df.to_csv(partitions[audiofile], sep='\t', index=False)
+                else:
+                    audiofile_df.to_csv(partitions[audiofile], sep='\t', index=False, header=False, mode='a')
+
+    # Integers and floats are concatenated as floats
+    dtypes = {col: 'float64' for col, col_kinds in kinds.items() if 'f' in col_kinds and col_kinds <= {'i', 'u', 'f'}}
+
+    return partitions, dtypes
+
+
+def get_number_clips(list_audio_files, clip_duration, probes=None):
     """
     This function reads the durations of all audio files in the given list and compares them to the desired clip duration.
 
     Inputs:
         - list_audio_files: A list of audio files with their full paths.
         - clip_duration: The chosen export clip duration.
+        - probes: Dictionary of audio file header probes, see audiofiles.probe_audiofiles. If None, the headers
+        are probed.
 
     Outputs:
         - number_clip: The number of export clips per audio file.
     """
 
+    # Read the durations from the audio file headers
+    if probes is None:
+        probes = audiofiles.probe_audiofiles(list_audio_files)
+
     # Get the duration of each file and calculate the associated number of non-overlapping clips
     file_duration = []
     number_clip = []
     for file in list_audio_files:
-        fdur = librosa.get_duration(path=file)
+        fdur = probes[file]['Duration (s)']
         number_clip.append(int(np.floor(fdur / clip_duration)))
         file_duration.append(fdur)
 
@@ -421,75 +699,196 @@ def update_labels(selection_table_df, labels_dict, label_key):
     return selection_table_df
 
 
+def compact_selection_table(selection_table_df, label_key=None):
+    """
+    Get a compact copy of a selection table: the repeated strings (paths, views and labels) are categoricals, the
+    integer fields are downcast and the float fields are saved as float32 when the float32 values are exactly the
+    same. The outputs of the benchmark functions on the compact selection table are the same as on the original
+    selection table.
+
+    Inputs:
+        - selection_table_df: DataFrame containing the selection table.
+        - label_key: Name of the field for the label column. If provided, only the fields needed for the export and
+        the label column are kept, otherwise all of the fields are kept.
+
+    Outputs:
+        - compact_df: The compact selection table.
+    """
+    # Keep the fields needed for the export
+    if label_key is not None:
+        wanted_fields = ['Selection', 'Channel', 'Begin Time (s)', 'End Time (s)', 'Low Freq (Hz)', 'High Freq (Hz)',
+                         'File Offset (s)', 'Begin Path', label_key]
+        compact_df = selection_table_df[[col for col in selection_table_df.columns if col in wanted_fields]].copy()
+    else:
+        compact_df = selection_table_df.copy()
+
+    for col in compact_df.columns:
+        # Repeated strings (paths, views and labels) are saved once
+        if compact_df[col].dtype == object and compact_df[col].nunique() <= len(compact_df) / 2:
+            compact_df[col] = compact_df[col].astype('category')
+
+        # Integers are saved with the smallest integer type
+        elif pd.api.types.is_integer_dtype(compact_df[col]):
+            compact_df[col] = pd.to_numeric(compact_df[col], downcast='integer')
+
+        # Floats are saved as float32 only if no value changes
+        elif compact_df[col].dtype == np.float64:
+            col_float32 = compact_df[col].to_numpy(dtype=np.float32)
+            if np.array_equal(col_float32.astype(np.float64), compact_df[col].to_numpy(), equal_nan=True):
+                compact_df[col] = col_float32
+
+    return compact_df
+
+
+def selection_table_memory_report(selection_table_df, compact_df):
+    """
+    Prints the memory use of a selection table and of its compact copy, see compact_selection_table.
+
+    Inputs:
+        - selection_table_df: DataFrame containing the selection table.
+        - compact_df: The compact selection table.
+
+    Outputs:
+        - report_df: DataFrame with the memory use (MB) of each field in both selection tables.
+    """
+    report_df = pd.DataFrame({
+        'Default (MB)': selection_table_df.memory_usage(index=False, deep=True) * 10 ** (-6),
+        'Compact (MB)': compact_df.memory_usage(index=False, deep=True) * 10 ** (-6)
+    })
+    report_df['Compact dtype'] = compact_df.dtypes
+
+    default_size = report_df['Default (MB)'].sum()
+    compact_size = report_df['Compact (MB)'].sum()
+    print(report_df.round(3))
+    print(f" > Selection table memory ... {default_size:.1f} MB, compact ... {compact_size:.1f} MB "
+          f"({100 * compact_size / default_size:.0f}%)")
+
+    return report_df
+
+
 # -----------------------
 # Write outputs functions
 
 def save_audioclip(audiofile, export_settings, export_filename, start_clip, bit_depth, channel):
-    # Test if the export audio file already exists otherwise, create it
-    if not os.path.exists(os.path.join(export_settings['Export folders']['Audio export folder'], export_filename + '.flac')):
+    """
+    Exports a clip of a channel of an audio file as a single clip export of the audio file, see
+    engine.export_audiofile. The clip is read by seeking to its first frame, in blocks if a memory budget is given
+    (export_settings['Max memory (MB)']), and the samples are identical to librosa.load without its fallback to
+    audioread.
 
-        # Load and resample the the audio
-        x_clip, fs = librosa.load(audiofile, offset=start_clip,
-                                  duration=export_settings['Digital sampling']['Audio duration (s)'],
-                                  sr=export_settings['Digital sampling']['fs (Hz)'], mono=False, res_type='soxr_vhq')
-        # Test if x is multi-channel
-        nb_ch = x_clip.ndim
-        # Keep the wanted channel
-        if nb_ch > 1:
-            x_clip = x_clip[channel, :]
+    Inputs:
+        - audiofile: Path to the source audio file ('Begin Path').
+        - export_settings: Dictionary containing export settings.
+        - export_filename: Export file name of the clip, without extension.
+        - start_clip: Start time of the export clip (s).
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - channel: Channel number (0-based).
 
-        # Save clip
-        sf.write(os.path.join(export_settings['Export folders']['Audio export folder'], export_filename + '.flac'),
-                 x_clip, fs, bit_depth)
+    Outputs:
+        - Saved FLAC clip in export_settings['Export folders']['Audio export folder'], an existing clip is not
+        overwritten.
+    """
+    engine.export_audiofile(audiofile, [(start_clip, channel, export_filename)], export_settings, bit_depth)
 
 
 def write_selection_table(filename, entry, export_label='Tag'):
     """
-    This function creates a selection table, appends entries, and saves it.
+    This function creates a selection table, appends an entry, and saves it, see write_selection_table_batch.
 
     Inputs:
         - filename: Selected file name with full path and an extension.
-        - entry: Line to write in the selection table.
+        - entry: Line to write in the selection table, see get_plan_entries.
         - export_label: Name of the label column in the selection table (str). Default is 'Tag'.
 
     Outputs:
         - Saved selection table.
     """
+    write_selection_table_batch(filename, [entry], export_label=export_label)
 
-    header = ['Selection', 'View', 'Channel', 'Begin Time (s)', 'End Time (s)', 'Low Freq (Hz)', 'High Freq (Hz)',
-              'Begin File', 'Original Begin Time (s)', export_label]
+
+def write_selection_table_batch(filename, entries, export_label='Tag'):
+    """
+    This function creates a selection table, appends a batch of entries, and saves it. The entries are numbered
+    after the ones already in the selection table, and the file is only read and written once.
+
+    Inputs:
+        - filename: Selected file name with full path and an extension.
+        - entries: List of lines to write in the selection table, see get_plan_entries.
+        - export_label: Name of the label column in the selection table (str). Default is 'Tag'.
+
+    Outputs:
+        - Saved selection table.
+    """
 
     # If the filename doesn't exist yet, add the Header
-    if not os.path.exists(filename):
-        with open(filename, 'w') as f:
-            f.write('\t'.join(header) + '\n')
-            f.close()
-
-    # Get the number of entries in the selection table
-    # If no entries yet, count = 0
-    with open(filename, 'r') as f:
-        for count, line in enumerate(f):
-            pass
-    entry[0] = count + 1
-
-    # If some of the entries are not strings
-    for ind in range(len(entry)):
-        if not isinstance(entry[ind], str):
-            entry[ind] = str(entry[ind])
-
-    # Append the variables to the table
+    # Otherwise, get the number of lines to continue the selection numbering
+    count = None
+    if os.path.exists(filename):
+        with open(filename, 'r') as f:
+            for count, line in enumerate(f):
+                pass
+
+    # Append the variables to the table, an empty batch does not change an existing table
+    lines = get_selection_table_lines(entries, export_label=export_label, count=count)
+    if not lines:
+        return
     with open(filename, 'a') as f:
-        f.write('\t'.join(entry) + '\n')
-        f.close()
+        f.write('\n'.join(lines) + '\n')
+
+
+def get_selection_table_lines(entries, export_label='Tag', count=None):
+    """
+    Get the lines of a selection table with a batch of entries, see write_selection_table_batch.
+
+    Inputs:
+        - entries: List of lines to write in the selection table, see get_plan_entries.
+        - export_label: Name of the label column in the selection table (str). Default is 'Tag'.
+        - count: Number of entries already in the selection table, None (default) for a new selection table,
+        which starts with the header.
+
+    Outputs:
+        - lines: List of the selection table lines, without line breaks.
+    """
+
+    header = ['Selection', 'View', 'Channel', 'Begin Time (s)', 'End Time (s)', 'Low Freq (Hz)', 'High Freq (Hz)',
+              'Begin File', 'Original Begin Time (s)', export_label]
+
+    lines = []
+    if count is None:
+        lines.append('\t'.join(header))
+        count = 0
+
+    # Number the entries and convert them to strings
+    lines += ['\t'.join([str(count + ind + 1)] + [str(value) for value in entry[1:]])
+              for ind, entry in enumerate(entries)]
+
+    return lines
 
 
 def write_annotation_csv(filename, entry, export_label='Tag'):
     """
-    This function creates a recap annotation CSV, appends entries, and saves it in the format of https://doi.org/10.5281/zenodo.7079380.
+    This function creates a recap annotation CSV, appends an entry, and saves it in the format of
+    https://doi.org/10.5281/zenodo.7079380, see write_annotation_csv_batch.
+
+    Inputs:
+        - filename: Selected file name with full path and an extension.
+        - entry: Line to write in the selection table, see get_plan_entries.
+        - export_label: Name of the label column in the selection table (str). Default is 'Tag'.
+
+    Outputs:
+        - One annotation table for the entire project.
+    """
+    write_annotation_csv_batch(filename, [entry], export_label=export_label)
+
+
+def write_annotation_csv_batch(filename, entries, export_label='Tag'):
+    """
+    This function creates a recap annotation CSV, appends a batch of entries, and saves it in the format of
+    https://doi.org/10.5281/zenodo.7079380. The file is only opened once.
 
     Inputs:
         - filename: Selected file name with full path and an extension.
-        - entry: Line to write in the selection table.
+        - entries: List of lines to write in the selection table, see get_plan_entries.
         - export_label: Name of the label column in the selection table (str). Default is 'Tag'.
 
     Outputs:
@@ -499,26 +898,28 @@ def write_annotation_csv(filename, entry, export_label='Tag'):
     header = ['Filename', 'Start Time (s)', 'End Time (s)', 'Low Freq (Hz)', 'High Freq (Hz)', export_label]
 
     # If the filename doesn't exist yet, add the Header
+    lines = []
     if not os.path.exists(filename):
-        with open(filename, 'w') as f:
-            f.write('\t'.join(header) + '\n')
-            f.close()
+        lines.append('\t'.join(header))
 
-    # Entry need to remove some of the entries to fit our header
-    # [0 = 'Selection', 1= 'View', 2= 'Channel', 3= 'Begin Time (s)', 4= 'End Time (s)', 
+    # Keep the entries of our header
+    # [0 = 'Selection', 1= 'View', 2= 'Channel', 3= 'Begin Time (s)', 4= 'End Time (s)',
     # 5= 'Low Freq (Hz)', 6= 'High Freq (Hz)', 7= 'Begin File', 8= 'Original Begin Time (s)', 9= 'Tag']
-    entry = [entry[7], "{:.2f}".format(float(entry[3])), "{:.2f}".format(float(entry[4])),
-             entry[5], entry[6], entry[9]]
+    lines += ['\t'.join([str(entry[7]), "{:.2f}".format(float(entry[3])), "{:.2f}".format(float(entry[4])),
+                         str(entry[5]), str(entry[6]), str(entry[9])])
+              for entry in entries]
 
-    # Append the variables to the table
+    # Append the variables to the table, an empty batch does not change an existing table
+    if not lines:
+        return
     with open(filename, 'a') as f:
-        f.write('\t'.join(entry) + '\n')
-        f.close()
+        f.write('\n'.join(lines) + '\n')
 
 
 def map_audio_selection(filename, audio_filename, selection_filename):
     """
-    This function creates a recap CSV matching audio file names and selection table names, appends entries, and saves it.
+    This function creates a recap CSV matching audio file names and selection table names, appends an entry, and
+    saves it, see map_audio_selection_batch.
 
     Inputs:
         - filename: Selected file name with full path and an extension.
@@ -528,16 +929,161 @@ def map_audio_selection(filename, audio_filename, selection_filename):
     Outputs:
         - One mapping CSV table for the entire project.
     """
+    map_audio_selection_batch(filename, [audio_filename], [selection_filename])
 
-    # If the filename doesn't exist yet, add the Header
-    if not os.path.exists(filename):
-        with open(filename, 'w') as f:
-            f.close()
 
-    # Append the association to the table
+def map_audio_selection_batch(filename, audio_filenames, selection_filenames):
+    """
+    This function creates a recap CSV matching audio file names and selection table names, appends a batch of
+    entries, and saves it. The file is only opened once.
+
+    Inputs:
+        - filename: Selected file name with full path and an extension.
+        - audio_filenames: List of audio file names with full path and an extension.
+        - selection_filenames: List of the corresponding annotation file names with full path and an extension.
+
+    Outputs:
+        - One mapping CSV table for the entire project.
+    """
+
+    # Append the associations to the table, the file is created if it doesn't exist yet
     with open(filename, 'a') as f:
-        f.write('\t'.join([audio_filename, selection_filename]) + '\n')
-        f.close()
+        f.write(''.join([audio_filename + '\t' + selection_filename + '\n'
+                         for audio_filename, selection_filename in zip(audio_filenames, selection_filenames)]))
+
+
+def remove_annotation_csvs(export_settings):
+    """
+    Removes the global annotation CSV and the audio/selection table association CSV of a previous export. The tar
+    shard and clip store exports replace their outputs, these CSVs are then written again instead of being appended
+    to.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+    """
+    for key in ['Annotation CSV file', 'Audio-Seltab Map CSV file']:
+        filename = export_settings['Export folders'][key]
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def get_export_filename(export_settings, audiofile, fs_original_print, channel, start_clip):
+    """
+    Get the export audio file name (without extension) in the format
+    <Project>_<Deployment>_<OriginalFileName>_<OriginalSamplingFrequency>_<OriginalChannel>_<ClipStart>s
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+        - audiofile: Path to the original audio file ('Begin Path').
+        - fs_original_print: Original sampling frequency as returned by get_print_fs.
+        - channel: Channel number (0-based).
+        - start_clip: Start time of the export clip (s).
+
+    Outputs:
+        - export_filename: The export file name.
+    """
+    export_filename = (export_settings['Project ID'] + '_' +
+                       export_settings['Deployment ID'] + '_' +
+                       os.path.splitext(os.path.basename(audiofile))[0] + '_' +
+                       str(fs_original_print) + '_' + 'ch' + "{:02d}".format(channel + 1) + '_' +
+                       "{:04d}".format(int(np.floor(start_clip))) + 's')
+    return export_filename
+
+
+def export_annotations(export_settings, selection, export_filename):
+    """
+    Write the annotation outputs of a selection: the selection table of the clip, the global annotation CSV and
+    the audio/selection table association CSV, see export_plan_annotations for a batch of planned selections.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+        - selection: Line to write in the selection table of the clip, see get_plan_entries, times are relative to
+        the export clip.
+        - export_filename: Export file name (without extension), see get_export_filename.
+    """
+    # Write in the selection table (.txt)
+    write_selection_table(os.path.join(export_settings['Export folders']['Annotation export folder'], export_filename + '.txt'),
+                          selection, export_label=export_settings['Selections']['Export label'])
+
+    # Write in the golbal csv file (.csv)
+    write_annotation_csv(export_settings['Export folders']['Annotation CSV file'],
+                         selection, export_label=export_settings['Selections']['Export label'])
+
+    # Write in the file association (.csv)
+    map_audio_selection(export_settings['Export folders']['Audio-Seltab Map CSV file'],
+                        os.path.join(export_settings['Export folders']['Audio export folder'], export_filename + '.flac'),
+                        os.path.join(export_settings['Export folders']['Annotation export folder'], export_filename + '.txt'))
+
+
+def get_plan_entries(plan_df):
+    """
+    Get the selection table entries of a batch of planned selections (see plan_benchmark_exports), with the format
+    ['Selection', 'View', 'Channel', 'Begin Time (s)', 'End Time (s)', 'Low Freq (Hz)', 'High Freq (Hz)',
+    'Begin File', 'Original Begin Time (s)', 'Tag'], the selection number is a placeholder.
+
+    Inputs:
+        - plan_df: Export plan DataFrame of the selections, without ignored selections.
+
+    Outputs:
+        - entries: List of the selection table entries, in the plan_df order.
+        - clip_entries: Dictionary with the export file names as keys and the list of their selection table entries
+        as values, in the plan_df order.
+    """
+    entries = [[0, 'Spectrogram', 1, begin_time, end_time, low_freq, high_freq, export_filename + '.flac',
+                file_offset, label]
+               for begin_time, end_time, low_freq, high_freq, export_filename, file_offset, label in zip(
+                   plan_df['Begin Time (s)'].tolist(), plan_df['End Time (s)'].tolist(),
+                   plan_df['Low Freq (Hz)'].tolist(), plan_df['High Freq (Hz)'].tolist(),
+                   plan_df['Export filename'].tolist(), plan_df['File Offset (s)'].tolist(),
+                   plan_df['Label'].tolist())]
+
+    # Group the entries by clip
+    clip_entries = {}
+    for export_filename, entry in zip(plan_df['Export filename'].tolist(), entries):
+        clip_entries.setdefault(export_filename, []).append(entry)
+
+    return entries, clip_entries
+
+
+def export_plan_annotations(export_settings, plan_df):
+    """
+    Write the annotation outputs of a batch of planned selections (see plan_benchmark_exports): the selection table
+    of each clip, the global annotation CSV and the audio/selection table association CSV. The entries are built in
+    memory and each file is written once.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+        - plan_df: Export plan DataFrame of the selections to write, without ignored selections.
+
+    Outputs:
+        - clip_entries: Dictionary with the export file names as keys and the list of their selection table entries
+        as values.
+    """
+    audio_export_folder = export_settings['Export folders']['Audio export folder']
+    annotation_export_folder = export_settings['Export folders']['Annotation export folder']
+    export_label = export_settings['Selections']['Export label']
+
+    # Create the selection table entries, grouped by clip in the selection table order
+    export_filenames = plan_df['Export filename'].tolist()
+    entries, clip_entries = get_plan_entries(plan_df)
+
+    # Write in the selection tables (.txt)
+    for export_filename, clip_entry_list in clip_entries.items():
+        write_selection_table_batch(os.path.join(annotation_export_folder, export_filename + '.txt'),
+                                    clip_entry_list, export_label=export_label)
+
+    # Write in the golbal csv file (.csv)
+    write_annotation_csv_batch(export_settings['Export folders']['Annotation CSV file'], entries,
+                               export_label=export_label)
+
+    # Write in the file association (.csv)
+    map_audio_selection_batch(export_settings['Export folders']['Audio-Seltab Map CSV file'],
+                              [os.path.join(audio_export_folder, export_filename + '.flac')
+                               for export_filename in export_filenames],
+                              [os.path.join(annotation_export_folder, export_filename + '.txt')
+                               for export_filename in export_filenames])
+
+    return clip_entries
 
 
 def exports(export_settings, selection_table_af_df, save_sel_dict):
@@ -548,35 +1094,25 @@ def exports(export_settings, selection_table_af_df, save_sel_dict):
         - export_settings: Dictionary containing export settings.
         - selection_table_af_df: Selection table imported as a Panda DataFrame.
         - save_sel_dict: Dictionary containing information about the clip to be saved with the following keys:
-         'Selection #', 'fs_original_print', 'Channel', 'Start export clip', 'Bit depth', 'Label key', 'Begin Time (s)', 
+         'Selection #', 'fs_original_print', 'Channel', 'Start export clip', 'Bit depth', 'Label key', 'Begin Time (s)',
          'End Time (s)'
-          This variable is created in benchmark_creator
-
-    This function creates all exports based on the provided export settings, selection table DataFrame, and save selection 
-    dictionary. It generates filenames for exported audio files, exports audio clips, writes entries in the selection table 
-    file, writes annotations in a global CSV file, and creates a file association CSV.
 
-    Note: This function assumes the presence of several helper functions such as 'save_audioclip', 'write_selection_table',
-    'write_annotation_csv', and 'map_audio_selection'.
+    This function exports a single selection: the audio clip (save_audioclip) and its annotations
+    (export_annotations). benchmark_creator exports all of the selections of an audio file at once instead, see
+    plan_benchmark_exports.
     """
     # Get the export audio file name in the format
     # <Project>_<OriginalFileName>_<OriginalSamplingFrequency>_<OriginalChannel>.flac
-    export_filename = (export_settings['Project ID'] + '_' +
-                       export_settings['Deployment ID'] + '_' +
-                       os.path.splitext(
-                           os.path.basename(selection_table_af_df['Begin Path'].iloc[save_sel_dict['Selection #']]))[
-                           0] + '_' +
-                       str(save_sel_dict['fs_original_print']) + '_' + 'ch' + "{:02d}".format(
-                save_sel_dict['Channel'] + 1) + '_' +
-                       "{:04d}".format(int(np.floor(save_sel_dict['Start export clip']))) + 's')
+    audiofile = selection_table_af_df['Begin Path'].iloc[save_sel_dict['Selection #']]
+    export_filename = get_export_filename(export_settings, audiofile, save_sel_dict['fs_original_print'],
+                                          save_sel_dict['Channel'], save_sel_dict['Start export clip'])
 
     # Export audio
-    audiofile = selection_table_af_df['Begin Path'].iloc[save_sel_dict['Selection #']]
     save_audioclip(audiofile, export_settings, export_filename, save_sel_dict['Start export clip'],
                    save_sel_dict['Bit depth'], save_sel_dict['Channel'])
 
-    # Create/fill the selection table for this clip with the format 
-    # ['Selection', 'View', 'Channel', 'Begin Time (s)', 'End Time (s)', 'Low Freq (Hz)', 
+    # Create/fill the selection table for this clip with the format
+    # ['Selection', 'View', 'Channel', 'Begin Time (s)', 'End Time (s)', 'Low Freq (Hz)',
     # 'High Freq (Hz)', 'Begin File', 'Original Begin Time (s)', 'Tag']
     selection = [0,  # Placeholder, changes when adding the entry to the file writing the file
                  'Spectrogram',  # All selections are on the Spectrogram
@@ -589,37 +1125,233 @@ def exports(export_settings, selection_table_af_df, save_sel_dict):
                  selection_table_af_df['File Offset (s)'].iloc[save_sel_dict['Selection #']],
                  selection_table_af_df[save_sel_dict['Label key']].iloc[save_sel_dict['Selection #']]]
 
-    # Write in the selection table (.txt)
-    write_selection_table(os.path.join(export_settings['Export folders']['Annotation export folder'], export_filename + '.txt'),
-                          selection, export_label=export_settings['Selections']['Export label'])
-
-    # Write in the golbal csv file (.csv)
-    write_annotation_csv(export_settings['Export folders']['Annotation CSV file'],
-                         selection, export_label=export_settings['Selections']['Export label'])
-
-    # Write in the file association (.csv)
-    map_audio_selection(export_settings['Export folders']['Audio-Seltab Map CSV file'],
-                        os.path.join(export_settings['Export folders']['Audio export folder'], export_filename + '.flac'),
-                        os.path.join(export_settings['Export folders']['Annotation export folder'], export_filename + '.txt'))
+    # Write the annotations
+    export_annotations(export_settings, selection, export_filename)
 
 
 # -------------------
 # Benchmark functions
 
-def benchmark_size_estimator(selection_table_df, export_settings, label_key):
+def plan_benchmark_exports(selection_table_df, export_settings, label_key, probes):
+    """
+    Plans the benchmark exports: assigns every selection of the selection table to its export clip in a single
+    vectorized pass.
+
+    Inputs:
+        - selection_table_df: DataFrame containing the selection table.
+        - export_settings: Dictionary containing export settings.
+        - label_key: Name of the field for the label column.
+        - probes: Dictionary of audio file header probes, see audiofiles.probe_audiofiles.
+
+    Outputs:
+        - plan_df: DataFrame with one row per selection, ordered by audio file (in order of appearance in the
+        selection table), channel and selection, with the fields:
+            'Selection #': Position of the selection in selection_table_df,
+            'Begin Path', 'Channel': Original audio file and channel (1-based, 0 if the channel is missing or is
+            not an integer),
+            'Start export clip': Timing of the beginning of the export clip (s),
+            'Begin Time (s)', 'End Time (s)': Timing of the selection in the export clip (s),
+            'File Begin Time (s)', 'File End Time (s)': Timing of the selection in the original audio file (s),
+            'Low Freq (Hz)', 'High Freq (Hz)', 'File Offset (s)', 'Label': Copied from the selection table,
+            'Export filename': Export clip file name (without extension), see get_export_filename, None if the
+            selection is ignored,
+            'Status': 'kept' (in a single export clip), 'split' (at the junction between two export clips, the
+            part selected by 'Split export selections' is kept) or 'ignored',
+            'Reason': Why the selection is kept, split or ignored.
+
+    The selection timing rules are the ones described in the README: selections at the junction between two
+    export clips are ignored, unless 'Split export selections' is True and the part before (or else after) the
+    junction lasts at least the minimum duration.
+    """
+    duration = export_settings['Digital sampling']['Audio duration (s)']
+    split_selections = export_settings['Selections']['Split export selections'][0] is True
+    min_duration = export_settings['Selections']['Split export selections'][1] if split_selections else 0
+
+    # Audio file and channel of each selection
+    file_codes, unique_audiofiles = pd.factorize(selection_table_df['Begin Path'])
+    unique_audiofiles = np.asarray(unique_audiofiles, dtype=object)
+    nb_ch = np.array([probes[audiofile]['Channels'] for audiofile in unique_audiofiles], dtype=np.int64)
+
+    # Missing and non-integer channels are not in the audio file, they are planned as channel 0
+    channel = pd.to_numeric(selection_table_df['Channel'], errors='coerce').to_numpy(dtype=np.float64)
+    integer_channel = (channel == np.floor(channel)) & (np.abs(channel) <= np.iinfo(np.int32).max)
+    channel = np.where(integer_channel, channel, 0).astype(np.int64)
+
+    # Order the selections by audio file, channel and selection, as they are exported
+    order = np.lexsort((channel, file_codes))
+    file_codes = file_codes[order]
+    channel = channel[order]
+    in_file = (channel >= 1) & (channel <= nb_ch[file_codes])
+
+    # Get begin and end time of the selections
+    begin_time = selection_table_df['File Offset (s)'].to_numpy(dtype=np.float64)[order]
+    end_time = (begin_time + selection_table_df['End Time (s)'].to_numpy(dtype=np.float64)[order]
+                - selection_table_df['Begin Time (s)'].to_numpy(dtype=np.float64)[order])
+
+    # Check which clip chuncks the selections are associated with
+    sel_in_clip_begintime = np.floor(begin_time / duration)
+    sel_in_clip_endtime = np.floor(end_time / duration)
+
+    # Selections in a single clip chunck are always kept
+    single = in_file & (sel_in_clip_begintime == sel_in_clip_endtime)
+
+    # Selections at the limit between two export clips are kept if the duration before (or else after) the
+    # split is sufficient
+    junction = in_file & ~single
+    split_before = junction & split_selections & \
+        (np.abs(sel_in_clip_endtime * duration - begin_time) >= min_duration)
+    split_after = junction & split_selections & ~split_before & \
+        (np.abs(end_time - sel_in_clip_endtime * duration) >= min_duration)
+    ignored = ~(single | split_before | split_after)
+
+    # Get the timing of the export clips and of the selections in the export clips (s)
+    start_clip = np.where(split_after, sel_in_clip_endtime * duration, sel_in_clip_begintime * duration)
+    clip_begin_time = np.where(split_after, start_clip, begin_time) - start_clip
+    clip_end_time = np.where(split_before, start_clip + duration, end_time) - start_clip
+    start_clip[ignored] = np.nan
+    clip_begin_time[ignored] = np.nan
+    clip_end_time[ignored] = np.nan
+
+    # Get the export file names of the exported selections, once per unique export clip, with the
+    # get_export_filename format
+    exported = np.flatnonzero(~ignored)
+    max_channel = channel[exported].max(initial=0)
+    clip_number = np.floor(start_clip[exported]).astype(np.int64)
+    clip_keys = (file_codes[exported] * (max_channel + 1) + channel[exported]) * \
+        (clip_number.max(initial=0) - clip_number.min(initial=0) + 1) + clip_number - clip_number.min(initial=0)
+    inverse, unique_keys = pd.factorize(clip_keys)
+    ind_unique = np.empty(len(unique_keys), dtype=np.int64)
+    ind_unique[inverse[::-1]] = exported[::-1]
+
+    # File name part up to the channel number, e.g. '<Project>_<Deployment>_<OriginalFileName>_2kHz_ch'
+    file_prefix = np.array([get_export_filename(export_settings, audiofile, get_print_fs(probes[audiofile]['fs (Hz)']),
+                                                0, 0)[:-len('01_0000s')] for audiofile in unique_audiofiles],
+                           dtype=object)
+    channel_suffix = np.array(["{:02d}".format(ch) + '_' for ch in range(max_channel + 1)], dtype=object)
+    clip_values, clip_inverse = np.unique(np.floor(start_clip[ind_unique]).astype(np.int64), return_inverse=True)
+    clip_suffix = np.array(["{:04d}".format(clip) + 's' for clip in clip_values.tolist()], dtype=object)
+    export_filename = np.full(len(order), None, dtype=object)
+    export_filename[exported] = (file_prefix[file_codes[ind_unique]] + channel_suffix[channel[ind_unique]]
+                                 + clip_suffix[clip_inverse])[inverse]
+
+    # Status and reason
+    status = pd.Categorical.from_codes(
+        np.select([single, split_before | split_after], [0, 1], default=2), ['kept', 'split', 'ignored'])
+    reason = pd.Categorical.from_codes(
+        np.select([single, split_before, split_after, ~in_file, junction & split_selections],
+                  [0, 1, 2, 3, 4], default=5),
+        ['In a single export clip',
+         'Split, the part before the junction between two export clips is kept',
+         'Split, the part after the junction between two export clips is kept',
+         'Channel not in the audio file',
+         'Split, both parts are shorter than the minimum duration',
+         'At the junction between two export clips'])
+
+    plan_df = pd.DataFrame({
+        'Selection #': order,
+        'Begin Path': pd.Categorical.from_codes(file_codes, unique_audiofiles),
+        'Channel': channel,
+        'Start export clip': start_clip,
+        'Begin Time (s)': clip_begin_time,
+        'End Time (s)': clip_end_time,
+        'File Begin Time (s)': begin_time,
+        'File End Time (s)': end_time,
+        'Low Freq (Hz)': selection_table_df['Low Freq (Hz)'].to_numpy()[order],
+        'High Freq (Hz)': selection_table_df['High Freq (Hz)'].to_numpy()[order],
+        'File Offset (s)': selection_table_df['File Offset (s)'].to_numpy()[order],
+        'Label': selection_table_df[label_key].to_numpy()[order],
+        'Export filename': export_filename,
+        'Status': status,
+        'Reason': reason
+    }, copy=False)  # The arrays are new, they are not copied and stacked again
+    return plan_df
+
+
+def measure_flac_compression(plan_df, export_settings, audio_file_size_byte, sample_clips, sample_time=None,
+                             workers=1, seed=0):
+    """
+    Measures the FLAC compression factor of the export clips by encoding a random sample of the planned clips.
+
+    Inputs:
+        - plan_df: Export plan DataFrame, without ignored selections, see plan_benchmark_exports.
+        - export_settings: Dictionary containing export settings.
+        - audio_file_size_byte: Size of an uncompressed export clip (bytes).
+        - sample_clips: Maximum number of clips to encode.
+        - sample_time: Time budget (s) to encode the clips, see engine.measure_clip_sizes.
+        - workers: Number of threads used to encode the clips.
+        - seed: Seed of the random clip sampling.
+
+    Outputs:
+        - flac_compression: Mean FLAC compression factor of the encoded clips, None if no clip was encoded.
+        - flac_compression_ci: 95% confidence interval [low, high] of the mean FLAC compression factor (Student t
+        distribution), None if less than two clips were encoded.
+        - sampled_clips: Number of encoded clips.
+    """
+    # Draw the clips at random
+    clips_df = plan_df.drop_duplicates(subset='Export filename')
+    rng = np.random.default_rng(seed)
+    sample_index = rng.choice(len(clips_df), size=min(sample_clips, len(clips_df)), replace=False)
+    clips_df = clips_df.iloc[np.sort(sample_index)]
+    clips = list(zip(clips_df['Begin Path'].tolist(), clips_df['Start export clip'].tolist(),
+                     (clips_df['Channel'] - 1).tolist()))
+
+    # Encode the clips
+    sizes = engine.measure_clip_sizes(clips, export_settings,
+                                      get_bitdepth(export_settings['Digital sampling']['Bit depth']),
+                                      workers=workers, max_time=sample_time)
+    if not sizes:
+        return None, None, 0
+
+    ratios = np.array(sizes) / audio_file_size_byte
+    flac_compression = float(np.mean(ratios))
+    if len(ratios) < 2:
+        return flac_compression, None, 1
+
+    half_width = stats.t.ppf(0.975, len(ratios) - 1) * np.std(ratios, ddof=1) / np.sqrt(len(ratios))
+    return flac_compression, [flac_compression - half_width, flac_compression + half_width], len(ratios)
+
+
+def benchmark_size_estimator(selection_table_df, export_settings, label_key, sample_clips=0, sample_time=None,
+                             workers=1, seed=0):
     """
     Estimates the benchmark size based on the provided selection table and export settings.
 
     Inputs:
         - selection_table_df: DataFrame containing the selection table.
         - export_settings: Dictionary containing export settings.
+        - label_key: Name of the field for the label column.
+        - sample_clips: Number of export clips, drawn at random, that are encoded to measure the FLAC compression
+        factor. Default is 0, a FLAC compression factor of 50% is assumed.
+        - sample_time: Time budget (s) to encode the sampled clips. If None (default), all of the sampled clips are
+        encoded.
+        - workers: Number of threads used to encode the sampled clips.
+        - seed: Seed of the random clip sampling.
 
     Returns:
-        - Estimated benchmark size.
+        - estimate: Dictionary with the estimated benchmark size:
+            'Clips': Number of export clips,
+            'Clips per label': Dictionary with the labels as keys and the number of export clips with at least one
+            selection of that label as values,
+            'Selections': Dictionary with the number of 'kept', 'split' and 'ignored' selections,
+            'Clip size (bytes)': Size of an uncompressed export clip,
+            'FLAC compression': FLAC compression factor,
+            'FLAC compression CI': 95% confidence interval of the measured FLAC compression factor, None if less than
+            two clips were measured,
+            'Sampled clips': Number of clips encoded to measure the FLAC compression factor,
+            'Estimated size (bytes)': Estimated benchmark dataset size,
+            'Estimated size CI (bytes)': 95% confidence interval of the estimated benchmark dataset size, or None.
 
     This function estimates the benchmark size based on the provided selection table and export settings. It performs the following steps:
 
-    Note: This function relies on helper functions such as 'get_number_clips' and 'check_bitdepth' for certain calculations.
+    1) Reads the audio file headers and checks the audio duration and bit depth.
+    2) Plans the exports with 'plan_benchmark_exports', so the export clips, including the clips of the split
+    selections, are the ones 'benchmark_creator' exports. No audio is decoded.
+    3) Calculates the size of the export clips. If sample_clips > 0, a random sample of the export clips is encoded
+    with 'engine.measure_clip_sizes' to measure the FLAC compression factor at the export sampling frequency and bit
+    depth.
+
+    Note: This function relies on helper functions such as 'audiofiles.probe_audiofiles', 'get_number_clips',
+    'check_bitdepth', 'plan_benchmark_exports' and 'measure_flac_compression' for certain calculations.
     """
 
     # 1) Run tests on the selection table
@@ -627,65 +1359,21 @@ def benchmark_size_estimator(selection_table_df, export_settings, label_key):
     # List unique audio files in the selection table
     unique_audiofiles = selection_table_df['Begin Path'].unique()
 
+    # Read the audio file headers
+    probes = audiofiles.probe_audiofiles(unique_audiofiles, audiofiles.get_probe_index_file(export_settings))
+
     # Test if the selected export_settings['Audio duration (s)'] can fit in individual audio files
-    clip_number = get_number_clips(unique_audiofiles, export_settings['Digital sampling']['Audio duration (s)'])
+    clip_number = get_number_clips(unique_audiofiles, export_settings['Digital sampling']['Audio duration (s)'],
+                                   probes=probes)
 
     # Test if the bit depth is ok
     check_bitdepth(export_settings['Digital sampling']['Bit depth'])
 
-    # 2) Get the number of audio files that will be created
-    export_filename_list = []
-    count_benchmark_clips = 0
-
-    # Go through each audio file
-    for ind_af in range(len(unique_audiofiles)):
-        # Load a second of the file to get the metadata
-        x, fs_original = librosa.load(unique_audiofiles[ind_af], offset=0.0, duration=1, sr=None, mono=False)
-
-        # Test if x is multi-channel
-        nb_ch = x.ndim
-
-        # Go through each channel 
-        for ch in range(nb_ch):
-            # From the selection table, get the subset of selections that correspond to this specific audio file and channel
-            selection_table_af_df = selection_table_df[(selection_table_df['Begin Path'] == unique_audiofiles[ind_af])
-                                                       & (selection_table_df['Channel'] == ch + 1)]
-
-            # If the selection table dataframe is not empty
-            if not selection_table_af_df.empty:
-                # For each selection
-                for sel in range(len(selection_table_af_df)):
-                    # Get begin and end time of the selection
-                    begin_time = selection_table_af_df['File Offset (s)'].iloc[sel]
-                    end_time = (begin_time + selection_table_af_df['End Time (s)'].iloc[sel]
-                                - selection_table_af_df['Begin Time (s)'].iloc[sel])
-
-                    # Check which clip chuncks this selection is associated with
-                    sel_in_clip_begintime = \
-                        np.floor(begin_time / export_settings['Digital sampling']['Audio duration (s)'])
-                    sel_in_clip_endtime = \
-                        np.floor(end_time / export_settings['Digital sampling']['Audio duration (s)'])
-
-                    # If both begin and end time are in a single clip chunck
-                    if sel_in_clip_begintime == sel_in_clip_endtime:
-
-                        # Get the timing of the export clip (s)
-                        start_clip = sel_in_clip_begintime * export_settings['Digital sampling']['Audio duration (s)']
-                        end_clip = start_clip + export_settings['Digital sampling']['Audio duration (s)']
-
-                        # Get the export audio file name in the format
-                        # <Project>_<OriginalFileName>_<OriginalSamplingFrequency>_<OriginalChannel>.flac
-                        export_filename = (export_settings['Project ID'] + '_' +
-                                           export_settings['Deployment ID'] + '_' +
-                                           os.path.splitext(
-                                               os.path.basename(selection_table_af_df['Begin Path'].iloc[sel]))[0]
-                                           + '_' + 'ch' + "{:02d}".format(ch + 1) + '_' +
-                                           "{:04d}".format(int(np.floor(start_clip))) + 's')
-
-                        # Test if the export audio file already exists otherwise, create it
-                        if export_filename not in export_filename_list:
-                            export_filename_list.append(export_filename)
-                            count_benchmark_clips += 1
+    # 2) Get the export clips, from the selections that are kept or split as in benchmark_creator
+    plan_df = plan_benchmark_exports(selection_table_df, export_settings, label_key, probes)
+    clips_df = plan_df.loc[plan_df['Status'] != 'ignored', ['Export filename', 'Label']]
+    count_benchmark_clips = clips_df['Export filename'].nunique()
+    count_label_clips = clips_df.drop_duplicates()['Label'].value_counts(dropna=False, sort=False)
 
     # 3) Calculate the size
     bd = int(export_settings['Digital sampling']['Bit depth'])
@@ -695,10 +1383,29 @@ def benchmark_size_estimator(selection_table_df, export_settings, label_key):
         'Audio duration (s)'] * 1 / 8  # nb channels/ nb bits per bytes (8)
     dataset_size_byte = audio_file_size_byte * count_benchmark_clips
 
+    # Measure the FLAC compression factor on a sample of the export clips
+    flac_compression_ci = None
+    sampled_clips = 0
+    if sample_clips > 0:
+        flac_compression_sample, flac_compression_ci, sampled_clips = measure_flac_compression(
+            plan_df[plan_df['Status'] != 'ignored'], export_settings, audio_file_size_byte, sample_clips,
+            sample_time=sample_time, workers=workers, seed=seed)
+        if sampled_clips > 0:
+            flac_compression = flac_compression_sample
+
     # 4) Display 
-    print(
-        f"File size are estimated with a flac compression factor of {int(flac_compression * 100)}% which may vary "
-        f"depending on the file.")
+    if sampled_clips > 0:
+        print(f"File size are estimated with a measured flac compression factor of {int(flac_compression * 100)}% "
+              f"({sampled_clips} clips encoded).")
+        if flac_compression_ci is not None:
+            print(f"95% confidence interval of the flac compression factor ... {flac_compression_ci[0] * 100:.1f}-"
+                  f"{flac_compression_ci[1] * 100:.1f}%")
+    else:
+        if sample_clips > 0:
+            print('No clip could be encoded within the sampling time budget.')
+        print(
+            f"File size are estimated with a flac compression factor of {int(flac_compression * 100)}% which may vary "
+            f"depending on the file.")
     print(f"Estimated file size ... {int(np.round(audio_file_size_byte * 10 ** (-6) * flac_compression))} MB")
 
     if np.round(dataset_size_byte * 10 ** (-6) * flac_compression) > 999:
@@ -708,34 +1415,310 @@ def benchmark_size_estimator(selection_table_df, export_settings, label_key):
         print(
             f" > Estimated Benchmark dataset size ... {int(np.round(dataset_size_byte * 10 ** (-6) * flac_compression))} MB")
 
+    if flac_compression_ci is not None:
+        size_ci = [dataset_size_byte * flac_compression_ci[0], dataset_size_byte * flac_compression_ci[1]]
+        if np.round(size_ci[1] * 10 ** (-6)) > 999:
+            print(f" > 95% confidence interval ... {size_ci[0] * 10 ** (-9):.1f}-{size_ci[1] * 10 ** (-9):.1f} GB")
+        else:
+            print(f" > 95% confidence interval ... {size_ci[0] * 10 ** (-6):.1f}-{size_ci[1] * 10 ** (-6):.1f} MB")
+    else:
+        size_ci = None
+
+    return {
+        'Clips': int(count_benchmark_clips),
+        'Clips per label': {label: int(count) for label, count in count_label_clips.items()},
+        'Selections': {status: int(count) for status, count in plan_df['Status'].value_counts(sort=False).items()},
+        'Clip size (bytes)': audio_file_size_byte,
+        'FLAC compression': flac_compression,
+        'FLAC compression CI': flac_compression_ci,
+        'Sampled clips': sampled_clips,
+        'Estimated size (bytes)': dataset_size_byte * flac_compression,
+        'Estimated size CI (bytes)': size_ci
+    }
+
+
+def get_export_jobs(plan_df):
+    """
+    Indexes the export plan by source audio file once: the plan is sorted by audio file and each audio file is a
+    slice of the sorted plan, instead of masking the whole plan for each audio file.
+
+    Inputs:
+        - plan_df: Export plan DataFrame, without ignored selections, see plan_benchmark_exports.
+
+    Outputs:
+        - export_jobs: List of (audiofile, clips) tuples to export, see engine.export_audiofile, in the plan_df order.
+        - file_plans: List of the export plan DataFrame of each audio file, in the same order.
+    """
+    # Sort the plan by audio file, in the order of appearance, and get the slice of each audio file
+    file_codes, unique_audiofiles = pd.factorize(plan_df['Begin Path'])
+    order = np.argsort(file_codes, kind='stable')
+    sorted_plan_df = plan_df.iloc[order]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(file_codes[order])) + 1, [len(order)]))
+
+    clips = list(zip(sorted_plan_df['Start export clip'].tolist(), (sorted_plan_df['Channel'] - 1).tolist(),
+                     sorted_plan_df['Export filename'].tolist()))
+
+    export_jobs = []
+    file_plans = []
+    for audiofile, start, end in zip(unique_audiofiles, bounds[:-1].tolist(), bounds[1:].tolist()):
+        export_jobs.append((audiofile, clips[start:end]))
+        file_plans.append(sorted_plan_df.iloc[start:end])
 
-def benchmark_creator(selection_table_df, export_settings, label_key):
+    return export_jobs, file_plans
+
+
+def print_ignored_selections(selection_table_df, plan_df):
+    """
+    Prints the selections that are ignored because they are at the junction between two export clips.
+
+    Inputs:
+        - selection_table_df: DataFrame containing the selection table.
+        - plan_df: Export plan DataFrame of the selection table, see plan_benchmark_exports.
+    """
+    ignored_df = plan_df[plan_df['Reason'] == 'At the junction between two export clips']
+    for sel, audiofile, ch, begin_time, end_time in zip(
+            ignored_df['Selection #'], ignored_df['Begin Path'], ignored_df['Channel'],
+            ignored_df['File Begin Time (s)'], ignored_df['File End Time (s)']):
+        printselnb = selection_table_df['Selection'].iloc[sel]
+        head, tail = os.path.split(audiofile)
+        print(f'Ignored annotation...  Selection # {printselnb}, File {tail}, Channel {ch}, {begin_time}-{end_time} s')
+
+
+def export_planned_clips(plan_df, export_settings, bit_depth, journal_file, workers=1, progress=True):
+    """
+    Exports the audio clips and annotations of an export plan, and records each completed audio file in the
+    export journal.
+
+    Inputs:
+        - plan_df: Export plan DataFrame, without ignored selections, see plan_benchmark_exports.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - journal_file: Path to the export journal (.jsonl), already started.
+        - workers: Number of worker processes used to export the audio clips.
+        - progress: If True (default), shows a progress bar over the audio files.
+    """
+    # List of (audiofile, clips) to export and the matching annotations, the plan is grouped once by audio file
+    export_jobs, annotation_jobs = get_export_jobs(plan_df)
+
+    # Export all of the audio clips, each file in a single pass
+    for ind_job in tqdm(engine.export_audiofiles(export_jobs, export_settings, bit_depth, workers=workers),
+                        total=len(export_jobs), disable=not progress):
+        file_plan_df = annotation_jobs[ind_job]
+        audiofile = export_jobs[ind_job][0]
+
+        # Write the annotations of this file at once, in the selection table order
+        manifest.journal_file_begin(
+            journal_file, audiofile,
+            [os.path.join(export_settings['Export folders']['Annotation export folder'], export_filename + '.txt')
+             for export_filename in file_plan_df['Export filename'].unique()])
+        clip_entries = export_plan_annotations(export_settings, file_plan_df)
+
+        # The audio file is complete
+        manifest.journal_file_commit(journal_file, audiofile, export_settings, file_plan_df, clip_entries)
+
+
+def export_planned_shards(plan_df, export_settings, bit_depth, shard_writer, workers=1, progress=True):
+    """
+    Exports the audio clips and selection tables of an export plan in tar shards (see shards.ShardWriter) instead
+    of one file per clip, and writes the global annotation CSV. The clips are encoded in memory by the export
+    engine and written once, in their shard. The shard index replaces the audio/selection table association CSV.
+    The global annotation CSV is appended to, it is removed when the shard export starts (see
+    remove_annotation_csvs), as the shards are.
+
+    Inputs:
+        - plan_df: Export plan DataFrame, without ignored selections, see plan_benchmark_exports.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - shard_writer: Open shards.ShardWriter, see shards.open_shard_writer.
+        - workers: Number of worker processes used to encode the audio clips.
+        - progress: If True (default), shows a progress bar over the audio files.
+    """
+    export_label = export_settings['Selections']['Export label']
+
+    # List of (audiofile, clips) to export and the matching annotations, the plan is grouped once by audio file
+    export_jobs, annotation_jobs = get_export_jobs(plan_df)
+
+    # Encode all of the audio clips, each file in a single pass, and write them with their selection table
+    for ind_job, encoded_clips in tqdm(engine.encode_audiofiles(export_jobs, export_settings, bit_depth,
+                                                                workers=workers),
+                                       total=len(export_jobs), disable=not progress):
+        entries, clip_entries = get_plan_entries(annotation_jobs[ind_job])
+        for export_filename, flac_data in encoded_clips:
+            selection_table_lines = get_selection_table_lines(clip_entries[export_filename],
+                                                              export_label=export_label)
+            shard_writer.add_clip(export_filename, flac_data, '\n'.join(selection_table_lines) + '\n')
+
+        # Write in the golbal csv file (.csv)
+        write_annotation_csv_batch(export_settings['Export folders']['Annotation CSV file'], entries,
+                                   export_label=export_label)
+
+
+def export_planned_store(plan_df, export_settings, bit_depth, workers=1, progress=True):
+    """
+    Exports the audio clips of an export plan in a clip store (see clipstore) instead of one file per clip: a
+    single .npy array of shape (clips, samples) with the integer samples of the FLAC clips, in the data type of
+    the bit depth (see engine.quantize_clip), and a parquet index of its rows. The store is preallocated and the
+    export workers write their rows in place. The global annotation CSV is written as usual.
+
+    Inputs:
+        - plan_df: Export plan DataFrame, without ignored selections, see plan_benchmark_exports.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - workers: Number of worker processes used to write the audio clips.
+        - progress: If True (default), shows a progress bar over the audio files.
+
+    Outputs:
+        - Clip store (clips.npy) and its index (clip_index.parquet) in the clip store folder. Each row of the index
+        gives the 'Row' of the clip in the store, its 'Export filename', 'Begin Path', 'Channel', 'Start export
+        clip', 'Labels' and 'Samples', the rows of the clips that end after their audio file are padded with 0.
+    """
+    export_label = export_settings['Selections']['Export label']
+    clip_store_folder = clipstore.get_clip_store_folder(export_settings)
+    store_file = os.path.join(clip_store_folder, clipstore.CLIP_STORE_FILENAME)
+
+    # List of (audiofile, clips) to export and the matching annotations, the plan is grouped once by audio file
+    export_jobs, annotation_jobs = get_export_jobs(plan_df)
+
+    # Number the clips in the export order
+    job_rows = []
+    rows = {}
+    for _, clips in export_jobs:
+        job_rows.append({})
+        for _, _, export_filename in clips:
+            if export_filename not in rows:
+                rows[export_filename] = job_rows[-1][export_filename] = len(rows)
+
+    # Preallocate the clip store
+    n_samples = int(np.round(export_settings['Digital sampling']['Audio duration (s)'] *
+                             export_settings['Digital sampling']['fs (Hz)']))
+    clipstore.create_clip_store(store_file, len(rows), n_samples, engine.STORE_DTYPES[bit_depth])
+
+    # Write all of the audio clips in place, each file in a single pass
+    samples = {}
+    for ind_job, job_samples in tqdm(engine.store_audiofiles(export_jobs, export_settings, bit_depth, store_file,
+                                                             job_rows, workers=workers),
+                                     total=len(export_jobs), disable=not progress):
+        samples.update(job_samples)
+
+        # Write in the golbal csv file (.csv)
+        entries, _ = get_plan_entries(annotation_jobs[ind_job])
+        write_annotation_csv_batch(export_settings['Export folders']['Annotation CSV file'], entries,
+                                   export_label=export_label)
+
+    # Write the index of the clip store
+    clip_index_df = clipstore.get_clip_index(plan_df, rows)
+    clip_index_df['Samples'] = clip_index_df['Export filename'].map(samples)
+    clipstore.write_clip_index(os.path.join(clip_store_folder, clipstore.CLIP_INDEX_FILENAME), clip_index_df)
+
+
+def update_exports(export_settings, plan_df, bit_depth, journal_file, workers=1):
+    """
+    Updates the exports of the last export to a new export plan, using the clips recorded in the export journal:
+    only the audio of the new clips is exported, the clips that are no longer in the plan are deleted and only the
+    selection tables whose annotations changed are written again. The global annotation CSV and the audio/selection
+    table association CSV are written again, and the journal is replaced by the journal of the updated export.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+        - plan_df: Export plan DataFrame, without ignored selections, see plan_benchmark_exports.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - journal_file: Path to the export journal (.jsonl).
+        - workers: Number of worker processes used to export the audio clips.
+
+    Outputs:
+        - Updated benchmark, identical to a benchmark created from scratch with the new export plan: the samples of
+        a clip do not depend on the other clips of the export (see engine.export_audiofile), so the kept clips are
+        the clips a new export would write.
+    """
+    audio_export_folder = export_settings['Export folders']['Audio export folder']
+    annotation_export_folder = export_settings['Export folders']['Annotation export folder']
+    export_label = export_settings['Selections']['Export label']
+
+    # Compare the export plan with the last export
+    entries, clip_entries = get_plan_entries(plan_df)
+    new_clips, changed_clips, orphan_clips, csv_sizes = manifest.diff_journal(journal_file, export_settings,
+                                                                               clip_entries)
+    print(f'Updating export: {len(new_clips)} new clip(s), {len(orphan_clips)} removed clip(s), '
+          f'{len(changed_clips)} selection table(s) to write')
+
+    # Delete the clips that are no longer in the export plan
+    for export_filename in orphan_clips:
+        for filename in [os.path.join(audio_export_folder, export_filename + '.flac'),
+                         os.path.join(annotation_export_folder, export_filename + '.txt')]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    # Export the audio of the new clips, each file in a single pass
+    export_jobs, _ = get_export_jobs(plan_df[plan_df['Export filename'].isin(new_clips)])
+    for _ in tqdm(engine.export_audiofiles(export_jobs, export_settings, bit_depth, workers=workers),
+                  total=len(export_jobs)):
+        pass
+
+    # Write the changed selection tables (.txt), each table is replaced at once
+    for export_filename in changed_clips:
+        filename = os.path.join(annotation_export_folder, export_filename + '.txt')
+        if os.path.exists(filename + '.part'):
+            os.remove(filename + '.part')
+        write_selection_table_batch(filename + '.part', clip_entries[export_filename], export_label=export_label)
+        os.replace(filename + '.part', filename)
+
+    # Write the global csv files again, after the content written before the last export
+    annotation_csv_file = export_settings['Export folders']['Annotation CSV file']
+    manifest.copy_file_head(annotation_csv_file, csv_sizes['Annotation CSV size'], annotation_csv_file + '.part')
+    write_annotation_csv_batch(annotation_csv_file + '.part', entries, export_label=export_label)
+    os.replace(annotation_csv_file + '.part', annotation_csv_file)
+
+    export_filenames = plan_df['Export filename'].tolist()
+    map_csv_file = export_settings['Export folders']['Audio-Seltab Map CSV file']
+    manifest.copy_file_head(map_csv_file, csv_sizes['Audio-Seltab Map CSV size'], map_csv_file + '.part')
+    map_audio_selection_batch(map_csv_file + '.part',
+                              [os.path.join(audio_export_folder, export_filename + '.flac')
+                               for export_filename in export_filenames],
+                              [os.path.join(annotation_export_folder, export_filename + '.txt')
+                               for export_filename in export_filenames])
+    os.replace(map_csv_file + '.part', map_csv_file)
+
+    # The journal now describes the updated export
+    manifest.write_journal(journal_file, export_settings, plan_df, clip_entries, csv_sizes)
+
+
+def benchmark_creator(selection_table_df, export_settings, label_key, workers=1, resume=False, incremental=False):
     """
     Creates a benchmark based on the provided selection table and export settings.
 
     Inputs:
         - selection_table_df: DataFrame containing the selection table.
         - export_settings: Dictionary containing export settings.
+        - label_key: Name of the field for the label column.
+        - workers: Number of worker processes used to export the audio clips, the source audio files are spread
+        over the workers. Default is 1 (serial export). Outputs are identical to a serial run.
+        - resume: If True, resumes an interrupted export from its journal (export_journal.jsonl, next to the audio
+        and annotations folders): the source audio files that were completely exported are skipped and the
+        annotations written after the last completed file are removed before being written again. Default is
+        False, a new journal is started.
+        - incremental: If True, updates the last export of the same project to the selection table, see
+        update_exports: only the new clips are exported, the clips that are no longer selected are deleted and only
+        the selection tables that changed are written again. Without a previous export journal, the benchmark is
+        created as with incremental=False. Default is False.
 
     Outputs:
-        - Created benchmark.
+        - Created benchmark. With export_settings['Export format'] = 'tar', the clips and their selection tables
+        are written in tar shards with an index (see export_planned_shards), and with 'npy', the clips are written
+        in a single array with an index (see export_planned_store). Such exports cannot be resumed or updated.
 
     This function creates a benchmark based on the provided selection table and export settings. It performs the following steps:
 
-    1) Lists unique audio files in the selection table.
+    1) Lists unique audio files in the selection table and reads their headers.
     2) Retrieves the bit depth from the export settings.
-    3) Iterates through each audio file and channel:
-        a) Loads a second of the audio file to retrieve metadata.
-        b) Determines the original sampling frequency for file naming.
-        c) Checks if the audio data is multi-channel.
-        d) Filters selections corresponding to the current audio file and channel.
-        e) For each selection:
-            i) Identifies the clip chunk associated with the selection.
-            ii) Creates a dictionary with variables for the export.
-            iii) Calls the 'exports' function to export audio and annotation files.
-            iv) Handles split annotations if required by export settings.
-
-    Note: This function relies on helper functions such as 'get_bitdepth', 'get_print_fs', and 'exports' for certain calculations and export operations.
+    3) Plans the exports with 'plan_benchmark_exports': identifies the clip chunk associated with each selection
+    and handles split annotations if required by export settings. Ignored selections are printed.
+    4) Exports all of the audio clips of each file in a single pass with 'engine.export_audiofiles', serially or
+    with a pool of worker processes.
+    5) Writes the annotation files of each audio file at once with 'export_plan_annotations', in the audio file and
+    selection table order, and records the completed audio file in the export journal.
+
+    Note: This function relies on helper functions such as 'get_bitdepth', 'plan_benchmark_exports',
+    'export_plan_annotations' and 'engine.export_audiofiles' for certain calculations and export operations.
     """
 
     # List unique audio files in the selection table
@@ -744,127 +1727,155 @@ def benchmark_creator(selection_table_df, export_settings, label_key):
     # Get the bit depth
     bit_depth = get_bitdepth(export_settings['Digital sampling']['Bit depth'])
 
-    # Get total number of clips
-    tot_clips = 0
-
-    # Go through each audio file
-    for ind_af in tqdm(range(len(unique_audiofiles))):
-
-        # Load a second of the file to get the metadata
-        x, fs_original = librosa.load(unique_audiofiles[ind_af], offset=0.0, duration=1, sr=None, mono=False)
-
-        # Take note of the sampling frequency for the file naming system
-        fs_original_print = get_print_fs(fs_original)
-
-        # Test if x is multi-channel
-        nb_ch = x.ndim
-
-        # Go through each channel 
-        for ch in range(nb_ch):
-            # From the selection table, get the subset of selections that correspond to this specific audio file and channel
-            selection_table_af_df = selection_table_df[(selection_table_df['Begin Path'] == unique_audiofiles[ind_af])
-                                                       & (selection_table_df['Channel'] == ch + 1)]
-
-            # If the selection table dataframe is not empty
-            if not selection_table_af_df.empty:
-                # For each selection
-                for sel in range(len(selection_table_af_df)):
-                    # Get begin and end time of the selection
-                    begin_time = selection_table_af_df['File Offset (s)'].iloc[sel]
-                    end_time = (begin_time + selection_table_af_df['End Time (s)'].iloc[sel]
-                                - selection_table_af_df['Begin Time (s)'].iloc[sel])
-
-                    # Check which clip chuncks this selection is associated with
-                    sel_in_clip_begintime = \
-                        np.floor(begin_time / export_settings['Digital sampling']['Audio duration (s)'])
-                    sel_in_clip_endtime = \
-                        np.floor(end_time / export_settings['Digital sampling']['Audio duration (s)'])
-
-                    # If both begin and end time are in a single clip chunck, that is default and will always be done
-                    if sel_in_clip_begintime == sel_in_clip_endtime:
-
-                        # Get the timing of the export clip (s)
-                        start_clip = sel_in_clip_begintime * export_settings['Digital sampling']['Audio duration (s)']
-                        end_clip = start_clip + export_settings['Digital sampling']['Audio duration (s)']
-
-                        # Create the dictionnary that will have all of the variables for the exports
-                        save_sel_dict = {
-                            'Selection #': sel,  # Selection number in the table
-                            'fs_original_print': fs_original_print,  # Original sampling frequency
-                            'Channel': ch,  # Channel
-                            'Start export clip': start_clip,  # Timing of thebeginint of the export clip (s)
-                            'Bit depth': bit_depth,  # Bit depth, in correcto format
-                            'Label key': label_key,  # Key to the label column in the selection table
-                            'Begin Time (s)': begin_time,  # Time to start the annotation
-                            'End Time (s)': end_time  # Time to end the annotation
-                        }
-
-                        # Export everything
-                        exports(export_settings, selection_table_af_df, save_sel_dict)
-                        tot_clips += 1
-
-                    # When an annotation is at the limit between two export audio files, 
-                    # If there is sufficient amount on either/both sides, keep it if (export_settings['Split export selections'][0] is True)  
-                    elif export_settings['Selections']['Split export selections'][0] is True:
-                        # Test if the duration before the split is sufficient
-                        if abs(sel_in_clip_endtime * export_settings['Digital sampling']['Audio duration (s)'] - begin_time) >= \
-                                export_settings['Selections']['Split export selections'][1]:
-                            # Get the timing of the export clip (s)
-                            start_clip = sel_in_clip_begintime * export_settings['Digital sampling']['Audio duration (s)']
-                            end_clip = start_clip + export_settings['Digital sampling']['Audio duration (s)']
-
-                            # Update the begin and end time of the split annotation
-                            begin_time = selection_table_af_df['File Offset (s)'].iloc[sel]
-                            end_time = end_clip
-
-                            # Create the dictionnary that will have all of the variables for the exports
-                            save_sel_dict = {
-                                'Selection #': sel,  # Selection number in the table
-                                'fs_original_print': fs_original_print,  # Original sampling frequency
-                                'Channel': ch,  # Channel
-                                'Start export clip': start_clip,  # Timing of thebeginint of the export clip (s)
-                                'Bit depth': bit_depth,  # Bit depth, in correcto format
-                                'Label key': label_key,  # Key to the label column in the selection table
-                                'Begin Time (s)': begin_time,  # Time to start the annotation
-                                'End Time (s)': end_time  # Time to end the annotation
-                            }
-
-                            # Export everything
-                            exports(export_settings, selection_table_af_df, save_sel_dict)
-                            tot_clips += 1
-                        # Test if the duration after the split is sufficient
-                        elif abs(end_time - sel_in_clip_endtime * export_settings['Digital sampling']['Audio duration (s)']) >= \
-                                export_settings['Selections']['Split export selections'][1]:
-                            # Get the timing of the export clip (s)
-                            start_clip = sel_in_clip_endtime * export_settings['Digital sampling']['Audio duration (s)']
-                            end_clip = start_clip + export_settings['Digital sampling']['Audio duration (s)']
-
-                            # Update the begin and end time of the split annotation
-                            begin_time = start_clip
-                            end_time = (selection_table_af_df['File Offset (s)'].iloc[sel] +
-                                        selection_table_af_df['End Time (s)'].iloc[sel]
-                                        - selection_table_af_df['Begin Time (s)'].iloc[sel])
-
-                            # Create the dictionnary that will have all of the variables for the exports
-                            save_sel_dict = {
-                                'Selection #': sel,  # Selection number in the table
-                                'fs_original_print': fs_original_print,  # Original sampling frequency
-                                'Channel': ch,  # Channel
-                                'Start export clip': start_clip,  # Timing of thebeginint of the export clip (s)
-                                'Bit depth': bit_depth,  # Bit depth, in correcto format
-                                'Label key': label_key,  # Key to the label column in the selection table
-                                'Begin Time (s)': begin_time,  # Time to start the annotation
-                                'End Time (s)': end_time  # Time to end the annotation
-                            }
-
-                            # Export everything
-                            exports(export_settings, selection_table_af_df, save_sel_dict)
-                            tot_clips += 1
-                    else:
-                        # If the selection is not comparised in the export clip, then do not save it, and print
-                        printselnb = selection_table_af_df['Selection'].iloc[sel]
-                        head, tail = os.path.split(selection_table_af_df['Begin Path'].iloc[sel])
-                        print(f'Ignored annotation...  Selection # {printselnb}, File {tail}, Channel {ch + 1}, {begin_time}-{end_time} s')
-
-
-    print(f'Total number of clips: {tot_clips}')
\ No newline at end of file
+    # Read the audio file headers
+    probes = audiofiles.probe_audiofiles(unique_audiofiles, audiofiles.get_probe_index_file(export_settings))
+
+    # Plan the exports
+    plan_df = plan_benchmark_exports(selection_table_df, export_settings, label_key, probes)
+
+    # If the selection is not comparised in the export clip, then do not save it, and print
+    print_ignored_selections(selection_table_df, plan_df)
+
+    # Keep the selections to export
+    plan_df = plan_df[plan_df['Status'] != 'ignored']
+
+    # Export the audio clips and annotations in tar shards, or in a clip store
+    export_format = shards.get_export_format(export_settings)
+    if export_format != 'flac':
+        if resume or incremental:
+            raise ValueError(f'Error: A {export_format} export cannot be resumed or updated, please create it again')
+        remove_annotation_csvs(export_settings)
+        if export_format == 'tar':
+            with shards.open_shard_writer(export_settings) as shard_writer:
+                export_planned_shards(plan_df, export_settings, bit_depth, shard_writer, workers=workers)
+        else:
+            export_planned_store(plan_df, export_settings, bit_depth, workers=workers)
+        print(f'Total number of clips: {len(plan_df)}')
+        return
+
+    # Update the last export, the benchmark is created if there is no previous export
+    journal_file = manifest.get_journal_file(export_settings)
+    if incremental:
+        if resume:
+            raise ValueError('Error: An export cannot be resumed and updated at once')
+        if os.path.exists(journal_file):
+            update_exports(export_settings, plan_df, bit_depth, journal_file, workers=workers)
+            print(f'Total number of clips: {len(plan_df)}')
+            return
+        print('No previous export to update, creating the benchmark')
+
+    # Start the export journal, or skip the completed audio files of the interrupted export
+    if resume and os.path.exists(journal_file):
+        committed_audiofiles = manifest.recover_journal(journal_file, export_settings)
+        export_plan_df = plan_df[~plan_df['Begin Path'].isin(committed_audiofiles)]
+    else:
+        manifest.start_journal(journal_file, export_settings)
+        export_plan_df = plan_df
+
+    # Export the audio clips and annotations
+    export_planned_clips(export_plan_df, export_settings, bit_depth, journal_file, workers=workers)
+
+    print(f'Total number of clips: {len(plan_df)}')
+
+
+def benchmark_creator_streaming(selection_table_path, export_settings, label_key, chunksize=100000, workers=1,
+                                resume=False):
+    """
+    Creates a benchmark from selection table(s) that are too large to be loaded in memory. The selection tables are
+    first partitioned by audio file ('Begin Path') with 'partition_selection_tables', in the export folder, then the
+    audio files are planned and exported by batches of 'workers' files. Only the selections of a batch are in
+    memory, so the memory use is proportional to the annotations of the largest audio files.
+
+    The outputs are the same as loading the selection tables with 'load_selection_table' and running
+    'benchmark_creator'.
+
+    Inputs:
+        - selection_table_path: A string representing the path to a selection table file or folder.
+        - export_settings: Dictionary containing export settings.
+        - label_key: Name of the field for the label column.
+        - chunksize: Number of selection table rows read at once when partitioning the selection tables.
+        - workers: Number of worker processes used to export the audio clips, which is also the number of audio
+        files in a batch. Default is 1 (serial export).
+        - resume: If True, resumes an interrupted export from its journal, see benchmark_creator.
+
+    Outputs:
+        - Created benchmark, in tar shards with export_settings['Export format'] = 'tar', see benchmark_creator.
+    """
+    # The clip store is preallocated for all of the clips
+    if shards.get_export_format(export_settings) == 'npy':
+        raise ValueError('Error: A npy export needs all of the clips at once, please use benchmark_creator')
+
+    # Partition the selection tables by audio file, the partitions are removed even if the export is interrupted
+    partition_folder = os.path.join(export_settings['Export folders']['Export folder'],
+                                    SELECTION_TABLE_PARTITION_FOLDER)
+    try:
+        count_clips = export_partitioned_selection_tables(selection_table_path, partition_folder, export_settings,
+                                                          label_key, chunksize, workers, resume)
+    finally:
+        shutil.rmtree(partition_folder, ignore_errors=True)
+
+    print(f'Total number of clips: {count_clips}')
+
+
+def export_partitioned_selection_tables(selection_table_path, partition_folder, export_settings, label_key,
+                                        chunksize=100000, workers=1, resume=False):
+    """
+    Partitions the selection tables by audio file and exports the audio files by batches, see
+    benchmark_creator_streaming.
+
+    Inputs:
+        - selection_table_path: A string representing the path to a selection table file or folder.
+        - partition_folder: Folder where the partitions are saved, see partition_selection_tables.
+        - export_settings, label_key, chunksize, workers, resume: See benchmark_creator_streaming.
+
+    Outputs:
+        - count_clips: Number of exported selections.
+    """
+    partitions, dtypes = partition_selection_tables(selection_table_path, partition_folder, chunksize=chunksize)
+    unique_audiofiles = list(partitions)
+
+    # Get the bit depth
+    bit_depth = get_bitdepth(export_settings['Digital sampling']['Bit depth'])
+
+    # Read the audio file headers
+    probes = audiofiles.probe_audiofiles(unique_audiofiles, audiofiles.get_probe_index_file(export_settings))
+
+    # Start the export journal, or skip the completed audio files of the interrupted export. The tar shard exports
+    # have no journal
+    journal_file = manifest.get_journal_file(export_settings)
+    shard_writer = None
+    if shards.get_export_format(export_settings) == 'tar':
+        if resume:
+            raise ValueError('Error: A tar shard export cannot be resumed, please create it again')
+        shard_writer = shards.open_shard_writer(export_settings)
+        remove_annotation_csvs(export_settings)
+        committed_audiofiles = set()
+    elif resume and os.path.exists(journal_file):
+        committed_audiofiles = manifest.recover_journal(journal_file, export_settings)
+    else:
+        manifest.start_journal(journal_file, export_settings)
+        committed_audiofiles = set()
+
+    # Plan and export the audio files by batches, the shards are closed even if the export is interrupted
+    count_clips = 0
+    with shard_writer if shard_writer is not None else contextlib.nullcontext():
+        for ind_batch in tqdm(range(0, len(unique_audiofiles), workers)):
+            selection_table_df = pd.concat([read_selection_table(partitions[audiofile], dtypes)
+                                            for audiofile in unique_audiofiles[ind_batch:ind_batch + workers]],
+                                           ignore_index=True)
+
+            # Plan the exports of the batch
+            plan_df = plan_benchmark_exports(selection_table_df, export_settings, label_key, probes)
+            print_ignored_selections(selection_table_df, plan_df)
+            plan_df = plan_df[plan_df['Status'] != 'ignored']
+            count_clips += len(plan_df)
+
+            # Export the audio clips and annotations
+            if shard_writer is not None:
+                export_planned_shards(plan_df, export_settings, bit_depth, shard_writer, workers=workers,
+                                      progress=False)
+            else:
+                export_planned_clips(plan_df[~plan_df['Begin Path'].isin(committed_audiofiles)], export_settings,
+                                     bit_depth, journal_file, workers=workers, progress=False)
+
+    return count_clips
@@ -0,0 +1,1260 @@
+# Benchmark Dataset Creator export engine
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import io
+import os
+import time
+import warnings
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from itertools import cycle
+
+import numpy as np
+import librosa
+import soundfile as sf
+import soxr
+from scipy import signal
+
+from BenchmarkDatasetCreator import audiofiles, clipcache
+
+
+# Default number of clip windows waiting between two stages of the export pipeline
+PIPELINE_QUEUE_SIZE = 2
+
+# Number of blocks of audio held at once by the export pipeline with one encoder thread: the blocks waiting in the
+# two queues, the blocks being read, resampled and written, and the resampling stream buffer. Each other encoder
+# thread adds its queue and the block it writes, see get_pipeline_block_copies
+PIPELINE_BLOCK_COPIES = 2 * PIPELINE_QUEUE_SIZE + 4
+
+# Number of source audio files submitted per export worker process ahead of the one whose output is used, see
+# map_audiofiles
+MAP_JOBS_PER_WORKER = 2
+
+# Resampling quality tiers, from the slowest to the fastest, with their soxr quality and librosa res_type
+RESAMPLING_QUALITIES = {
+    'vhq': ('VHQ', 'soxr_vhq'),
+    'hq': ('HQ', 'soxr_hq'),
+    'mq': ('MQ', 'soxr_mq'),
+    'polyphase': (None, 'polyphase')
+}
+DEFAULT_RESAMPLING_QUALITY = 'vhq'
+
+# Largest up or down factor of the 'polyphase' resampling, the files with larger factors (sampling frequencies
+# without a simple ratio) are resampled with DEFAULT_RESAMPLING_QUALITY, see get_file_resampling_quality
+POLYPHASE_MAX_FACTOR = 1000
+
+# Default duration of source audio resampled with each side of a clip (s), see get_resampling_context
+DEFAULT_RESAMPLING_CONTEXT = 0
+
+# Largest amount of audio data (bytes) read and discarded between the clip windows of a sequential pass, the
+# clip windows of files with larger gaps are read by seeking to their first frame
+SEQUENTIAL_READ_MAX_GAP_BYTES = 16 * 2 ** 20
+
+# Number of frames read at once when a sequential pass reads through a gap
+SEQUENTIAL_READ_BLOCK_FRAMES = 2 ** 16
+
+# Bit depth of the integer PCM subtypes, source audio files and FLAC clips
+PCM_SUBTYPE_BITS = {'PCM_S8': 8, 'PCM_U8': 8, 'PCM_16': 16, 'PCM_24': 24, 'PCM_32': 32}
+
+# FLAC compression levels, from the fastest encoding (0) to the smallest clips (8), 5 is the FLAC default
+FLAC_COMPRESSION_LEVELS = list(range(9))
+DEFAULT_FLAC_COMPRESSION_LEVEL = 5
+
+# Data type of the clip store rows, by FLAC subtype, see quantize_clip
+STORE_DTYPES = {'PCM_S8': 'int8', 'PCM_16': 'int16', 'PCM_24': 'int32'}
+
+# libsndfile command setting the compression level of a file open for writing, soundfile 0.12 (the version in
+# requirements.txt) does not expose it and it is sent through the private soundfile interface, see open_flac_clip
+SFC_SET_COMPRESSION_LEVEL = 0x1301
+
+
+# -----------------------
+#  Clip grouping functions
+def group_clips(clips):
+    """
+    Groups the clips to export from a source audio file by export clip start time.
+
+    Inputs:
+        - clips: List of (start_clip, channel, export_filename) tuples, channel is 0-based.
+
+    Outputs:
+        - clip_windows: Dictionary with the clip start times (s) as keys, sorted in ascending order, and the
+        list of unique (channel, export_filename) to export from that time window as values.
+    """
+    clip_windows = {}
+    for start_clip, channel, export_filename in clips:
+        window = clip_windows.setdefault(start_clip, [])
+        if (channel, export_filename) not in window:
+            window.append((channel, export_filename))
+
+    return dict(sorted(clip_windows.items()))
+
+
+# ---------------------
+#  Audio read functions
+def get_read_strategy(sf_desc, file_size, start_clips, duration):
+    """
+    Chooses how the clip windows of an audio file are reached, by seeking to the exact first frame of each
+    window (random access), or by reading the file from the first window to the last one and discarding the
+    audio between the windows (sequential pass).
+
+    Seeking is the fastest on local disks, a sequential pass only reads the file forward, which suits storage
+    where random reads are slow and files that cannot seek. The sequential pass is chosen when the audio data
+    read and discarded between the windows, estimated from the share of the file that is not exported and the
+    file size, is at most SEQUENTIAL_READ_MAX_GAP_BYTES: for files with dense annotations or small files.
+
+    Inputs:
+        - sf_desc: Opened soundfile.SoundFile object.
+        - file_size: Size of the audio file (bytes).
+        - start_clips: List of the clip window start times (s).
+        - duration: Export clip duration (s).
+
+    Outputs:
+        - strategy: 'sequential' or 'random'.
+    """
+    if not sf_desc.seekable():
+        return 'sequential'
+    if sf_desc.frames <= 0:
+        return 'random'
+
+    exported_frames = min(len(start_clips) * int(np.round(sf_desc.samplerate * duration)), sf_desc.frames)
+    gap_bytes = file_size * (1 - exported_frames / sf_desc.frames)
+
+    return 'sequential' if gap_bytes <= SEQUENTIAL_READ_MAX_GAP_BYTES else 'random'
+
+
+def skip_frames(sf_desc, frames):
+    """
+    Moves an opened audio file forward by reading and discarding frames, without seeking.
+
+    Inputs:
+        - sf_desc: Opened soundfile.SoundFile object.
+        - frames: Number of frames to skip.
+    """
+    block = np.empty((min(frames, SEQUENTIAL_READ_BLOCK_FRAMES), sf_desc.channels), dtype='int16')
+    while frames > 0:
+        read_frames = len(sf_desc.read(frames=min(frames, len(block)), dtype='int16', out=block))
+        if read_frames == 0:
+            return
+        frames -= read_frames
+
+
+def read_clip_window(sf_desc, start_clip, duration, dtype='float32', strategy='random', channels=None):
+    """
+    Reads a clip window of all channels from an opened audio file. The frame arithmetic follows
+    librosa.load so that the decoded samples are identical to a per-clip load.
+
+    Inputs:
+        - sf_desc: Opened soundfile.SoundFile or audiofiles.MemmapAudioFile object.
+        - start_clip: Start time of the export clip (s).
+        - duration: Export clip duration (s).
+        - dtype: soundfile read data type, see get_passthrough_dtype for integer PCM.
+        - strategy: 'random' to seek to the first frame of the window, 'sequential' to read forward up to
+        it, see get_read_strategy.
+        - channels: Index of the channels to keep (slice or list, see get_channel_index), all of the channels if
+        None. Memory-mapped files only convert the samples of these channels.
+
+    Outputs:
+        - x_clip: Array of shape (channels, samples), a view of the mapping for memory-mapped files read in their
+        stored format.
+    """
+    start_frame = int(np.round(sf_desc.samplerate * start_clip))
+    frames = int(np.round(sf_desc.samplerate * duration))
+
+    move_to_frame(sf_desc, start_frame, strategy)
+    return read_frames(sf_desc, frames, dtype, channels)
+
+
+def read_clip_blocks(sf_desc, start_clip, duration, block_frames, dtype='float32', strategy='random', channels=None,
+                     context_frames=(0, 0)):
+    """
+    Reads a clip window in consecutive blocks, so that the memory use does not depend on the window duration and
+    number of channels. The frames are the same as the ones of read_clip_window, with the context frames before
+    and after them.
+
+    Inputs:
+        - sf_desc: Opened soundfile.SoundFile or audiofiles.MemmapAudioFile object.
+        - start_clip: Start time of the export clip (s).
+        - duration: Export clip duration (s).
+        - block_frames: Maximum number of frames of a block, see get_block_frames.
+        - dtype, strategy, channels: See read_clip_window.
+        - context_frames: (lead_frames, trail_frames) tuple of the context frames read before and after the clip,
+        see get_context_frames.
+
+    Outputs:
+        - Generator of (x_block, start_frame, last) tuples, x_block is an array of shape (channels, samples),
+        start_frame is the source frame of its first sample and last is True for the last block of the window.
+    """
+    lead_frames, trail_frames = context_frames
+    start_frame = int(np.round(sf_desc.samplerate * start_clip)) - lead_frames
+    frames = int(np.round(sf_desc.samplerate * duration)) + lead_frames + trail_frames
+
+    move_to_frame(sf_desc, start_frame, strategy)
+    offset = 0
+    while True:
+        block_size = min(block_frames, frames - offset)
+        x_block = read_frames(sf_desc, block_size, dtype, channels)
+        # The window ends early at the end of the file
+        last = offset + block_size >= frames or x_block.shape[-1] < block_size
+        yield x_block, start_frame + offset, last
+        if last:
+            return
+        offset += block_size
+
+
+def move_to_frame(sf_desc, start_frame, strategy='random'):
+    """
+    Moves an opened audio file to a frame, see read_clip_window.
+
+    Inputs:
+        - sf_desc: Opened soundfile.SoundFile or audiofiles.MemmapAudioFile object.
+        - start_frame: Frame to move to.
+        - strategy: 'random' or 'sequential', see get_read_strategy.
+    """
+    # Only move when the previous window did not end where this one starts
+    if sf_desc.tell() != start_frame:
+        if strategy == 'sequential' and sf_desc.tell() < start_frame:
+            skip_frames(sf_desc, start_frame - sf_desc.tell())
+        else:
+            sf_desc.seek(start_frame)
+
+
+def read_frames(sf_desc, frames, dtype='float32', channels=None):
+    """
+    Reads frames of the wanted channels from the current position of an opened audio file.
+
+    Inputs:
+        - sf_desc: Opened soundfile.SoundFile or audiofiles.MemmapAudioFile object.
+        - frames: Number of frames to read.
+        - dtype, channels: See read_clip_window.
+
+    Outputs:
+        - x: Array of shape (channels, samples).
+    """
+    if isinstance(sf_desc, audiofiles.MemmapAudioFile):
+        return sf_desc.read(frames=frames, dtype=dtype, always_2d=True, channels=channels).T
+
+    x = sf_desc.read(frames=frames, dtype=dtype, always_2d=True)
+    return x.T if channels is None else x[:, channels].T
+
+
+def get_pipeline_block_copies(encoder_workers=1):
+    """
+    Get the number of blocks of audio held at once by the export pipeline, see PIPELINE_BLOCK_COPIES.
+
+    Inputs:
+        - encoder_workers: Number of encoder threads, export_settings['Encoder workers'].
+
+    Outputs:
+        - block_copies: Number of blocks.
+    """
+    return PIPELINE_BLOCK_COPIES + (max(encoder_workers, 1) - 1) * (PIPELINE_QUEUE_SIZE + 1)
+
+
+def get_decoded_channels(sf_desc, channels):
+    """
+    Get the number of channels decoded to read the wanted channels of an opened audio file: soundfile decodes all
+    of the channels of the file before the wanted ones are kept, memory-mapped files only convert the wanted ones.
+
+    Inputs:
+        - sf_desc: Opened soundfile.SoundFile or audiofiles.MemmapAudioFile object.
+        - channels: List of the channels to keep (0-based).
+
+    Outputs:
+        - n_channels: Number of decoded channels.
+    """
+    if isinstance(sf_desc, audiofiles.MemmapAudioFile):
+        return len(channels)
+    return sf_desc.channels
+
+
+def get_block_frames(max_memory_mb, frames, n_channels, fs_original, fs, quality=DEFAULT_RESAMPLING_QUALITY,
+                     encoder_workers=1):
+    """
+    Get the number of frames of the blocks in which a clip window is read, resampled and encoded, so that the
+    audio held by the export pipeline fits in a memory budget.
+
+    The blocks are a multiple of the resampling period, fs_original / gcd(fs_original, fs) frames, so that the
+    resampled blocks line up with the resampled window. Polyphase resampling is not streamed, its windows are
+    never split.
+
+    Inputs:
+        - max_memory_mb: Memory budget of the audio of the export pipeline (MB), None for whole windows.
+        - frames: Number of frames of the clip window.
+        - n_channels: Number of channels decoded from the window, see get_decoded_channels.
+        - fs_original: Original sampling frequency (Hz).
+        - fs: Export sampling frequency (Hz).
+        - quality: Resampling quality tier, see get_resampling_quality.
+        - encoder_workers: Number of encoder threads, see get_pipeline_block_copies.
+
+    Outputs:
+        - block_frames: Number of frames of the blocks, at least one resampling period, frames if the window is
+        not split.
+    """
+    if max_memory_mb is None or get_file_resampling_quality(quality, fs_original, fs) == 'polyphase':
+        return frames
+
+    # 4 bytes per sample, before and after resampling
+    frame_bytes = get_pipeline_block_copies(encoder_workers) * n_channels * 4 * (1 + max(float(fs) / fs_original, 1))
+    period = int(fs_original) // np.gcd(int(fs_original), int(fs))
+    block_frames = int(max_memory_mb * 2 ** 20 // frame_bytes) // period * period
+
+    return min(max(block_frames, period), max(frames, 1))
+
+
+def get_channel_index(channels):
+    """
+    Get the index selecting channels from a clip window, a slice when the channels are consecutive so that the
+    selection is a view of the window.
+
+    Inputs:
+        - channels: Sorted list of channel numbers (0-based).
+
+    Outputs:
+        - index: Slice or list of channels.
+    """
+    if channels == list(range(channels[0], channels[-1] + 1)):
+        return slice(channels[0], channels[-1] + 1)
+    return channels
+
+
+def get_passthrough_dtype(sf_desc, fs):
+    """
+    Get the integer data type to read the clip windows of an audio file that does not need to be resampled.
+    Integer PCM samples are then written to the FLAC clips without a conversion to float.
+
+    Inputs:
+        - sf_desc: Opened soundfile.SoundFile or audiofiles.MemmapAudioFile object.
+        - fs: Export sampling frequency (Hz).
+
+    Outputs:
+        - dtype: 'int16' or 'int32', None if the audio file needs to be resampled or is not integer PCM.
+    """
+    if sf_desc.samplerate != fs or sf_desc.subtype not in PCM_SUBTYPE_BITS:
+        return None
+    return 'int16' if PCM_SUBTYPE_BITS[sf_desc.subtype] <= 16 else 'int32'
+
+
+def requantize_clip(x_clip, source_bits, bit_depth):
+    """
+    Rounds an integer PCM clip to the bit depth of the FLAC clips. soundfile integers are left-justified, the
+    samples are rounded to the nearest value of the export bit depth (half to even, as the float conversion of
+    soundfile), instead of being truncated when written.
+
+    Inputs:
+        - x_clip: int16 or int32 array, see get_passthrough_dtype.
+        - source_bits: Bit depth of the source audio file, see PCM_SUBTYPE_BITS.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+
+    Outputs:
+        - x_clip: Array of the same data type, with the bits below the export bit depth set to 0.
+    """
+    if source_bits <= PCM_SUBTYPE_BITS[bit_depth]:
+        return x_clip
+
+    step = 1 << (x_clip.dtype.itemsize * 8 - PCM_SUBTYPE_BITS[bit_depth])
+    info = np.iinfo(x_clip.dtype)
+    x_rounded = np.clip(np.round(x_clip / step), info.min // step, info.max // step)
+    return (x_rounded * step).astype(x_clip.dtype)
+
+
+def quantize_clip(x_clip, bit_depth):
+    """
+    Converts a clip to the integer samples of the FLAC clips, as libsndfile encodes them: float samples are
+    scaled by 2 ** (bits - 1), rounded half to even and clipped, left-justified integer samples (see
+    get_passthrough_dtype and requantize_clip) are shifted to the export bit depth.
+
+    Inputs:
+        - x_clip: Float, int16 or int32 array.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+
+    Outputs:
+        - x_clip: Array of the integer samples, in the STORE_DTYPES data type.
+    """
+    bits = PCM_SUBTYPE_BITS[bit_depth]
+    if np.issubdtype(x_clip.dtype, np.integer):
+        # int16 samples of a 16-bit audio file are shifted up for a 24-bit export
+        shift = x_clip.dtype.itemsize * 8 - bits
+        if shift < 0:
+            return x_clip.astype(STORE_DTYPES[bit_depth]) << -shift
+        return (x_clip >> shift).astype(STORE_DTYPES[bit_depth])
+
+    scale = 2 ** (bits - 1)
+    return np.clip(np.round(x_clip * np.float32(scale)), -scale, scale - 1).astype(STORE_DTYPES[bit_depth])
+
+
+# -----------------------
+#  Resampling functions
+def get_resampling_quality(export_settings):
+    """
+    Get the resampling quality tier from the export settings.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings, the tier is read from
+        export_settings['Digital sampling']['Resampling quality'], 'vhq' if missing.
+
+    Outputs:
+        - quality: Resampling quality tier, one of RESAMPLING_QUALITIES:
+            * 'vhq', 'hq', 'mq': soxr very high, high and medium quality,
+            * 'polyphase': scipy polyphase filtering, meant for simple ratios between the sampling frequencies,
+            see get_file_resampling_quality.
+
+    Raises:
+        - ValueError: If the resampling quality tier is unknown.
+    """
+    quality = export_settings['Digital sampling'].get('Resampling quality', DEFAULT_RESAMPLING_QUALITY)
+    if quality not in RESAMPLING_QUALITIES:
+        raise ValueError(f"Unknown resampling quality '{quality}', should be one of {list(RESAMPLING_QUALITIES)}")
+    return quality
+
+
+def get_file_resampling_quality(quality, fs_original, fs):
+    """
+    Get the resampling quality tier of an audio file. The 'polyphase' tier filters with up and down factors of
+    fs / gcd(fs_original, fs) and fs_original / gcd(fs_original, fs), it is only used when both are at most
+    POLYPHASE_MAX_FACTOR, e.g. 147 and 160 from 48 kHz to 44.1 kHz. Otherwise, the file is resampled with
+    DEFAULT_RESAMPLING_QUALITY, with a warning. The other tiers apply to all of the files.
+
+    Inputs:
+        - quality: Resampling quality tier, see get_resampling_quality.
+        - fs_original: Original sampling frequency (Hz).
+        - fs: Export sampling frequency (Hz).
+
+    Outputs:
+        - quality: Resampling quality tier of the audio file.
+    """
+    if quality != 'polyphase' or fs == fs_original:
+        return quality
+
+    gcd = np.gcd(int(fs_original), int(fs))
+    if max(int(fs_original) // gcd, int(fs) // gcd) <= POLYPHASE_MAX_FACTOR:
+        return quality
+
+    warnings.warn(f"The 'polyphase' resampling from {fs_original} Hz to {fs} Hz needs factors larger than "
+                  f"{POLYPHASE_MAX_FACTOR}, the audio is resampled with '{DEFAULT_RESAMPLING_QUALITY}'")
+    return DEFAULT_RESAMPLING_QUALITY
+
+
+def get_resampling_context(export_settings):
+    """
+    Get the resampling context from the export settings: the duration of source audio resampled with each side
+    of a clip, so that the clip edges do not have the edge effects of a resampler started at the clip boundary.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings, the context is read from
+        export_settings['Digital sampling']['Resampling context (s)'], 0 if missing. Without a context, each clip
+        is resampled alone, as librosa.resample does.
+
+    Outputs:
+        - context: Resampling context (s).
+
+    Raises:
+        - ValueError: If the resampling context is negative.
+    """
+    context = export_settings['Digital sampling'].get('Resampling context (s)', DEFAULT_RESAMPLING_CONTEXT)
+    if context < 0:
+        raise ValueError(f"The resampling context should be positive or 0, got {context}")
+    return context
+
+
+def get_context_frames(context, start_clip, fs_original, fs):
+    """
+    Get the number of context frames read before and after a clip window, see get_resampling_context. The
+    context is rounded up to a multiple of the resampling period, fs_original / gcd(fs_original, fs) frames, so
+    that the resampled context lines up with the resampled clip, and is shortened at the beginning of the file.
+
+    Inputs:
+        - context: Resampling context (s).
+        - start_clip: Start time of the export clip (s).
+        - fs_original: Original sampling frequency (Hz).
+        - fs: Export sampling frequency (Hz).
+
+    Outputs:
+        - lead_frames, trail_frames: Number of context frames before and after the clip, 0 if the clip is not
+        resampled.
+    """
+    if fs == fs_original or context == 0:
+        return 0, 0
+
+    period = int(fs_original) // np.gcd(int(fs_original), int(fs))
+    context_frames = int(np.ceil(context * fs_original / period)) * period
+    start_frame = int(np.round(fs_original * start_clip))
+    return min(context_frames, start_frame // period * period), context_frames
+
+
+def resample_clip(x_clip, fs_original, fs, quality=DEFAULT_RESAMPLING_QUALITY):
+    """
+    Resamples all of the channels of a clip window at once. The output length follows librosa.resample so that
+    each channel is identical to a per-channel resampling.
+
+    Inputs:
+        - x_clip: float32 array of shape (channels, samples).
+        - fs_original: Original sampling frequency (Hz).
+        - fs: Export sampling frequency (Hz).
+        - quality: Resampling quality tier, see get_resampling_quality and get_file_resampling_quality.
+
+    Outputs:
+        - x_clip: Resampled float32 array of shape (channels, samples).
+    """
+    if fs == fs_original:
+        return x_clip
+
+    n_samples = int(np.ceil(x_clip.shape[-1] * float(fs) / fs_original))
+
+    quality = get_file_resampling_quality(quality, fs_original, fs)
+    if quality == 'polyphase':
+        # Same up and down factors as librosa's polyphase resampling
+        gcd = np.gcd(int(fs_original), int(fs))
+        x_resampled = signal.resample_poly(x_clip, int(fs) // gcd, int(fs_original) // gcd, axis=-1)
+        x_resampled = x_resampled.astype('float32', copy=False)
+    else:
+        # soxr expects (samples, channels) arrays
+        x_resampled = soxr.resample(np.ascontiguousarray(x_clip.T), fs_original, fs,
+                                    quality=RESAMPLING_QUALITIES[quality][0]).T
+
+    return librosa.util.fix_length(x_resampled, size=n_samples, axis=-1)
+
+
+class ClipStream:
+    """
+    Resampler of a single clip window, which can be pushed in consecutive blocks (see read_clip_blocks). The soxr
+    quality tiers resample the blocks with a stateful soxr stream, the output of a block is complete once the
+    filter has seen the beginning of the next block, the blocks are therefore returned with a delay of one block,
+    or when the stream is flushed. Polyphase windows are never split (see get_block_frames) and are resampled at
+    once. A window pushed whole or in blocks, then flushed, is identical to resample_clip.
+
+    With a resampling context (see get_context_frames), the window starts and ends with context frames around the
+    clip, which are resampled with it and then cut from the output. A stream is only used for one window, so that
+    the samples of a clip never depend on the other clips of the export. Its setup, a fraction of a millisecond,
+    is small next to the resampling of a window.
+    """
+
+    def __init__(self, fs_original, fs, n_channels, quality=DEFAULT_RESAMPLING_QUALITY, lead_frames=0, frames=None):
+        """
+        Inputs:
+            - fs_original: Original sampling frequency (Hz).
+            - fs: Export sampling frequency (Hz).
+            - n_channels: Number of channels of the window.
+            - quality: Resampling quality tier, see get_resampling_quality.
+            - lead_frames: Number of context frames before the clip, a multiple of the resampling period.
+            - frames: Number of frames of the clip, None to keep all of the output after the leading context.
+        """
+        self.fs_original = fs_original
+        self.fs = fs
+        self.quality = quality = get_file_resampling_quality(quality, fs_original, fs)
+        self.ratio = float(fs) / fs_original
+        self.stream = None
+        if quality != 'polyphase':
+            self.stream = soxr.ResampleStream(fs_original, fs, n_channels, dtype='float32',
+                                              quality=RESAMPLING_QUALITIES[quality][0])
+        self.n_channels = n_channels
+        # Output samples of the clip, after the leading context
+        self.clip_start = lead_frames * int(fs) // int(fs_original)
+        self.clip_end = None if frames is None else self.clip_start + int(np.ceil(frames * self.ratio))
+        # Number of frames pushed, output index of the first buffered sample and of the next returned sample
+        self.in_frames = 0
+        self.out_start = 0
+        self.out_returned = 0
+        self.buffer = np.zeros((n_channels, 0), dtype='float32')
+        # (item, first output index, number of output samples) of the blocks waiting for their output
+        self.pending = deque()
+
+    def push(self, x_block, item):
+        """
+        Resamples the next block of the window.
+
+        Inputs:
+            - x_block: float32 array of shape (channels, samples).
+            - item: Object returned with the resampled block.
+
+        Outputs:
+            - List of (item, x_block) tuples of the blocks with a complete output, x_block is the resampled
+            float32 array of shape (channels, samples), without the context samples.
+        """
+        if self.stream is None:
+            return self._trim([(item, resample_clip(x_block, self.fs_original, self.fs, self.quality))])
+
+        self.pending.append((item, int(np.round(self.in_frames * self.ratio)),
+                             int(np.ceil(x_block.shape[-1] * self.ratio))))
+        self.in_frames += x_block.shape[-1]
+
+        # soxr expects (samples, channels) arrays
+        self._append(self.stream.resample_chunk(np.ascontiguousarray(x_block.T)))
+        return self._trim(self._pop_complete())
+
+    def flush(self):
+        """
+        Ends the window, after which no block can be pushed.
+
+        Outputs:
+            - List of (item, x_block) tuples of the blocks waiting for their output, see push.
+        """
+        if self.stream is None:
+            return []
+
+        self._append(self.stream.resample_chunk(np.zeros((0, self.n_channels), dtype='float32'), last=True))
+        return self._trim(self._pop_complete(last=True))
+
+    def _append(self, x_resampled):
+        self.buffer = np.concatenate([self.buffer, x_resampled.T], axis=1)
+
+    def _pop_complete(self, last=False):
+        complete = []
+        while self.pending:
+            item, out_first, n_samples = self.pending[0]
+            first = out_first - self.out_start
+            if not last and first + n_samples > self.buffer.shape[1]:
+                break
+            self.pending.popleft()
+            complete.append((item, librosa.util.fix_length(self.buffer[:, first:first + n_samples],
+                                                           size=n_samples, axis=-1)))
+
+        # Drop the output that is not needed by the next blocks
+        next_first = self.pending[0][1] if self.pending else int(np.round(self.in_frames * self.ratio))
+        drop = min(max(next_first - self.out_start, 0), self.buffer.shape[1])
+        self.buffer = self.buffer[:, drop:]
+        self.out_start += drop
+
+        return complete
+
+    def _trim(self, resampled):
+        # Cut the context samples from the consecutive outputs of the window
+        trimmed = []
+        for item, x_block in resampled:
+            start = self.out_returned
+            self.out_returned += x_block.shape[-1]
+            end = None if self.clip_end is None else max(self.clip_end - start, 0)
+            trimmed.append((item, x_block[:, max(self.clip_start - start, 0):end]))
+        return trimmed
+
+
+# ------------------------
+#  FLAC encoding functions
+def get_flac_compression_level(export_settings):
+    """
+    Get the FLAC compression level from the export settings.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings, the level is read from
+        export_settings['Digital sampling']['FLAC compression level'], 5 if missing.
+
+    Outputs:
+        - compression_level: FLAC compression level, one of FLAC_COMPRESSION_LEVELS, from the fastest encoding (0)
+        to the smallest clips (8). The decoded audio is the same at all levels.
+
+    Raises:
+        - ValueError: If the compression level is not one of FLAC_COMPRESSION_LEVELS.
+    """
+    compression_level = export_settings['Digital sampling'].get('FLAC compression level',
+                                                                DEFAULT_FLAC_COMPRESSION_LEVEL)
+    if compression_level not in FLAC_COMPRESSION_LEVELS:
+        raise ValueError(f"Unknown FLAC compression level '{compression_level}', should be one of "
+                         f"{FLAC_COMPRESSION_LEVELS}")
+    return int(compression_level)
+
+
+def open_flac_clip(file, fs, bit_depth, compression_level=DEFAULT_FLAC_COMPRESSION_LEVEL):
+    """
+    Opens a mono FLAC clip for writing with a compression level. If the level cannot be set, e.g. with another
+    soundfile version than the one in requirements.txt, the clip is encoded at the FLAC default level with a
+    warning. The decoded audio is the same at all levels.
+
+    Inputs:
+        - file: Path or file-like object of the FLAC clip.
+        - fs: Export sampling frequency (Hz).
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - compression_level: FLAC compression level, see get_flac_compression_level.
+
+    Outputs:
+        - sf_clip: soundfile.SoundFile object open for writing.
+    """
+    sf_clip = sf.SoundFile(file, 'w', fs, 1, bit_depth, format='FLAC')
+    if compression_level != DEFAULT_FLAC_COMPRESSION_LEVEL:
+        try:
+            # libsndfile takes the level between 0 and 1, and rounds it to the FLAC levels
+            level = sf._ffi.new('double*', compression_level / 8)
+            level_set = sf._snd.sf_command(sf_clip._file, SFC_SET_COMPRESSION_LEVEL, level,
+                                           sf._ffi.sizeof('double'))
+        except AttributeError:
+            # The private soundfile interface changed
+            level_set = False
+        if not level_set:
+            warnings.warn(f'The FLAC compression level {compression_level} could not be set, the clips are encoded '
+                          f'at the default level {DEFAULT_FLAC_COMPRESSION_LEVEL}')
+    return sf_clip
+
+
+# ------------------------
+#  Pipeline stage functions
+def put_until_stopped(stage_queue, item, stop_event):
+    """
+    Puts an item in a bounded queue, waiting for a free slot unless the pipeline is stopped.
+
+    Inputs:
+        - stage_queue: Bounded queue.Queue between two pipeline stages.
+        - item: Item to put in the queue.
+        - stop_event: threading.Event set when the pipeline is stopped.
+
+    Outputs:
+        - True if the item was put in the queue, False if the pipeline was stopped.
+    """
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def read_stage(audiofile, windows, duration, fs, bit_depth, quality, context, max_memory_mb, encoder_workers,
+               read_queue, stop_event):
+    """
+    Reader stage of the export pipeline: decodes the clip windows in chronological order and prefetches them
+    in read_queue, whole or in blocks if a memory budget is given (see get_block_frames). Ends with None, or with
+    the raised exception.
+
+    Uncompressed WAV and AIFF files are memory-mapped (see audiofiles.MemmapAudioFile) and the windows are views of
+    the mapping until they are resampled or encoded, the other files are decoded with soundfile. The windows are
+    reached by seeking or by a sequential pass, see get_read_strategy. Integer PCM audio files that do not need to
+    be resampled are read as integers, see get_passthrough_dtype.
+
+    Inputs:
+        - audiofile: Path to the source audio file.
+        - windows: List of (start_clip, window) tuples, see group_clips.
+        - duration: Export clip duration (s).
+        - fs: Export sampling frequency (Hz).
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - quality: Resampling quality tier, see get_resampling_quality.
+        - context: Resampling context (s), see get_resampling_context.
+        - max_memory_mb: Memory budget of the audio of the export pipeline (MB), None to read whole windows.
+        - encoder_workers: Number of encoder threads of the export pipeline, see get_block_frames.
+        - read_queue: Bounded queue.Queue to the resampler stage, with (window, channels, x_block, lead_frames,
+        frames, fs_original, first, last) items, lead_frames is the number of context frames before the clip and
+        frames the number of frames of the clip.
+        - stop_event: threading.Event set when the pipeline is stopped.
+    """
+    try:
+        with audiofiles.open_audiofile(audiofile) as sf_desc:
+            dtype = get_passthrough_dtype(sf_desc, fs)
+            if isinstance(sf_desc, audiofiles.MemmapAudioFile):
+                # Seeking in a memory-mapped file is free
+                strategy = 'random'
+            else:
+                strategy = get_read_strategy(sf_desc, os.path.getsize(audiofile),
+                                             [start_clip for start_clip, _ in windows], duration)
+            for start_clip, window in windows:
+                # Decode the clip window once for all channels and keep the wanted channels
+                channels = sorted(set(channel for channel, _ in window))
+                frames = int(np.round(sf_desc.samplerate * duration))
+                context_frames = get_context_frames(context, start_clip, sf_desc.samplerate, fs)
+                block_frames = get_block_frames(max_memory_mb, frames + sum(context_frames),
+                                                get_decoded_channels(sf_desc, channels), sf_desc.samplerate, fs,
+                                                quality, encoder_workers)
+                first = True
+                for x_block, _, last in read_clip_blocks(sf_desc, start_clip, duration, block_frames,
+                                                         dtype or 'float32', strategy, get_channel_index(channels),
+                                                         context_frames):
+                    if dtype is not None:
+                        x_block = requantize_clip(x_block, PCM_SUBTYPE_BITS[sf_desc.subtype], bit_depth)
+
+                    if not put_until_stopped(read_queue, (window, channels, x_block, context_frames[0], frames,
+                                                          sf_desc.samplerate, first, last), stop_event):
+                        return
+                    first = False
+    except Exception as error:
+        put_until_stopped(read_queue, error, stop_event)
+        return
+
+    put_until_stopped(read_queue, None, stop_event)
+
+
+def write_stage(write_queue, errors, compression_level=DEFAULT_FLAC_COMPRESSION_LEVEL, encoded=None, store=None):
+    """
+    Writer stage of the export pipeline: encodes and saves the clips received from write_queue until None.
+    The blocks of a clip are appended to its FLAC file, which gives the same file as a single write.
+    After an error, the remaining items are drained without being written. Several writer stages can run
+    side by side, all of the blocks of a clip must then go to the same writer.
+
+    Each clip is written to a temporary '.part' file which is then renamed, so that an existing FLAC clip is
+    always complete, even after a crash. If encoded is given, the clips are encoded in memory instead, and if
+    store is given, the integer samples of the clips are written in the rows of a clip store array.
+
+    Inputs:
+        - write_queue: Bounded queue.Queue from the resampler stage, with (x_block, fs, bit_depth, [(row,
+        export path)], first, last) items, first and last are True for the first and last block of the clips.
+        - errors: List where the raised exceptions are added.
+        - compression_level: FLAC compression level, see get_flac_compression_level.
+        - encoded: Dictionary where the encoded FLAC clips (bytes) are added by export path, None to save the clips.
+        - store: (array, rows, samples) tuple, with the clip store array (see quantize_clip), a dictionary of the
+        row of each export path, and a dictionary where the number of samples of each clip is added by export
+        path. None to save the clips.
+    """
+    open_clips = {}
+    try:
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            if errors:
+                continue
+
+            x_block, fs, bit_depth, export_paths, first, last = item
+            try:
+                if store is not None:
+                    store_block(store, x_block, bit_depth, export_paths, first, last)
+                    continue
+
+                for row, export_path in export_paths:
+                    if first:
+                        target = export_path + '.part' if encoded is None else io.BytesIO()
+                        open_clips[export_path] = (open_flac_clip(target, fs, bit_depth, compression_level), target)
+                    open_clips[export_path][0].write(x_block[row, :])
+                    if last:
+                        sf_clip, target = open_clips.pop(export_path)
+                        sf_clip.close()
+                        if encoded is None:
+                            os.replace(target, export_path)
+                        else:
+                            encoded[export_path] = target.getvalue()
+            except Exception as error:
+                errors.append(error)
+    finally:
+        # The clips left incomplete by an error keep their '.part' name
+        for sf_clip, _ in open_clips.values():
+            sf_clip.close()
+
+
+def store_block(store, x_block, bit_depth, export_paths, first, last):
+    """
+    Writes a block of the clips of a window in the rows of a clip store array, see write_stage. The samples past
+    the row length are dropped.
+
+    Inputs:
+        - store: (array, rows, samples) tuple, see write_stage.
+        - x_block: Array of shape (channels, samples) of the block.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - export_paths: List of the (row in x_block, export path) of the clips.
+        - first, last: True for the first and last block of the clips.
+    """
+    array, rows, samples = store
+    x_block = quantize_clip(x_block, bit_depth)
+    for row, export_path in export_paths:
+        offset = 0 if first else samples[export_path]
+        x_clip = x_block[row, :array.shape[1] - offset]
+        array[rows[export_path], offset:offset + len(x_clip)] = x_clip
+        samples[export_path] = offset + len(x_clip)
+
+
+# -------------------------
+#  Export engine functions
+def export_audiofile(audiofile, clips, export_settings, bit_depth, queue_size=PIPELINE_QUEUE_SIZE, encoded=None,
+                     store=None):
+    """
+    Exports all of the clips of a source audio file in a single pass. The file is opened once and walked
+    through in chronological order, by seeking to each clip window or by a sequential pass depending on the
+    annotation density and file size (see get_read_strategy). Each clip window is decoded and resampled once for
+    all of the requested channels, which are then saved from slices of the same array.
+
+    The export runs as a pipeline: a reader thread prefetches the next clip windows, the calling thread
+    resamples them and a writer thread encodes and saves the FLAC clips. With export_settings['Encoder workers']
+    above 1, the FLAC encoding is spread over several writer threads, one clip window per thread at a time. The
+    stages are connected by bounded queues of queue_size clip windows, which caps the memory use. With a memory
+    budget, export_settings['Max memory (MB)'], the windows are split in blocks that go through the pipeline one
+    after the other (see get_block_frames), the memory use then depends on the budget only, not on the clip
+    duration and number of channels.
+
+    Each clip window is resampled on its own by a ClipStream, as librosa.resample resamples a clip, or with the
+    source audio around it with a resampling context (see get_resampling_context). The samples of a clip never
+    depend on the other clips of the export, so that resumed, incremental and cached exports give the same clips
+    as a new export.
+
+    Integer PCM audio files at the export sampling frequency are copied without a conversion to float, the
+    samples are only rounded if the export bit depth is lower, see requantize_clip.
+
+    With a clip cache, export_settings['Clip cache folder'] (see clipcache), the clips of the same audio file,
+    channel, start time and audio settings that were exported before are linked from the cache instead of being
+    exported again, and the exported clips are added to the cache.
+
+    Inputs:
+        - audiofile: Path to the source audio file ('Begin Path').
+        - clips: List of (start_clip, channel, export_filename) tuples, channel is 0-based.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - queue_size: Maximum number of clip windows, or blocks, waiting between two pipeline stages.
+        - encoded: Dictionary where the FLAC clips are added by export path (bytes) instead of being saved, see
+        encode_audiofile. None (default) saves the clips.
+        - store: (array, rows, samples) tuple to write the clips in a clip store array instead of saving them, see
+        write_stage and store_audiofile. None (default) saves the clips.
+
+    Outputs:
+        - Saved FLAC clips in export_settings['Export folders']['Audio export folder'], existing clips are
+        not overwritten. If encoded or store is given, all of the clips are exported and no file is saved.
+    """
+    audio_export_folder = export_settings['Export folders']['Audio export folder']
+    duration = export_settings['Digital sampling']['Audio duration (s)']
+    fs = export_settings['Digital sampling']['fs (Hz)']
+    quality = get_resampling_quality(export_settings)
+    context = get_resampling_context(export_settings)
+    max_memory_mb = export_settings.get('Max memory (MB)')
+    compression_level = get_flac_compression_level(export_settings)
+    encoder_workers = export_settings.get('Encoder workers', 1)
+
+    # The clip cache only holds FLAC clip files
+    cache_folder, _ = clipcache.get_clip_cache(export_settings)
+    if encoded is not None or store is not None:
+        cache_folder = None
+    if cache_folder is not None:
+        audiofile_key = clipcache.get_audiofile_key(audiofile)
+        clip_settings = [duration, fs, bit_depth, quality, context, compression_level]
+
+    # Keep the clips that have not been exported yet, or that are not in the clip cache
+    windows = []
+    for start_clip, window in group_clips(clips).items():
+        window = [(channel, export_filename) for channel, export_filename in window
+                  if encoded is not None or store is not None
+                  or not os.path.exists(os.path.join(audio_export_folder, export_filename + '.flac'))]
+        if cache_folder is not None:
+            window = [(channel, export_filename) for channel, export_filename in window
+                      if not clipcache.restore_clip(
+                          cache_folder, clipcache.get_clip_key(audiofile_key, channel, start_clip, clip_settings),
+                          os.path.join(audio_export_folder, export_filename + '.flac'))]
+        if window:
+            windows.append((start_clip, window))
+    if not windows:
+        return
+
+    # Start the reader and writer stages
+    read_queue = queue.Queue(maxsize=queue_size)
+    write_queues = [queue.Queue(maxsize=queue_size) for _ in range(max(encoder_workers, 1))]
+    stop_event = threading.Event()
+    write_errors = []
+    reader = threading.Thread(target=read_stage,
+                              args=(audiofile, windows, duration, fs, bit_depth, quality, context, max_memory_mb,
+                                    encoder_workers, read_queue, stop_event), daemon=True)
+    writers = [threading.Thread(target=write_stage,
+                                args=(write_queue, write_errors, compression_level, encoded, store), daemon=True)
+               for write_queue in write_queues]
+    reader.start()
+    for writer in writers:
+        writer.start()
+
+    # Writer of each clip window being written, the windows are given to the writers in turn
+    next_write_queue = cycle(write_queues)
+    window_write_queues = {}
+
+    def put_clips(resampled):
+        # Save the clips from the channel slices
+        for (window, channels, first, last), x_block in resampled:
+            window_key = window[0][1]
+            if first:
+                window_write_queues[window_key] = next(next_write_queue)
+            write_queue = window_write_queues.pop(window_key) if last else window_write_queues[window_key]
+            write_queue.put((x_block, fs, bit_depth,
+                             [(channels.index(channel), os.path.join(audio_export_folder, export_filename + '.flac'))
+                              for channel, export_filename in window], first, last))
+
+    # Resampler of the current clip window
+    stream = None
+    try:
+        while True:
+            item = read_queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if write_errors:
+                break
+
+            # Resample the wanted channels at once
+            window, channels, x_block, lead_frames, frames, fs_original, first, last = item
+            if fs == fs_original:
+                put_clips([((window, channels, first, last), x_block)])
+                continue
+
+            if first:
+                stream = ClipStream(fs_original, fs, len(channels), quality, lead_frames, frames)
+            put_clips(stream.push(x_block, (window, channels, first, last)))
+            if last:
+                put_clips(stream.flush())
+    finally:
+        # Stop the reader and let the writers finish the queued clips
+        stop_event.set()
+        for write_queue, writer in zip(write_queues, writers):
+            write_queue.put(None)
+            writer.join()
+        reader.join()
+
+    if write_errors:
+        raise write_errors[0]
+
+    # Add the exported clips to the clip cache
+    if cache_folder is not None:
+        for start_clip, window in windows:
+            for channel, export_filename in window:
+                clipcache.add_clip(cache_folder,
+                                   clipcache.get_clip_key(audiofile_key, channel, start_clip, clip_settings),
+                                   os.path.join(audio_export_folder, export_filename + '.flac'))
+
+
+def encode_audiofile(audiofile, clips, export_settings, bit_depth):
+    """
+    Encodes all of the clips of a source audio file in memory, as export_audiofile saves them, to write them in
+    another container than one FLAC file per clip (see shards.ShardWriter).
+
+    Inputs:
+        - audiofile: Path to the source audio file ('Begin Path').
+        - clips: List of (start_clip, channel, export_filename) tuples, see export_audiofile.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+
+    Outputs:
+        - encoded_clips: List of (export_filename, FLAC clip bytes) tuples, each clip once, in the clips order.
+    """
+    audio_export_folder = export_settings['Export folders']['Audio export folder']
+    encoded = {}
+    export_audiofile(audiofile, clips, export_settings, bit_depth, encoded=encoded)
+
+    export_filenames = dict.fromkeys(export_filename for _, _, export_filename in clips)
+    return [(export_filename, encoded[os.path.join(audio_export_folder, export_filename + '.flac')])
+            for export_filename in export_filenames]
+
+
+def store_audiofile(audiofile, clips, export_settings, bit_depth, store_file, rows):
+    """
+    Writes all of the clips of a source audio file in their rows of a clip store (.npy), with the integer samples
+    of the FLAC clips (see quantize_clip). The store is memory-mapped, so that several worker processes can write
+    their rows in place.
+
+    Inputs:
+        - audiofile: Path to the source audio file ('Begin Path').
+        - clips: List of (start_clip, channel, export_filename) tuples, see export_audiofile.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - store_file: Path to the clip store, an array of shape (clips, samples) preallocated with
+        numpy.lib.format.open_memmap.
+        - rows: Dictionary with the row of each export file name.
+
+    Outputs:
+        - samples: Dictionary with the number of samples written in the row of each export file name, the rest of
+        the row is 0.
+    """
+    audio_export_folder = export_settings['Export folders']['Audio export folder']
+    export_paths = {os.path.join(audio_export_folder, export_filename + '.flac'): export_filename
+                    for _, _, export_filename in clips}
+
+    array = np.load(store_file, mmap_mode='r+')
+    path_samples = {}
+    export_audiofile(audiofile, clips, export_settings, bit_depth,
+                     store=(array, {export_path: rows[export_filename]
+                                    for export_path, export_filename in export_paths.items()}, path_samples))
+    array.flush()
+    del array
+
+    return {export_paths[export_path]: n_samples for export_path, n_samples in path_samples.items()}
+
+
+def map_audiofiles(function, export_jobs, export_settings, bit_depth, workers=1, job_arguments=None):
+    """
+    Runs an export function on several source audio files, either serially or spread over a pool of worker
+    processes, one source audio file per task.
+
+    Inputs:
+        - function: export_audiofile or encode_audiofile.
+        - export_jobs: List of (audiofile, clips) tuples, see export_audiofile.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - workers: Number of worker processes, 1 exports in the current process.
+        - job_arguments: List of the tuples of the other arguments of function, for each job. None if function
+        takes no other arguments.
+
+    Outputs:
+        - Generator yielding the (index, output) of each job in export_jobs once its clips are exported. Jobs
+        are always yielded in the export_jobs order so that the annotations can be written in a deterministic order.
+        With worker processes, at most MAP_JOBS_PER_WORKER jobs per worker are submitted ahead of the job being
+        yielded, which bounds the outputs waiting in the calling process.
+    """
+    audiofile_list = [audiofile for audiofile, _ in export_jobs]
+    clips_list = [clips for _, clips in export_jobs]
+    if job_arguments is None:
+        job_arguments = [()] * len(export_jobs)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Keep MAP_JOBS_PER_WORKER jobs per worker in flight, so that the outputs of the jobs that end before
+            # an earlier slow job are not all held in memory
+            pending = deque()
+            for ind_job in range(len(export_jobs)):
+                pending.append(executor.submit(function, audiofile_list[ind_job], clips_list[ind_job],
+                                               export_settings, bit_depth, *job_arguments[ind_job]))
+                if len(pending) >= MAP_JOBS_PER_WORKER * workers:
+                    yield ind_job - len(pending) + 1, pending.popleft().result()
+            for ind_job in range(len(export_jobs) - len(pending), len(export_jobs)):
+                yield ind_job, pending.popleft().result()
+    else:
+        for ind_job, (audiofile, clips) in enumerate(export_jobs):
+            yield ind_job, function(audiofile, clips, export_settings, bit_depth, *job_arguments[ind_job])
+
+
+def export_audiofiles(export_jobs, export_settings, bit_depth, workers=1):
+    """
+    Exports the clips of several source audio files, either serially or spread over a pool of worker
+    processes, one source audio file per task.
+
+    Inputs:
+        - export_jobs: List of (audiofile, clips) tuples, see export_audiofile.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - workers: Number of worker processes, 1 exports in the current process.
+
+    Outputs:
+        - Generator yielding the index of each job in export_jobs once its clips are exported. Indices are
+        always yielded in the export_jobs order so that the annotations can be written in a deterministic order.
+        Once all of the jobs are exported, the least recently used clips of the clip cache are evicted, see
+        clipcache.evict_clips.
+    """
+    for ind_job, _ in map_audiofiles(export_audiofile, export_jobs, export_settings, bit_depth, workers=workers):
+        yield ind_job
+
+    # Keep the clip cache in its disk budget
+    cache_folder, cache_size_mb = clipcache.get_clip_cache(export_settings)
+    if cache_folder is not None:
+        clipcache.evict_clips(cache_folder, cache_size_mb)
+
+
+def encode_audiofiles(export_jobs, export_settings, bit_depth, workers=1):
+    """
+    Encodes the clips of several source audio files in memory, either serially or spread over a pool of worker
+    processes, one source audio file per task. The clips of a source audio file are held in memory until the
+    caller gets them.
+
+    Inputs:
+        - export_jobs: List of (audiofile, clips) tuples, see export_audiofile.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - workers: Number of worker processes, 1 encodes in the current process.
+
+    Outputs:
+        - Generator yielding the index of each job in export_jobs and its encoded clips (see encode_audiofile),
+        in the export_jobs order.
+    """
+    return map_audiofiles(encode_audiofile, export_jobs, export_settings, bit_depth, workers=workers)
+
+
+def store_audiofiles(export_jobs, export_settings, bit_depth, store_file, job_rows, workers=1):
+    """
+    Writes the clips of several source audio files in a clip store, either serially or spread over a pool of
+    worker processes that write their rows in place, one source audio file per task.
+
+    Inputs:
+        - export_jobs: List of (audiofile, clips) tuples, see export_audiofile.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - store_file: Path to the preallocated clip store, see store_audiofile.
+        - job_rows: List of the dictionaries of the row of each export file name, for each job.
+        - workers: Number of worker processes, 1 writes in the current process.
+
+    Outputs:
+        - Generator yielding the index of each job in export_jobs and the number of samples of its clips (see
+        store_audiofile), in the export_jobs order.
+    """
+    return map_audiofiles(store_audiofile, export_jobs, export_settings, bit_depth, workers=workers,
+                          job_arguments=[(store_file, rows) for rows in job_rows])
+
+
+# ----------------------------
+#  Size measurement functions
+def encode_clip_size(audiofile, start_clip, channel, export_settings, bit_depth):
+    """
+    Encodes an export clip in memory, as export_audiofile saves it, and returns the size of the FLAC clip.
+
+    Inputs:
+        - audiofile: Path to the source audio file ('Begin Path').
+        - start_clip: Start time of the export clip (s).
+        - channel: Channel number (0-based).
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+
+    Outputs:
+        - size: Size of the FLAC clip in bytes.
+    """
+    duration = export_settings['Digital sampling']['Audio duration (s)']
+    fs = export_settings['Digital sampling']['fs (Hz)']
+    quality = get_resampling_quality(export_settings)
+
+    buffer = io.BytesIO()
+    with audiofiles.open_audiofile(audiofile) as sf_desc, \
+            open_flac_clip(buffer, fs, bit_depth, get_flac_compression_level(export_settings)) as sf_clip:
+        dtype = get_passthrough_dtype(sf_desc, fs)
+        fs_original = sf_desc.samplerate
+        frames = int(np.round(fs_original * duration))
+        context_frames = get_context_frames(get_resampling_context(export_settings), start_clip, fs_original, fs)
+        block_frames = get_block_frames(export_settings.get('Max memory (MB)'), frames + sum(context_frames),
+                                        get_decoded_channels(sf_desc, [channel]), fs_original, fs, quality)
+        stream = None
+        if fs != fs_original:
+            stream = ClipStream(fs_original, fs, 1, quality, context_frames[0], frames)
+
+        # Encode the clip block by block, as export_audiofile does
+        for x_block, _, last in read_clip_blocks(sf_desc, start_clip, duration, block_frames, dtype or 'float32',
+                                                 channels=slice(channel, channel + 1),
+                                                 context_frames=context_frames):
+            if dtype is not None:
+                resampled = [(None, requantize_clip(x_block, PCM_SUBTYPE_BITS[sf_desc.subtype], bit_depth))]
+            elif stream is None:
+                resampled = [(None, x_block)]
+            else:
+                resampled = stream.push(x_block, None) + (stream.flush() if last else [])
+            for _, x_clip in resampled:
+                sf_clip.write(x_clip[0, :])
+
+    return len(buffer.getvalue())
+
+
+def measure_clip_sizes(clips, export_settings, bit_depth, workers=1, max_time=None):
+    """
+    Measures the FLAC size of export clips by encoding them in memory, either serially or spread over a pool of
+    threads, until all of the clips are encoded or the time budget is spent. Unlike worker processes, threads do
+    not import the modules again when they start, so the time budget is spent on encoding.
+
+    Inputs:
+        - clips: List of (audiofile, start_clip, channel) tuples, channel is 0-based.
+        - export_settings: Dictionary containing export settings.
+        - bit_depth: soundfile FLAC subtype, see get_bitdepth.
+        - workers: Number of threads, 1 encodes in the calling thread.
+        - max_time: Time budget (s), the clips that are not encoded when it is spent are not measured, and the
+        function returns without waiting for the clips being encoded. If None, all of the clips are measured.
+
+    Outputs:
+        - sizes: List of the measured FLAC clip sizes in bytes.
+    """
+    start_time = time.monotonic()
+    sizes = []
+
+    if workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(encode_clip_size, audiofile, start_clip, channel, export_settings, bit_depth)
+                   for audiofile, start_clip, channel in clips]
+        try:
+            for future in as_completed(futures, timeout=max_time):
+                sizes.append(future.result())
+        except FuturesTimeoutError:
+            # The time budget is spent
+            pass
+        finally:
+            # The clips waiting for a thread are not encoded, and the clips being encoded are not waited for
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+    else:
+        for audiofile, start_clip, channel in clips:
+            if max_time is not None and time.monotonic() - start_time > max_time:
+                break
+            sizes.append(encode_clip_size(audiofile, start_clip, channel, export_settings, bit_depth))
+
+    return sizes
@@ -0,0 +1,351 @@
+# Benchmark Dataset Creator export journal functions
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+import json
+
+
+# Name of the export journal, saved in the project export folder
+JOURNAL_FILENAME = 'export_journal.jsonl'
+
+
+# ---------------------------
+#  Journal file functions
+def get_journal_file(export_settings):
+    """
+    Get the path of the export journal, saved next to the audio and annotations folders.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+
+    Outputs:
+        - journal_file: Path to the export journal (.jsonl).
+    """
+    project_folder = os.path.dirname(os.path.normpath(export_settings['Export folders']['Audio export folder']))
+    return os.path.join(project_folder, JOURNAL_FILENAME)
+
+
+def get_file_size(filename):
+    """
+    Get the size of a file in bytes, None if the file does not exist.
+    """
+    if os.path.exists(filename):
+        return os.path.getsize(filename)
+    return None
+
+
+def truncate_file(filename, size):
+    """
+    Restores a file that was appended to, to its previous size. If size is None, the file did not exist and it is
+    deleted.
+    """
+    if size is None:
+        if os.path.exists(filename):
+            os.remove(filename)
+    elif os.path.exists(filename) and os.path.getsize(filename) > size:
+        with open(filename, 'r+b') as f:
+            f.truncate(size)
+
+
+def copy_file_head(filename, size, new_filename):
+    """
+    Copies the first size bytes of a file to a new file, which replaces any existing file. If size is None, the
+    file did not exist before the export and nothing is copied.
+    """
+    if os.path.exists(new_filename):
+        os.remove(new_filename)
+    if size is None or not os.path.exists(filename):
+        return
+
+    with open(filename, 'rb') as f_in, open(new_filename, 'wb') as f_out:
+        f_out.write(f_in.read(size))
+
+
+def append_journal(journal_file, records):
+    """
+    Appends records to the export journal, one JSON object per line. The journal is flushed to disk before
+    returning so that a record is never lost once the matching outputs are considered complete.
+
+    Inputs:
+        - journal_file: Path to the export journal (.jsonl).
+        - records: List of dictionaries to append.
+    """
+    with open(journal_file, 'a') as f:
+        f.write(''.join([json.dumps(record) + '\n' for record in records]))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal(journal_file):
+    """
+    Reads the export journal. A last line cut by a crash is ignored.
+
+    Inputs:
+        - journal_file: Path to the export journal (.jsonl).
+
+    Outputs:
+        - records: List of the journal records, empty if the journal does not exist.
+    """
+    records = []
+    if not os.path.exists(journal_file):
+        return records
+
+    with open(journal_file, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+def get_journal_settings(export_settings):
+    """
+    Get the export settings that define the content of the exports, to check that a resumed export uses the
+    same settings.
+    """
+    return json.loads(json.dumps({
+        'Project ID': export_settings['Project ID'],
+        'Deployment ID': export_settings['Deployment ID'],
+        'Digital sampling': export_settings['Digital sampling'],
+        'Selections': export_settings['Selections']
+    }))
+
+
+# ---------------------------
+#  Export journal functions
+def start_journal(journal_file, export_settings):
+    """
+    Starts a new export journal, replacing any previous journal. The start record keeps the size of the global
+    annotation files, which are appended to during the export.
+
+    Inputs:
+        - journal_file: Path to the export journal (.jsonl).
+        - export_settings: Dictionary containing export settings.
+    """
+    if os.path.exists(journal_file):
+        os.remove(journal_file)
+
+    append_journal(journal_file, [{
+        'Event': 'start',
+        'Settings': get_journal_settings(export_settings),
+        'Annotation CSV size': get_file_size(export_settings['Export folders']['Annotation CSV file']),
+        'Audio-Seltab Map CSV size': get_file_size(export_settings['Export folders']['Audio-Seltab Map CSV file'])
+    }])
+
+
+def journal_file_begin(journal_file, audiofile, selection_table_files):
+    """
+    Records that the annotations of a source audio file are about to be written, with the size of the clip
+    selection tables that will be appended to.
+
+    Inputs:
+        - journal_file: Path to the export journal (.jsonl).
+        - audiofile: Path to the source audio file ('Begin Path').
+        - selection_table_files: List of the clip selection table files (.txt) that will be written.
+    """
+    append_journal(journal_file, [{
+        'Event': 'begin',
+        'Begin Path': audiofile,
+        'Selection table sizes': {filename: get_file_size(filename) for filename in selection_table_files}
+    }])
+
+
+def get_annotation_rows(entries):
+    """
+    Get the annotation rows of a clip as they are recorded in the journal: the selection table entries converted
+    to strings, without the selection number.
+    """
+    return [[str(value) for value in entry[1:]] for entry in entries]
+
+
+def get_clip_records(audiofile, plan_df, clip_entries):
+    """
+    Get the journal records of the clips of a source audio file.
+
+    Inputs:
+        - audiofile: Path to the source audio file ('Begin Path').
+        - plan_df: Export plan DataFrame of the source audio file, see dataset.plan_benchmark_exports.
+        - clip_entries: Dictionary with the export file names as keys and their selection table entries as values,
+        see dataset.export_plan_annotations.
+
+    Outputs:
+        - records: List of the clip records.
+    """
+    clips_df = plan_df.drop_duplicates(subset='Export filename')
+    return [{
+        'Event': 'clip',
+        'Export filename': export_filename,
+        'Begin Path': audiofile,
+        'Channel': int(channel),
+        'Start export clip': float(start_clip),
+        'Annotations': get_annotation_rows(clip_entries[export_filename])
+    } for export_filename, channel, start_clip in zip(
+        clips_df['Export filename'], clips_df['Channel'], clips_df['Start export clip'])]
+
+
+def journal_file_commit(journal_file, audiofile, export_settings, plan_df, clip_entries):
+    """
+    Records the completed clips of a source audio file with their annotation rows, then commits the file. A
+    source audio file is complete only once its commit record is in the journal.
+
+    Inputs:
+        - journal_file: Path to the export journal (.jsonl).
+        - audiofile: Path to the source audio file ('Begin Path').
+        - export_settings: Dictionary containing export settings.
+        - plan_df: Export plan DataFrame of the source audio file, see dataset.plan_benchmark_exports.
+        - clip_entries: Dictionary with the export file names as keys and their selection table entries as values,
+        see dataset.export_plan_annotations.
+    """
+    records = get_clip_records(audiofile, plan_df, clip_entries)
+    records.append({
+        'Event': 'commit',
+        'Begin Path': audiofile,
+        'Annotation CSV size': get_file_size(export_settings['Export folders']['Annotation CSV file']),
+        'Audio-Seltab Map CSV size': get_file_size(export_settings['Export folders']['Audio-Seltab Map CSV file'])
+    })
+    append_journal(journal_file, records)
+
+
+def recover_journal(journal_file, export_settings):
+    """
+    Prepares a resumed export from the export journal: the annotation files appended to after the last committed
+    source audio file are restored to their committed size, and the interrupted FLAC writes are removed.
+
+    Inputs:
+        - journal_file: Path to the export journal (.jsonl).
+        - export_settings: Dictionary containing export settings.
+
+    Outputs:
+        - committed_audiofiles: Set of the source audio files that are completely exported.
+
+    Raises:
+        - ValueError: If the journal was written with different export settings.
+    """
+    records = read_journal(journal_file)
+    if not records or records[0]['Event'] != 'start':
+        raise ValueError(f'Error: No export to resume in {journal_file}')
+    if records[0]['Settings'] != get_journal_settings(export_settings):
+        raise ValueError('Error: The export settings changed since the export started, it cannot be resumed')
+
+    # Get the committed source audio files and the last committed size of the annotation files
+    committed_audiofiles = set()
+    sizes = records[0]
+    pending = None
+    for record in records:
+        if record['Event'] == 'begin':
+            pending = record
+        elif record['Event'] == 'commit':
+            committed_audiofiles.add(record['Begin Path'])
+            sizes = record
+            pending = None
+
+    # Undo the annotations written after the last commit
+    truncate_file(export_settings['Export folders']['Annotation CSV file'], sizes['Annotation CSV size'])
+    truncate_file(export_settings['Export folders']['Audio-Seltab Map CSV file'], sizes['Audio-Seltab Map CSV size'])
+    if pending is not None:
+        for filename, size in pending['Selection table sizes'].items():
+            truncate_file(filename, size)
+
+    # Remove the interrupted FLAC writes
+    audio_export_folder = export_settings['Export folders']['Audio export folder']
+    for filename in os.listdir(audio_export_folder):
+        if filename.endswith('.part'):
+            os.remove(os.path.join(audio_export_folder, filename))
+
+    print(f'Resuming export: {len(committed_audiofiles)} audio file(s) already exported')
+    return committed_audiofiles
+
+
+# ---------------------------
+#  Incremental export functions
+def diff_journal(journal_file, export_settings, clip_entries):
+    """
+    Compares the clips of a new export plan with the clips recorded in the journal of the last export.
+
+    Inputs:
+        - journal_file: Path to the export journal (.jsonl).
+        - export_settings: Dictionary containing export settings.
+        - clip_entries: Dictionary with the export file names of the new export plan as keys and their selection
+        table entries as values, see dataset.get_plan_entries.
+
+    Outputs:
+        - new_clips: List of the export file names that are not in the last export, their audio is exported.
+        - changed_clips: List of the export file names whose annotation rows changed, including the new clips,
+        their selection table is written again.
+        - orphan_clips: List of the export file names of the last export that are not in the new export plan,
+        including the clips of the source audio files left uncommitted by an interrupted export.
+        - csv_sizes: Dictionary with the 'Annotation CSV size' and 'Audio-Seltab Map CSV size' before the last
+        export, the global annotation files are written again after these sizes.
+
+    Raises:
+        - ValueError: If there is no journal, or if the journal was written with a different project, deployment
+        or digital sampling, in which case the benchmark must be created again.
+    """
+    records = read_journal(journal_file)
+    if not records or records[0]['Event'] != 'start':
+        raise ValueError(f'Error: No previous export to update in {journal_file}')
+    settings = get_journal_settings(export_settings)
+    for field in ['Project ID', 'Deployment ID', 'Digital sampling']:
+        if records[0]['Settings'][field] != settings[field]:
+            raise ValueError(f'Error: The {field} export setting changed since the last export, please create the '
+                             f'benchmark dataset again')
+
+    # Get the clips of the committed source audio files
+    committed_audiofiles = set(record['Begin Path'] for record in records if record['Event'] == 'commit')
+    old_clips = {record['Export filename']: record['Annotations'] for record in records
+                 if record['Event'] == 'clip' and record['Begin Path'] in committed_audiofiles}
+
+    # If the selection settings changed (e.g., the export label), all of the selection tables are written again
+    same_selections = records[0]['Settings']['Selections'] == settings['Selections']
+
+    new_clips = [export_filename for export_filename in clip_entries if export_filename not in old_clips]
+    changed_clips = [export_filename for export_filename, entries in clip_entries.items()
+                     if not same_selections or export_filename not in old_clips
+                     or old_clips[export_filename] != get_annotation_rows(entries)]
+
+    # The clips of the source audio files that were not committed may have been written before the interruption
+    uncommitted_clips = [os.path.splitext(os.path.basename(filename))[0] for record in records
+                         if record['Event'] == 'begin' and record['Begin Path'] not in committed_audiofiles
+                         for filename in record['Selection table sizes']]
+    orphan_clips = [export_filename for export_filename in dict.fromkeys(list(old_clips) + uncommitted_clips)
+                    if export_filename not in clip_entries]
+
+    csv_sizes = {key: records[0][key] for key in ['Annotation CSV size', 'Audio-Seltab Map CSV size']}
+
+    return new_clips, changed_clips, orphan_clips, csv_sizes
+
+
+def write_journal(journal_file, export_settings, plan_df, clip_entries, csv_sizes):
+    """
+    Writes the journal of a complete export at once, replacing the previous journal atomically.
+
+    Inputs:
+        - journal_file: Path to the export journal (.jsonl).
+        - export_settings: Dictionary containing export settings.
+        - plan_df: Export plan DataFrame, without ignored selections, see dataset.plan_benchmark_exports.
+        - clip_entries: Dictionary with the export file names as keys and their selection table entries as values.
+        - csv_sizes: Dictionary with the 'Annotation CSV size' and 'Audio-Seltab Map CSV size' before the export,
+        see diff_journal.
+    """
+    records = [{
+        'Event': 'start',
+        'Settings': get_journal_settings(export_settings),
+        'Annotation CSV size': csv_sizes['Annotation CSV size'],
+        'Audio-Seltab Map CSV size': csv_sizes['Audio-Seltab Map CSV size']
+    }]
+    for audiofile, file_plan_df in plan_df.groupby('Begin Path', sort=False, observed=True):
+        records += get_clip_records(audiofile, file_plan_df, clip_entries)
+        records.append({
+            'Event': 'commit',
+            'Begin Path': audiofile,
+            'Annotation CSV size': get_file_size(export_settings['Export folders']['Annotation CSV file']),
+            'Audio-Seltab Map CSV size': get_file_size(export_settings['Export folders']['Audio-Seltab Map CSV file'])
+        })
+
+    if os.path.exists(journal_file + '.part'):
+        os.remove(journal_file + '.part')
+    append_journal(journal_file + '.part', records)
+    os.replace(journal_file + '.part', journal_file)
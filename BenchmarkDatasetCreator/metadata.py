@@ -430,6 +430,13 @@ def transform_export_metadata_to_ASA_standard(export_metadata_dict):
     export_metadata_dict["DigitalSampling"]["NewSampleRate_kHz"] = export_metadata_dict["DigitalSampling"].pop(
         "fs (Hz)")
     export_metadata_dict["DigitalSampling"]["NewSampleBits"] = export_metadata_dict["DigitalSampling"].pop("Bit depth")
+    export_metadata_dict["DigitalSampling"]["ResamplingQuality"] = export_metadata_dict["DigitalSampling"].pop(
+        "Resampling quality", "vhq")
+    export_metadata_dict["DigitalSampling"]["ResamplingContext_s"] = export_metadata_dict["DigitalSampling"].pop(
+        "Resampling context (s)", 0)
+    export_metadata_dict["DigitalSampling"]["FlacCompressionLevel"] = export_metadata_dict["DigitalSampling"].pop(
+        "FLAC compression level", 5)
+    export_metadata_dict["DigitalSampling"]["FlacEncoderWorkers"] = export_metadata_dict.pop("Encoder workers", 1)
 
     export_metadata_dict["Selections"] = export_metadata_dict.pop("Selections")
     export_metadata_dict["Selections"]["ExportLabel"] = export_metadata_dict["Selections"].pop("Export label")
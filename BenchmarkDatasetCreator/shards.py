@@ -0,0 +1,213 @@
+# Benchmark Dataset Creator shard export functions
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import io
+import os
+import tarfile
+
+
+# Folder of the tar shards and their index, saved in the project export folder
+SHARD_FOLDER = 'shards'
+
+# Name of the shard index, saved in the shard folder
+SHARD_INDEX_FILENAME = 'shard_index.csv'
+
+# Export formats of the audio clips and selection tables: one file per clip, tar shards, or a clip store array
+EXPORT_FORMATS = ['flac', 'tar', 'npy']
+DEFAULT_EXPORT_FORMAT = 'flac'
+
+# Default maximum size of a tar shard (MB)
+DEFAULT_SHARD_SIZE_MB = 1024
+
+# Header of the shard index
+SHARD_INDEX_HEADER = ['Export filename', 'Shard', 'FLAC offset (bytes)', 'FLAC size (bytes)',
+                      'Selection table offset (bytes)', 'Selection table size (bytes)']
+
+
+# ---------------------------
+#  Shard settings functions
+def get_export_format(export_settings):
+    """
+    Get the export format of the audio clips and selection tables from the export settings.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings, the format is read from
+        export_settings['Export format'], 'flac' if missing.
+
+    Outputs:
+        - export_format: One of EXPORT_FORMATS:
+            * 'flac': one FLAC file and one selection table (.txt) per clip, in the audio and annotations folders,
+            * 'tar': WebDataset-style tar shards of export_settings['Shard size (MB)'], see ShardWriter,
+            * 'npy': a single memory-mappable array of the decoded clips with a parquet index, see clipstore.
+
+    Raises:
+        - ValueError: If the export format is unknown.
+    """
+    export_format = export_settings.get('Export format', DEFAULT_EXPORT_FORMAT)
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}', should be one of {EXPORT_FORMATS}")
+    return export_format
+
+
+def get_shard_folder(export_settings):
+    """
+    Get the folder of the tar shards, next to the audio and annotations folders.
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+
+    Outputs:
+        - shard_folder: Path to the shard folder.
+    """
+    project_folder = os.path.dirname(os.path.normpath(export_settings['Export folders']['Audio export folder']))
+    return os.path.join(project_folder, SHARD_FOLDER)
+
+
+# ---------------------------
+#  Shard writing functions
+class ShardWriter:
+    """
+    Writes the clips of a benchmark in WebDataset-style tar shards: the FLAC clip and the selection table of each
+    clip are consecutive members of a shard, named after the clip ('<Export filename>.flac' and
+    '<Export filename>.txt'). A new shard is started when a clip would make the closed shard, with the end of
+    archive blocks and the padding to a whole tar record, larger than shard_size_mb, so that the shards have about
+    the same size and none is larger than shard_size_mb unless a single clip is. The shards are numbered in the
+    export order, '<prefix>-000000.tar', '<prefix>-000001.tar', ...
+
+    Each clip is added to a tab-separated index (shard_index.csv) with its shard and the offset and size of its
+    members, so that a clip can be read from its shard without reading the shard from the start.
+
+    The members have a fixed modification time and owner, so that the same clips give the same shards.
+    """
+
+    def __init__(self, shard_folder, prefix, shard_size_mb=DEFAULT_SHARD_SIZE_MB):
+        """
+        Inputs:
+            - shard_folder: Folder of the shards and of their index, created if it does not exist. Existing
+            shards and index are replaced.
+            - prefix: Prefix of the shard file names.
+            - shard_size_mb: Maximum size of a shard (MB), a single clip larger than the maximum makes a shard of
+            its own.
+        """
+        self.shard_folder = shard_folder
+        self.prefix = prefix
+        self.shard_size = int(shard_size_mb * 2 ** 20)
+        self.shard_number = -1
+        self.tar = None
+        self.shard_file = None
+
+        # Remove the shards of a previous export
+        os.makedirs(shard_folder, exist_ok=True)
+        for filename in os.listdir(shard_folder):
+            if filename.startswith(prefix + '-') and filename.endswith('.tar'):
+                os.remove(os.path.join(shard_folder, filename))
+
+        self.index = open(os.path.join(shard_folder, SHARD_INDEX_FILENAME), 'w')
+        self.index.write('\t'.join(SHARD_INDEX_HEADER) + '\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open_next_shard(self):
+        """
+        Closes the current shard and starts the next one.
+        """
+        if self.tar is not None:
+            self.tar.close()
+        self.shard_number += 1
+        self.shard_file = os.path.join(self.shard_folder, f'{self.prefix}-{self.shard_number:06d}.tar')
+        self.tar = tarfile.open(self.shard_file, 'w')
+
+    @staticmethod
+    def get_member_info(name, data):
+        """
+        Get the tar header of a member, with a fixed modification time and owner.
+        """
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.size = len(data)
+        tarinfo.mode = 0o644
+        return tarinfo
+
+    def get_member_size(self, name, data):
+        """
+        Get the number of bytes a member takes in the current shard: its header blocks, including the extended
+        header of a long name, and its content padded to the next 512-byte block.
+        """
+        header = self.get_member_info(name, data).tobuf(self.tar.format, self.tar.encoding, self.tar.errors)
+        return len(header) + -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+    def add_member(self, name, data):
+        """
+        Adds a member to the current shard.
+
+        Inputs:
+            - name: Member name.
+            - data: Member content (bytes).
+
+        Outputs:
+            - offset: Offset of the member content in the shard (bytes).
+        """
+        self.tar.addfile(self.get_member_info(name, data), io.BytesIO(data))
+
+        # The content is followed by padding up to the next 512-byte block
+        padded_size = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return self.tar.offset - padded_size
+
+    def add_clip(self, export_filename, flac_data, selection_table_text):
+        """
+        Adds the FLAC clip and selection table of a clip to the shards, and the clip to the index.
+
+        Inputs:
+            - export_filename: Export file name of the clip, without extension.
+            - flac_data: Encoded FLAC clip (bytes).
+            - selection_table_text: Selection table of the clip (str).
+        """
+        selection_table_data = selection_table_text.encode()
+
+        # Start a new shard if the clip does not fit in the current one, a closed shard ends with two empty
+        # blocks and is padded to a whole number of records
+        if self.tar is None:
+            self.open_next_shard()
+        elif self.tar.offset > 0:
+            end_offset = (self.tar.offset + self.get_member_size(export_filename + '.flac', flac_data)
+                          + self.get_member_size(export_filename + '.txt', selection_table_data)
+                          + 2 * tarfile.BLOCKSIZE)
+            if -(-end_offset // tarfile.RECORDSIZE) * tarfile.RECORDSIZE > self.shard_size:
+                self.open_next_shard()
+
+        flac_offset = self.add_member(export_filename + '.flac', flac_data)
+        selection_table_offset = self.add_member(export_filename + '.txt', selection_table_data)
+
+        self.index.write('\t'.join([export_filename, os.path.basename(self.shard_file), str(flac_offset),
+                                    str(len(flac_data)), str(selection_table_offset),
+                                    str(len(selection_table_data))]) + '\n')
+
+    def close(self):
+        """
+        Closes the current shard and the index.
+        """
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+        self.index.close()
+
+
+def open_shard_writer(export_settings):
+    """
+    Opens the shard writer of an export, in the shard folder (see get_shard_folder), with the shards named after
+    the project folder and export_settings['Shard size (MB)'].
+
+    Inputs:
+        - export_settings: Dictionary containing export settings.
+
+    Outputs:
+        - shard_writer: ShardWriter object.
+    """
+    shard_folder = get_shard_folder(export_settings)
+    return ShardWriter(shard_folder, os.path.basename(os.path.dirname(shard_folder)),
+                       export_settings.get('Shard size (MB)', DEFAULT_SHARD_SIZE_MB))
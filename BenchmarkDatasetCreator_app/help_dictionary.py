@@ -110,6 +110,19 @@ export = {
                    'interest. If relevant, BirdNET uses fs = 48 kHz.',
         'Bit depth': 'The bit depth determines the number of possible amplitude values we can record for each audio '
                      'sample; for SWIFT units, it is set to 16 bits and for Rockhopper to 24 bits.',
+        'Resampling quality': "Quality of the resampling to the export sampling frequency, from the slowest to the "
+                              "fastest: 'vhq', 'hq' and 'mq' (soxr very high, high and medium quality) and "
+                              "'polyphase' (scipy polyphase filtering, meant for simple ratios between the original "
+                              "and export sampling frequencies, 'vhq' is used for the files with other ratios). "
+                              "[Recommended] 'vhq' for the Benchmark dataset, the faster settings can be used for "
+                              "draft exports.",
+        'Resampling context (s)': "Duration of the original audio resampled with each side of a clip, then cut, so "
+                                  "that the clip edges are resampled as in the original recording. With 0, each "
+                                  "clip is resampled on its own, as librosa does. The clips only depend on their "
+                                  "audio file, channel and start time in both cases.",
+        'FLAC compression level': "Compression level of the exported FLAC audio files, from the fastest encoding (0) "
+                                  "to the smallest files (8). The audio is the same at all levels. [Recommended] 5, "
+                                  "the FLAC default.",
     },
     'Selections': {
         'Export label': "Defines the name of the label column for the created export Raven selection tables",
@@ -161,9 +174,12 @@ benchmark_creator_info = {
     },
     'Signal Processing': {
         'Resampling': f'The data is loaded and resampled as requested using Librosa {librosa.__version__}, using the '
-                      f'`soxr_vhq` protocol. See https://librosa.org/doc/main/generated/librosa.resample.html for the '
-                      f'documentation.',
-        'AudioWrite': f'The data is saved with the wanted Bit Depth using Soundfile {sf.__version__}. '
+                      f'soxr protocol or scipy polyphase filtering set by the resampling quality (DigitalSampling -> '
+                      f'ResamplingQuality, `vhq` for `soxr_vhq`), each clip with the resampling context around it '
+                      f'(DigitalSampling -> ResamplingContext_s). See '
+                      f'https://librosa.org/doc/main/generated/librosa.resample.html for the documentation.',
+        'AudioWrite': f'The data is saved with the wanted Bit Depth and FLAC compression level (DigitalSampling -> '
+                      f'FlacCompressionLevel) using Soundfile {sf.__version__}. '
                       f'See https://python-soundfile.readthedocs.io/en/0.11.0/index.html?highlight=write#soundfile.write'
                       f' for the documentation.'
     },
@@ -11,7 +11,7 @@ import copy
 
 sys.path.insert(1, '.' + os.sep)
 from BenchmarkDatasetCreator_app import help_dictionary as hd
-from BenchmarkDatasetCreator import dataset, folders, metadata
+from BenchmarkDatasetCreator import dataset, engine, folders, metadata
 
 
 # Titles
@@ -98,6 +98,30 @@ if st.session_state.stage >= 9:
                 help=hd.export['Digital sampling']['Bit depth'],
                 label_visibility="visible"),
 
+        'Resampling quality':
+            st.selectbox(
+                'Resampling quality', list(engine.RESAMPLING_QUALITIES),
+                index=0,
+                help=hd.export['Digital sampling']['Resampling quality'],
+                label_visibility="visible"),
+
+        'Resampling context (s)':
+            st.number_input(
+                'Resampling context (s)',
+                value=float(engine.DEFAULT_RESAMPLING_CONTEXT),
+                min_value=float(0),
+                format='%.2f',
+                step=0.05,
+                help=hd.export['Digital sampling']['Resampling context (s)'],
+                label_visibility="visible"),
+
+        'FLAC compression level':
+            st.selectbox(
+                'FLAC compression level', engine.FLAC_COMPRESSION_LEVELS,
+                index=engine.DEFAULT_FLAC_COMPRESSION_LEVEL,
+                help=hd.export['Digital sampling']['FLAC compression level'],
+                label_visibility="visible"),
+
         'Export label':
             st.text_input(
                 'Export label',
@@ -146,6 +170,9 @@ if st.session_state.stage >= 10:
         'Signal Processing': hd.benchmark_creator_info['Signal Processing'],
         'Digital sampling': {
             'Audio duration (s)': export_settings_user_input['Audio duration (s)'],
+            'Resampling quality': export_settings_user_input['Resampling quality'],
+            'Resampling context (s)': export_settings_user_input['Resampling context (s)'],
+            'FLAC compression level': export_settings_user_input['FLAC compression level'],
         },
 
         'Selections': {
@@ -192,7 +219,8 @@ if st.session_state.stage >= 10:
     # 4) Load selection table and show output
     output = st.empty()
     with folders.st_capture(output.code):
-        selection_table_df = dataset.load_selection_table(selection_table_path)
+        selection_table_df = dataset.load_selection_table(
+            selection_table_path, cache_folder=export_settings['Export folders']['Export folder'])
 
     # 5) Run dataset.check_selection_tab and show output of the function
     output = st.empty()
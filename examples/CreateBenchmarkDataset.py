@@ -29,8 +29,8 @@ bc.check_selection_tab(selection_table_path)
 # Create directories
 bc.create_path(export_settings)
 
-# Load selection table
-selection_table_df = bc.load_selection_table(selection_table_path)
+# Load selection table, the parsed tables are cached in the export folder
+selection_table_df = bc.load_selection_table(selection_table_path, cache_folder=export_settings['Export folder'])
 
 if selection_table_df.empty == False:
     print(selection_table_df)
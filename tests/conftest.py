@@ -0,0 +1,102 @@
+# Benchmark Dataset Creator test fixtures
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+import filecmp
+
+import numpy as np
+import pandas as pd
+import pytest
+import soundfile as sf
+
+
+# Synthetic audio files: name, sampling frequency (Hz), number of channels, subtype, duration (s)
+AUDIO_FILES = [('a.wav', 8000, 2, 'PCM_16', 45),
+               ('b.flac', 6000, 1, 'PCM_24', 33),
+               ('c.wav', 2000, 2, 'PCM_16', 28)]
+
+
+@pytest.fixture
+def selection_table_df(tmp_path):
+    """
+    Writes the synthetic audio files and returns their selection table, with selections within a single export
+    clip, at the junction between two export clips and in a channel that is not in the audio file.
+    """
+    rng = np.random.default_rng(0)
+    audio_folder = tmp_path / 'recordings'
+    audio_folder.mkdir()
+
+    rows = []
+    for name, fs, n_channels, subtype, duration in AUDIO_FILES:
+        t = np.arange(fs * duration) / fs
+        x = np.stack([0.3 * np.sin(2 * np.pi * (200 + 50 * ch) * t) + 0.05 * rng.standard_normal(len(t))
+                      for ch in range(n_channels)], axis=1)
+        audiofile = str(audio_folder / name)
+        sf.write(audiofile, x, fs, subtype)
+
+        offsets = list(np.round(rng.uniform(0, duration - 3, 10), 2)) + [9.5, 18.2, 19.6]
+        lengths = list(np.round(rng.uniform(0.2, 3.0, 10), 2)) + [2.0, 2.5, 0.6]
+        channels = list(rng.integers(1, n_channels + 1, 10)) + [1, n_channels, n_channels + 1]
+        for offset, length, channel in zip(offsets, lengths, channels):
+            rows.append({'Selection': len(rows) + 1, 'View': 'Spectrogram 1', 'Channel': int(channel),
+                         'Begin Time (s)': 1000 + offset, 'End Time (s)': 1000 + offset + length,
+                         'Low Freq (Hz)': 78.1, 'High Freq (Hz)': 246.9, 'Begin Path': audiofile,
+                         'Begin File': name, 'File Offset (s)': offset,
+                         'Tag': rng.choice(['NARW', 'na', 'hb'])})
+
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def make_export_settings(tmp_path):
+    """
+    Returns a function that creates the export folders of a project and its export settings.
+    """
+    def make_export_settings(name, **digital_sampling):
+        export_folder = tmp_path / name
+        (export_folder / 'audio').mkdir(parents=True)
+        (export_folder / 'annotations').mkdir()
+        export_settings = {
+            'Project ID': 'P', 'Deployment ID': 'D',
+            'Digital sampling': {'Audio duration (s)': 10, 'fs (Hz)': 4000, 'Bit depth': 24},
+            'Selections': {'Export label': 'Tags', 'Split export selections': [True, 1]},
+            'Export folders': {'Export folder': str(export_folder),
+                               'Audio export folder': str(export_folder / 'audio'),
+                               'Annotation export folder': str(export_folder / 'annotations'),
+                               'Annotation CSV file': str(export_folder / 'annotations.csv'),
+                               'Audio-Seltab Map CSV file': str(export_folder / 'map.csv')}}
+        export_settings['Digital sampling'].update(digital_sampling)
+        return export_settings
+
+    return make_export_settings
+
+
+def assert_same_export(export_settings_a, export_settings_b):
+    """
+    Asserts that two exports have the same FLAC clips (decoded samples) and the same selection tables, annotation
+    CSV and audio-selection table map, up to the export folder.
+    """
+    folders_a, folders_b = export_settings_a['Export folders'], export_settings_b['Export folders']
+
+    audio_files = sorted(os.listdir(folders_a['Audio export folder']))
+    assert audio_files == sorted(os.listdir(folders_b['Audio export folder']))
+    assert audio_files
+    for filename in audio_files:
+        x_a, fs_a = sf.read(os.path.join(folders_a['Audio export folder'], filename), dtype='int32')
+        x_b, fs_b = sf.read(os.path.join(folders_b['Audio export folder'], filename), dtype='int32')
+        assert fs_a == fs_b
+        np.testing.assert_array_equal(x_a, x_b, err_msg=filename)
+
+    annotation_files = sorted(os.listdir(folders_a['Annotation export folder']))
+    assert annotation_files == sorted(os.listdir(folders_b['Annotation export folder']))
+    for filename in annotation_files:
+        assert filecmp.cmp(os.path.join(folders_a['Annotation export folder'], filename),
+                           os.path.join(folders_b['Annotation export folder'], filename), shallow=False), filename
+
+    for key in ['Annotation CSV file', 'Audio-Seltab Map CSV file']:
+        with open(folders_a[key]) as f_a, open(folders_b[key]) as f_b:
+            lines_a = f_a.read().replace(folders_a['Export folder'], '').splitlines()
+            lines_b = f_b.read().replace(folders_b['Export folder'], '').splitlines()
+        assert sorted(lines_a) == sorted(lines_b), key
@@ -0,0 +1,54 @@
+# Benchmark Dataset Creator annotation writer tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+from BenchmarkDatasetCreator import dataset
+
+
+ENTRIES = [[0, 'Spectrogram', 1, 1.5, 2.25, 100, 246.9, 'clip_0000s.flac', 1.5, 'NARW'],
+           [0, 'Spectrogram', 1, 4.0, 5.0, 78.1, 246.9, 'clip_0000s.flac', 4.0, 'hb']]
+
+
+def test_batches_append_numbered_entries(tmp_path):
+    selection_table_file = tmp_path / 'clip.txt'
+    annotation_csv_file = tmp_path / 'annotations.csv'
+    for batch in [ENTRIES[:1], ENTRIES[1:]]:
+        dataset.write_selection_table_batch(selection_table_file, batch, export_label='Tags')
+        dataset.write_annotation_csv_batch(annotation_csv_file, batch, export_label='Tags')
+
+    assert selection_table_file.read_text().splitlines() == [
+        'Selection\tView\tChannel\tBegin Time (s)\tEnd Time (s)\tLow Freq (Hz)\tHigh Freq (Hz)\tBegin File\t'
+        'Original Begin Time (s)\tTags',
+        '1\tSpectrogram\t1\t1.5\t2.25\t100\t246.9\tclip_0000s.flac\t1.5\tNARW',
+        '2\tSpectrogram\t1\t4.0\t5.0\t78.1\t246.9\tclip_0000s.flac\t4.0\thb']
+    assert annotation_csv_file.read_text().splitlines() == [
+        'Filename\tStart Time (s)\tEnd Time (s)\tLow Freq (Hz)\tHigh Freq (Hz)\tTags',
+        'clip_0000s.flac\t1.50\t2.25\t100\t246.9\tNARW',
+        'clip_0000s.flac\t4.00\t5.00\t78.1\t246.9\thb']
+
+
+def test_empty_batches_do_not_change_tables(tmp_path):
+    selection_table_file = tmp_path / 'clip.txt'
+    annotation_csv_file = tmp_path / 'annotations.csv'
+    for _ in range(2):
+        dataset.write_selection_table_batch(selection_table_file, [])
+        dataset.write_annotation_csv_batch(annotation_csv_file, [])
+
+    assert selection_table_file.read_text().count('\n') == 1
+    assert annotation_csv_file.read_text().count('\n') == 1
+    assert annotation_csv_file.read_text().startswith('Filename\t')
+
+
+def test_single_entry_writers_equal_batches(tmp_path):
+    for entry in ENTRIES:
+        dataset.write_selection_table(tmp_path / 'clip.txt', list(entry), export_label='Tags')
+        dataset.write_annotation_csv(tmp_path / 'annotations.csv', list(entry), export_label='Tags')
+        dataset.map_audio_selection(tmp_path / 'map.csv', 'clip_0000s.flac', 'clip_0000s.txt')
+    dataset.write_selection_table_batch(tmp_path / 'clip_batch.txt', ENTRIES, export_label='Tags')
+    dataset.write_annotation_csv_batch(tmp_path / 'annotations_batch.csv', ENTRIES, export_label='Tags')
+    dataset.map_audio_selection_batch(tmp_path / 'map_batch.csv', ['clip_0000s.flac'] * 2, ['clip_0000s.txt'] * 2)
+
+    for filename in ['clip.txt', 'annotations.csv', 'map.csv']:
+        batch_filename = filename.replace('.', '_batch.')
+        assert (tmp_path / filename).read_text() == (tmp_path / batch_filename).read_text()
@@ -0,0 +1,94 @@
+# Benchmark Dataset Creator audio file tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+import json
+import threading
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from BenchmarkDatasetCreator import audiofiles
+
+
+def test_probe_index_is_invalidated_by_file_changes(tmp_path, monkeypatch):
+    audiofile = str(tmp_path / 'a.wav')
+    other_audiofile = str(tmp_path / 'b.wav')
+    sf.write(audiofile, np.zeros((8000, 2)), 8000, 'PCM_16')
+    sf.write(other_audiofile, np.zeros(4000), 4000, 'PCM_24')
+    probe_index_file = str(tmp_path / audiofiles.PROBE_INDEX_FILENAME)
+
+    probed = []
+    probe_audiofile = audiofiles.probe_audiofile
+
+    def recorded_probe_audiofile(audiofile):
+        probed.append(audiofile)
+        return probe_audiofile(audiofile)
+
+    monkeypatch.setattr(audiofiles, 'probe_audiofile', recorded_probe_audiofile)
+    probes = audiofiles.probe_audiofiles([audiofile, other_audiofile], probe_index_file)
+    assert sorted(probed) == [audiofile, other_audiofile]
+    assert probes[audiofile]['Channels'] == 2 and probes[audiofile]['Duration (s)'] == 1
+    assert probes[other_audiofile]['Subtype'] == 'PCM_24'
+
+    # The unchanged files are read from the index
+    probed.clear()
+    assert audiofiles.probe_audiofiles([audiofile, other_audiofile], probe_index_file) == probes
+    assert probed == []
+
+    # A modified file is probed again
+    sf.write(audiofile, np.zeros((16000, 1)), 8000, 'PCM_16')
+    os.utime(audiofile, ns=(os.stat(audiofile).st_atime_ns, os.stat(audiofile).st_mtime_ns + 10 ** 9))
+    probes = audiofiles.probe_audiofiles([audiofile, other_audiofile], probe_index_file)
+    assert probed == [audiofile]
+    assert probes[audiofile]['Channels'] == 1 and probes[audiofile]['Duration (s)'] == 2
+    with open(probe_index_file) as f:
+        assert json.load(f)[audiofile] == probes[audiofile]
+
+
+def test_concurrent_probe_index_saves(tmp_path):
+    probe_index_file = str(tmp_path / audiofiles.PROBE_INDEX_FILENAME)
+    probe_indexes = [{f'file_{ind}.wav': {'Channels': ind}} for ind in range(8)]
+
+    threads = [threading.Thread(target=lambda probe_index=probe_index: [
+        audiofiles.save_probe_index(probe_index_file, probe_index) for _ in range(20)])
+        for probe_index in probe_indexes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The index is one of the saved indexes, without temporary files left
+    assert audiofiles.load_probe_index(probe_index_file) in probe_indexes
+    assert os.listdir(tmp_path) == [audiofiles.PROBE_INDEX_FILENAME]
+
+
+@pytest.mark.parametrize('extension, subtype', [('wav', 'PCM_U8'), ('wav', 'PCM_16'), ('wav', 'PCM_24'),
+                                                ('wav', 'PCM_32'), ('wav', 'FLOAT'), ('wav', 'DOUBLE'),
+                                                ('aiff', 'PCM_S8'), ('aiff', 'PCM_16'), ('aiff', 'PCM_24'),
+                                                ('aiff', 'PCM_32'), ('aiff', 'FLOAT')])
+def test_memmap_reads_are_the_soundfile_reads(tmp_path, extension, subtype):
+    audiofile = str(tmp_path / f'source.{extension}')
+    x = np.clip(0.3 * np.random.default_rng(0).standard_normal((5000, 3)), -1, 1)
+    x[:4] = [[-1, 1, 0], [1 - 2 ** -9, -2 ** -9, 2 ** -9], [0.5, -0.5, 2 ** -17], [-2 ** -17, 2 ** -25, -1]]
+    sf.write(audiofile, x, 4000, subtype)
+
+    dtypes = ['float64', 'float32'] if subtype in ('FLOAT', 'DOUBLE') else ['float64', 'float32', 'int32', 'int16']
+    with audiofiles.open_audiofile(audiofile) as memmap_desc, sf.SoundFile(audiofile) as sf_desc:
+        assert isinstance(memmap_desc, audiofiles.MemmapAudioFile)
+        assert (memmap_desc.samplerate, memmap_desc.channels, memmap_desc.frames, memmap_desc.subtype) == \
+            (sf_desc.samplerate, sf_desc.channels, sf_desc.frames, sf_desc.subtype)
+
+        for dtype in dtypes:
+            for start, frames, channels in [(0, 1000, None), (1234, 2000, [0, 2]), (4500, 1000, slice(1, 3))]:
+                memmap_desc.seek(start)
+                sf_desc.seek(start)
+                x_memmap = memmap_desc.read(frames=frames, dtype=dtype, always_2d=True, channels=channels)
+                x_sf = sf_desc.read(frames=frames, dtype=dtype, always_2d=True)
+                np.testing.assert_array_equal(x_memmap, x_sf if channels is None else x_sf[:, channels],
+                                              err_msg=f'{dtype} {start}')
+                assert x_memmap.dtype == np.dtype(dtype)
+                assert memmap_desc.tell() == sf_desc.tell()
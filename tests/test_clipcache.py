@@ -0,0 +1,98 @@
+# Benchmark Dataset Creator clip cache tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+
+from BenchmarkDatasetCreator import audiofiles, clipcache, dataset, engine
+from conftest import assert_same_export
+
+
+def list_cached_clips(cache_folder):
+    return sorted(os.path.join(root, ff) for root, _, files in os.walk(cache_folder) for ff in files
+                  if ff.endswith('.flac'))
+
+
+def test_cached_clips_are_linked(selection_table_df, make_export_settings, tmp_path, monkeypatch):
+    cache_folder = str(tmp_path / 'clip_cache')
+    export_settings = make_export_settings('first')
+    export_settings['Clip cache folder'] = cache_folder
+    dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+
+    audio_folder = export_settings['Export folders']['Audio export folder']
+    cached_clips = list_cached_clips(cache_folder)
+    assert len(cached_clips) == len(os.listdir(audio_folder))
+    assert {os.stat(ff).st_ino for ff in cached_clips} == \
+        {os.stat(os.path.join(audio_folder, ff)).st_ino for ff in os.listdir(audio_folder)}
+
+    # A second project with the same clip settings decodes no audio
+    def read_stage(*args):
+        raise AssertionError('The cached clips are decoded again')
+
+    monkeypatch.setattr(engine, 'read_stage', read_stage)
+    export_settings_cached = make_export_settings('cached')
+    export_settings_cached['Clip cache folder'] = cache_folder
+    dataset.benchmark_creator(selection_table_df, export_settings_cached, 'Tag')
+    monkeypatch.undo()
+
+    assert_same_export(export_settings, export_settings_cached)
+    assert all(os.stat(ff).st_nlink == 3 for ff in cached_clips)
+
+    # Other clip settings and modified audio files are not read from the cache
+    export_settings_16 = make_export_settings('bit_depth', **{'Bit depth': 16})
+    export_settings_16['Clip cache folder'] = cache_folder
+    dataset.benchmark_creator(selection_table_df, export_settings_16, 'Tag')
+    assert len(list_cached_clips(cache_folder)) == 2 * len(cached_clips)
+
+    audiofile = selection_table_df['Begin Path'].iloc[0]
+    os.utime(audiofile, ns=(os.stat(audiofile).st_atime_ns, os.stat(audiofile).st_mtime_ns + 10 ** 9))
+    export_settings_modified = make_export_settings('modified')
+    export_settings_modified['Clip cache folder'] = cache_folder
+    dataset.benchmark_creator(selection_table_df, export_settings_modified, 'Tag')
+    probes = audiofiles.probe_audiofiles(selection_table_df['Begin Path'].unique())
+    plan_df = dataset.plan_benchmark_exports(selection_table_df, export_settings, 'Tag', probes)
+    modified_clips = plan_df.loc[(plan_df['Status'] != 'ignored') & (plan_df['Begin Path'] == audiofile),
+                                 'Export filename'].nunique()
+    assert len(list_cached_clips(cache_folder)) == 2 * len(cached_clips) + modified_clips
+    assert_same_export(export_settings, export_settings_modified)
+
+    # The cache is kept in its disk budget at the end of an export
+    export_settings_budget = make_export_settings('budget')
+    export_settings_budget['Clip cache folder'] = cache_folder
+    export_settings_budget['Clip cache size (MB)'] = 0
+    dataset.benchmark_creator(selection_table_df, export_settings_budget, 'Tag')
+    assert not list_cached_clips(cache_folder)
+    assert_same_export(export_settings, export_settings_budget)
+
+
+def test_evict_least_recently_used_clips(tmp_path):
+    cache_folder = str(tmp_path / 'clip_cache')
+    export_folder = tmp_path / 'audio'
+    export_folder.mkdir()
+
+    # Ten clips of 100 kB, used in turn
+    keys = [clipcache.get_clip_key(['a.wav', 1000, 0], 0, start_clip, [10, 4000, 'PCM_24', 'hq', 0, 5])
+            for start_clip in range(0, 100, 10)]
+    assert len(set(keys)) == len(keys)
+    for ind, key in enumerate(keys):
+        export_path = str(export_folder / f'clip_{ind}.flac')
+        with open(export_path, 'wb') as f:
+            f.write(bytes(100 * 1024))
+        clipcache.add_clip(cache_folder, key, export_path)
+        cache_file = clipcache.get_cache_file(cache_folder, key)
+        os.utime(cache_file, ns=(ind * 10 ** 9, ind * 10 ** 9))
+
+    # A restored clip is the most recently used
+    assert clipcache.restore_clip(cache_folder, keys[0], str(export_folder / 'restored.flac'))
+    assert not clipcache.restore_clip(cache_folder, keys[0][::-1], str(export_folder / 'missing.flac'))
+    assert not os.path.exists(export_folder / 'missing.flac')
+
+    assert clipcache.evict_clips(cache_folder, 0.5) == 5
+    assert [os.path.exists(clipcache.get_cache_file(cache_folder, key)) for key in keys] == \
+        [True] + [False] * 5 + [True] * 4
+    assert sum(os.path.getsize(ff) for ff in list_cached_clips(cache_folder)) <= 0.5 * 2 ** 20
+    assert clipcache.evict_clips(cache_folder, 0.5) == 0
+
+    # The exported clips are not deleted with the cached clips
+    assert len(os.listdir(export_folder)) == 11
@@ -0,0 +1,54 @@
+# Benchmark Dataset Creator clip store tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+import filecmp
+
+import numpy as np
+import pandas as pd
+import pytest
+import soundfile as sf
+
+from BenchmarkDatasetCreator import clipstore, dataset
+
+
+@pytest.mark.parametrize('bit_depth, dtype, shift', [(16, 'int16', 16), (24, 'int32', 8)])
+def test_clip_store_rows_equal_flac_export(selection_table_df, make_export_settings, bit_depth, dtype, shift):
+    export_settings_flac = make_export_settings('flac', **{'Bit depth': bit_depth})
+    dataset.benchmark_creator(selection_table_df, export_settings_flac, 'Tag')
+
+    export_settings = make_export_settings('npy', **{'Bit depth': bit_depth})
+    export_settings['Export format'] = 'npy'
+    dataset.benchmark_creator(selection_table_df, export_settings, 'Tag', workers=2)
+
+    clip_store_folder = clipstore.get_clip_store_folder(export_settings)
+    clips = np.load(os.path.join(clip_store_folder, clipstore.CLIP_STORE_FILENAME), mmap_mode='r')
+    clip_index_df = pd.read_parquet(os.path.join(clip_store_folder, clipstore.CLIP_INDEX_FILENAME))
+    audio_folder = export_settings_flac['Export folders']['Audio export folder']
+    assert clips.dtype == np.dtype(dtype)
+    assert clips.shape == (len(os.listdir(audio_folder)), 10 * 4000)
+    assert clip_index_df['Row'].tolist() == list(range(len(clips)))
+    assert sorted(clip_index_df['Export filename'] + '.flac') == sorted(os.listdir(audio_folder))
+
+    # Each row holds the samples of the FLAC clip, the clips that end after their audio file are padded with 0
+    padded = 0
+    for row, export_filename, samples in clip_index_df[['Row', 'Export filename', 'Samples']].itertuples(
+            index=False):
+        x, _ = sf.read(os.path.join(audio_folder, export_filename + '.flac'), dtype='int32')
+        assert samples == len(x)
+        np.testing.assert_array_equal(clips[row, :samples], x >> shift, err_msg=export_filename)
+        assert not clips[row, samples:].any()
+        padded += samples < clips.shape[1]
+    assert padded > 0
+
+    # The labels of each clip are the labels of its selection table
+    annotation_folder = export_settings_flac['Export folders']['Annotation export folder']
+    for export_filename, labels in clip_index_df[['Export filename', 'Labels']].itertuples(index=False):
+        selection_table_df = pd.read_csv(os.path.join(annotation_folder, export_filename + '.txt'), sep='\t')
+        assert list(labels) == selection_table_df['Tags'].tolist()
+
+    assert not os.listdir(export_settings['Export folders']['Audio export folder'])
+    assert filecmp.cmp(export_settings['Export folders']['Annotation CSV file'],
+                       export_settings_flac['Export folders']['Annotation CSV file'], shallow=False)
@@ -0,0 +1,211 @@
+# Benchmark Dataset Creator export engine tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from BenchmarkDatasetCreator import audiofiles, dataset, engine
+from conftest import assert_same_export
+
+
+def write_noise(audiofile, fs, n_channels, duration, subtype, seed=0):
+    """
+    Writes an audio file of noise, returns its path.
+    """
+    x = 0.2 * np.random.default_rng(seed).standard_normal((int(fs * duration), n_channels))
+    sf.write(audiofile, x, fs, subtype)
+    return str(audiofile)
+
+
+def test_blocks_fit_memory_budget_of_multichannel_flac(tmp_path, make_export_settings, monkeypatch):
+    audiofile = write_noise(tmp_path / 'multichannel.flac', 8000, 8, 25, 'PCM_24')
+    export_settings_whole = make_export_settings('whole')
+    export_settings = make_export_settings('blocks')
+    export_settings['Max memory (MB)'] = 1
+    export_settings['Encoder workers'] = 3
+    clips = [(0, 2, 'clip_0000s'), (10, 2, 'clip_0010s'), (10, 6, 'clip_0010s_ch07')]
+
+    # Record the number of frames and channels decoded by each read
+    reads = []
+    read_frames = engine.read_frames
+
+    def recorded_read_frames(sf_desc, frames, dtype='float32', channels=None):
+        reads.append((frames, sf_desc.channels))
+        return read_frames(sf_desc, frames, dtype, channels)
+
+    monkeypatch.setattr(engine, 'read_frames', recorded_read_frames)
+    engine.export_audiofile(audiofile, clips, export_settings, 'PCM_24')
+    monkeypatch.undo()
+
+    # All of the source channels are decoded, the blocks held by the pipeline fit in the budget
+    block_bytes = max(frames * n_channels * 4 for frames, n_channels in reads)
+    assert len(reads) > len(clips)
+    assert block_bytes * engine.get_pipeline_block_copies(3) * 2 <= 2 ** 20
+    assert engine.get_pipeline_block_copies(3) > engine.get_pipeline_block_copies(1)
+
+    engine.export_audiofile(audiofile, clips, export_settings_whole, 'PCM_24')
+    for _, _, export_filename in clips:
+        x_blocks, _ = sf.read(os.path.join(export_settings['Export folders']['Audio export folder'],
+                                           export_filename + '.flac'), dtype='int32')
+        x_whole, _ = sf.read(os.path.join(export_settings_whole['Export folders']['Audio export folder'],
+                                          export_filename + '.flac'), dtype='int32')
+        np.testing.assert_array_equal(x_blocks, x_whole)
+
+
+def test_map_audiofiles_bounds_jobs_in_flight(monkeypatch):
+    submitted = []
+
+    class RecordedExecutor(ThreadPoolExecutor):
+        def submit(self, function, *args, **kwargs):
+            submitted.append(args[0])
+            return super().submit(function, *args, **kwargs)
+
+    def export_job(audiofile, clips, export_settings, bit_depth):
+        return audiofile, len(submitted)
+
+    # Worker threads stand in for the worker processes
+    monkeypatch.setattr(engine, 'ProcessPoolExecutor', RecordedExecutor)
+    export_jobs = [(f'file_{ind}.wav', []) for ind in range(20)]
+    results = list(engine.map_audiofiles(export_job, export_jobs, {}, 'PCM_24', workers=3))
+
+    assert [ind_job for ind_job, _ in results] == list(range(20))
+    assert [audiofile for _, (audiofile, _) in results] == [audiofile for audiofile, _ in export_jobs]
+    assert max(n_submitted - ind_job for ind_job, (_, n_submitted) in results) <= \
+        engine.MAP_JOBS_PER_WORKER * 3
+
+
+def test_clips_do_not_depend_on_other_selections(selection_table_df, make_export_settings):
+    export_settings_all = make_export_settings('all')
+    dataset.benchmark_creator(selection_table_df, export_settings_all, 'Tag')
+
+    # Export each clip of the first audio file on its own
+    audio_folder = export_settings_all['Export folders']['Audio export folder']
+    audiofile = selection_table_df['Begin Path'].iloc[0]
+    first_df = selection_table_df[selection_table_df['Begin Path'] == audiofile]
+    for ind in range(0, len(first_df), 4):
+        export_settings = make_export_settings(f'single_{ind}')
+        dataset.benchmark_creator(first_df.iloc[[ind]], export_settings, 'Tag')
+        for filename in os.listdir(export_settings['Export folders']['Audio export folder']):
+            x, _ = sf.read(os.path.join(export_settings['Export folders']['Audio export folder'], filename),
+                           dtype='int32')
+            x_all, _ = sf.read(os.path.join(audio_folder, filename), dtype='int32')
+            np.testing.assert_array_equal(x, x_all, err_msg=filename)
+
+
+def test_resampling_context_clips_do_not_depend_on_other_selections(selection_table_df, make_export_settings):
+    export_settings_all = make_export_settings('all', **{'Resampling context (s)': 1})
+    dataset.benchmark_creator(selection_table_df, export_settings_all, 'Tag')
+
+    export_settings_blocks = make_export_settings('blocks', **{'Resampling context (s)': 1})
+    export_settings_blocks['Max memory (MB)'] = 1
+    dataset.benchmark_creator(selection_table_df, export_settings_blocks, 'Tag')
+    assert_same_export(export_settings_all, export_settings_blocks)
+
+    audio_folder = export_settings_all['Export folders']['Audio export folder']
+    export_settings = make_export_settings('single', **{'Resampling context (s)': 1})
+    dataset.benchmark_creator(selection_table_df.iloc[[11]], export_settings, 'Tag')
+    for filename in os.listdir(export_settings['Export folders']['Audio export folder']):
+        x, _ = sf.read(os.path.join(export_settings['Export folders']['Audio export folder'], filename),
+                       dtype='int32')
+        x_all, _ = sf.read(os.path.join(audio_folder, filename), dtype='int32')
+        np.testing.assert_array_equal(x, x_all, err_msg=filename)
+
+
+def test_polyphase_falls_back_for_large_factors(tmp_path):
+    x = np.random.default_rng(0).standard_normal((2, 44101)).astype('float32')
+    with pytest.warns(UserWarning, match='polyphase'):
+        x_resampled = engine.resample_clip(x, 44101, 48000, 'polyphase')
+    np.testing.assert_array_equal(x_resampled, engine.resample_clip(x, 44101, 48000, 'vhq'))
+
+    # Simple ratios are resampled with the polyphase filters
+    assert engine.get_file_resampling_quality('polyphase', 48000, 44100) == 'polyphase'
+    with pytest.warns(UserWarning, match='polyphase'):
+        assert engine.get_block_frames(1, 480000, 1, 44101, 48000, 'polyphase') < 480000
+    assert engine.get_block_frames(1, 480000, 1, 48000, 44100, 'polyphase') == 480000
+
+
+@pytest.mark.parametrize('subtype, bit_depth', [('PCM_16', 'PCM_16'), ('PCM_16', 'PCM_24'), ('PCM_24', 'PCM_24'),
+                                                ('PCM_24', 'PCM_16')])
+def test_passthrough_clips_are_bit_exact(tmp_path, make_export_settings, monkeypatch, subtype, bit_depth):
+    audiofile = write_noise(tmp_path / 'source.flac', 8000, 2, 30, subtype)
+    export_settings = make_export_settings('passthrough', **{'fs (Hz)': 8000})
+    export_settings_float = make_export_settings('float', **{'fs (Hz)': 8000})
+    clips = [(0, 0, 'clip_0000s'), (12.5, 1, 'clip_0012s'), (25, 0, 'clip_0025s')]
+    engine.export_audiofile(audiofile, clips, export_settings, bit_depth)
+
+    # The clips read as floats are the same
+    monkeypatch.setattr(engine, 'get_passthrough_dtype', lambda sf_desc, fs: None)
+    engine.export_audiofile(audiofile, clips, export_settings_float, bit_depth)
+    monkeypatch.undo()
+
+    x_source, _ = sf.read(audiofile, dtype='int32')
+    for start_clip, channel, export_filename in clips:
+        x, _ = sf.read(os.path.join(export_settings['Export folders']['Audio export folder'],
+                                    export_filename + '.flac'), dtype='int32')
+        x_float, _ = sf.read(os.path.join(export_settings_float['Export folders']['Audio export folder'],
+                                          export_filename + '.flac'), dtype='int32')
+        np.testing.assert_array_equal(x, x_float)
+
+        # Without requantization, the samples are the source samples
+        if subtype == 'PCM_16' or bit_depth == 'PCM_24':
+            start = int(start_clip * 8000)
+            np.testing.assert_array_equal(x, x_source[start:start + 80000, channel])
+
+
+def test_sequential_and_random_reads_give_the_same_clips(selection_table_df, make_export_settings, monkeypatch):
+    # All of the audio files are read with soundfile, memory-mapped files are always read at random
+    monkeypatch.setattr(audiofiles, 'read_pcm_header', lambda audiofile: None)
+    export_settings = {}
+    for strategy in ['sequential', 'random']:
+        monkeypatch.setattr(engine, 'get_read_strategy', lambda *args, strategy=strategy: strategy)
+        export_settings[strategy] = make_export_settings(strategy, **{'Resampling context (s)': 1})
+        export_settings[strategy]['Max memory (MB)'] = 1
+        dataset.benchmark_creator(selection_table_df, export_settings[strategy], 'Tag')
+    assert_same_export(export_settings['sequential'], export_settings['random'])
+
+
+def test_read_strategy(tmp_path, monkeypatch):
+    audiofile = write_noise(tmp_path / 'source.wav', 8000, 2, 60, 'PCM_16')
+    with sf.SoundFile(audiofile) as sf_desc:
+        assert engine.get_read_strategy(sf_desc, os.path.getsize(audiofile), [0, 30], 10) == 'sequential'
+
+        # Sparse windows of large files are reached by seeking
+        monkeypatch.setattr(engine, 'SEQUENTIAL_READ_MAX_GAP_BYTES', 2 ** 20)
+        assert engine.get_read_strategy(sf_desc, os.path.getsize(audiofile), [0, 30], 10) == 'random'
+        assert engine.get_read_strategy(sf_desc, os.path.getsize(audiofile), range(0, 60, 10), 10) == 'sequential'
+
+
+def test_flac_compression_level_is_honoured(tmp_path, make_export_settings):
+    # Smooth audio, which the higher compression levels predict better
+    audiofile = str(tmp_path / 'source.wav')
+    t = np.arange(8000 * 30) / 8000
+    sf.write(audiofile, 0.3 * np.sin(2 * np.pi * 440 * t) + 0.01 * np.sin(2 * np.pi * 3000 * t), 8000, 'PCM_24')
+    clips = [(0, 0, 'clip_0000s'), (10, 0, 'clip_0010s')]
+
+    sizes = {}
+    for level in [0, 8]:
+        export_settings = make_export_settings(f'level_{level}', **{'fs (Hz)': 8000,
+                                                                   'FLAC compression level': level})
+        export_settings['Encoder workers'] = 2
+        engine.export_audiofile(audiofile, clips, export_settings, 'PCM_24')
+        audio_folder = export_settings['Export folders']['Audio export folder']
+        sizes[level] = sum(os.path.getsize(os.path.join(audio_folder, ff)) for ff in os.listdir(audio_folder))
+    assert sizes[8] < sizes[0]
+
+    # The decoded audio is the same
+    for _, _, export_filename in clips:
+        x_0, _ = sf.read(str(tmp_path / 'level_0' / 'audio' / (export_filename + '.flac')), dtype='int32')
+        x_8, _ = sf.read(str(tmp_path / 'level_8' / 'audio' / (export_filename + '.flac')), dtype='int32')
+        np.testing.assert_array_equal(x_0, x_8)
+
+
+@pytest.mark.parametrize('level', [-1, 9, 2.5, '5'])
+def test_invalid_flac_compression_level_raises(make_export_settings, level):
+    with pytest.raises(ValueError, match='FLAC compression level'):
+        dataset.check_export_settings(make_export_settings('invalid', **{'FLAC compression level': level}))
@@ -0,0 +1,65 @@
+# Benchmark Dataset Creator size estimator tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+
+import numpy as np
+import pytest
+
+from BenchmarkDatasetCreator import audiofiles, dataset, engine
+
+
+def get_exported_clip_sizes(export_settings):
+    audio_folder = export_settings['Export folders']['Audio export folder']
+    return [os.path.getsize(os.path.join(audio_folder, ff)) for ff in os.listdir(audio_folder)]
+
+
+@pytest.mark.parametrize('split', [[True, 1], [False, 0]])
+def test_estimator_counts_exported_clips(selection_table_df, make_export_settings, monkeypatch, split):
+    export_settings = make_export_settings('estimate')
+    export_settings['Selections']['Split export selections'] = split
+
+    # No audio is encoded to count the clips
+    monkeypatch.setattr(engine, 'measure_clip_sizes', None)
+    estimate = dataset.benchmark_size_estimator(selection_table_df, export_settings, 'Tag')
+    monkeypatch.undo()
+
+    dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+    assert estimate['Clips'] == len(get_exported_clip_sizes(export_settings))
+    assert estimate['Sampled clips'] == 0
+    assert estimate['FLAC compression'] == 0.5
+
+    probes = audiofiles.probe_audiofiles(selection_table_df['Begin Path'].unique())
+    plan_df = dataset.plan_benchmark_exports(selection_table_df, export_settings, 'Tag', probes)
+    assert estimate['Selections'] == plan_df['Status'].value_counts().to_dict()
+
+
+def test_estimator_measures_flac_compression(selection_table_df, make_export_settings):
+    export_settings = make_export_settings('estimate')
+
+    # All of the export clips are encoded
+    estimate = dataset.benchmark_size_estimator(selection_table_df, export_settings, 'Tag', sample_clips=1000,
+                                                workers=2)
+    dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+    sizes = get_exported_clip_sizes(export_settings)
+    assert estimate['Sampled clips'] == len(sizes)
+    assert estimate['FLAC compression'] == pytest.approx(np.mean(sizes) / estimate['Clip size (bytes)'])
+    low, high = estimate['FLAC compression CI']
+    assert low < estimate['FLAC compression'] < high
+    assert estimate['Estimated size (bytes)'] == pytest.approx(np.sum(sizes))
+
+    # A sample of the export clips gives a confidence interval
+    sample_estimate = dataset.benchmark_size_estimator(selection_table_df, export_settings, 'Tag', sample_clips=5)
+    assert sample_estimate['Sampled clips'] == 5
+    low, high = sample_estimate['Estimated size CI (bytes)']
+    assert low < sample_estimate['Estimated size (bytes)'] < high
+
+
+def test_estimator_sampling_time_budget(selection_table_df, make_export_settings):
+    estimate = dataset.benchmark_size_estimator(selection_table_df, make_export_settings('estimate'), 'Tag',
+                                                sample_clips=1000, sample_time=0)
+    assert estimate['Sampled clips'] == 0
+    assert estimate['FLAC compression'] == 0.5
+    assert estimate['FLAC compression CI'] is None
@@ -0,0 +1,102 @@
+# Benchmark Dataset Creator export journal tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+
+import pandas as pd
+import pytest
+
+from BenchmarkDatasetCreator import dataset, manifest
+from conftest import assert_same_export
+
+
+def interrupt_journal_commit(monkeypatch, crash_after):
+    """
+    Interrupts the export when committing its crash_after-th audio file to the journal.
+    """
+    journal_file_commit = manifest.journal_file_commit
+    calls = []
+
+    def interrupted_journal_file_commit(*args, **kwargs):
+        calls.append(None)
+        if len(calls) == crash_after:
+            raise KeyboardInterrupt
+        return journal_file_commit(*args, **kwargs)
+
+    monkeypatch.setattr(manifest, 'journal_file_commit', interrupted_journal_file_commit)
+
+
+@pytest.mark.parametrize('crash_after', [1, 3])
+def test_resume_equals_fresh_export(selection_table_df, make_export_settings, monkeypatch, crash_after):
+    export_settings_fresh = make_export_settings('fresh')
+    dataset.benchmark_creator(selection_table_df, export_settings_fresh, 'Tag')
+
+    export_settings = make_export_settings('resumed')
+    interrupt_journal_commit(monkeypatch, crash_after)
+    with pytest.raises(KeyboardInterrupt):
+        dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+    monkeypatch.undo()
+
+    dataset.benchmark_creator(selection_table_df, export_settings, 'Tag', resume=True)
+    assert_same_export(export_settings_fresh, export_settings)
+
+
+def test_resume_with_other_settings_raises(selection_table_df, make_export_settings, monkeypatch):
+    export_settings = make_export_settings('resumed')
+    interrupt_journal_commit(monkeypatch, 2)
+    with pytest.raises(KeyboardInterrupt):
+        dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+    monkeypatch.undo()
+
+    export_settings['Digital sampling']['fs (Hz)'] = 2000
+    with pytest.raises(ValueError, match='cannot be resumed'):
+        dataset.benchmark_creator(selection_table_df, export_settings, 'Tag', resume=True)
+
+
+def test_incremental_equals_fresh_export(selection_table_df, make_export_settings):
+    # Relabel a selection, remove two selections and add a selection in a new export clip
+    new_df = selection_table_df.copy()
+    new_df.loc[new_df.index[1], 'Tag'] = 'relabelled'
+    new_df = new_df.drop(new_df.index[[5, 20]])
+    added = new_df.iloc[[3]].copy()
+    for key in ['Begin Time (s)', 'End Time (s)', 'File Offset (s)']:
+        added[key] += 10
+    new_df = pd.concat([new_df, added], ignore_index=True)
+
+    export_settings = make_export_settings('incremental')
+    dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+    dataset.benchmark_creator(new_df, export_settings, 'Tag', incremental=True)
+
+    export_settings_fresh = make_export_settings('fresh')
+    dataset.benchmark_creator(new_df, export_settings_fresh, 'Tag')
+    assert_same_export(export_settings_fresh, export_settings)
+
+
+def test_incremental_without_journal_creates_benchmark(selection_table_df, make_export_settings):
+    export_settings = make_export_settings('incremental')
+    dataset.benchmark_creator(selection_table_df, export_settings, 'Tag', incremental=True)
+    assert os.path.exists(manifest.get_journal_file(export_settings))
+
+    export_settings_fresh = make_export_settings('fresh')
+    dataset.benchmark_creator(selection_table_df, export_settings_fresh, 'Tag')
+    assert_same_export(export_settings_fresh, export_settings)
+
+
+def test_incremental_removes_uncommitted_clips(selection_table_df, make_export_settings, monkeypatch):
+    # The export is interrupted once the clips of the second audio file are written
+    export_settings = make_export_settings('incremental')
+    interrupt_journal_commit(monkeypatch, 2)
+    with pytest.raises(KeyboardInterrupt):
+        dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+    monkeypatch.undo()
+
+    # The selections of the uncommitted audio file are removed
+    uncommitted_audiofile = selection_table_df['Begin Path'].unique()[1]
+    new_df = selection_table_df[selection_table_df['Begin Path'] != uncommitted_audiofile]
+    dataset.benchmark_creator(new_df, export_settings, 'Tag', incremental=True)
+
+    export_settings_fresh = make_export_settings('fresh')
+    dataset.benchmark_creator(new_df, export_settings_fresh, 'Tag')
+    assert_same_export(export_settings_fresh, export_settings)
@@ -0,0 +1,96 @@
+# Benchmark Dataset Creator export planner tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import numpy as np
+import pytest
+
+from BenchmarkDatasetCreator import audiofiles, dataset
+
+
+def plan_selection(selection, duration, split_selections, min_duration, n_channels):
+    """
+    Reference plan of a single selection, one selection at a time as the exports were planned before
+    plan_benchmark_exports: (status, start of the export clip, begin and end time in the export clip).
+    """
+    if not 1 <= selection['Channel'] <= n_channels:
+        return 'ignored', None, None, None
+
+    begin_time = selection['File Offset (s)']
+    end_time = begin_time + selection['End Time (s)'] - selection['Begin Time (s)']
+    sel_in_clip_begintime = np.floor(begin_time / duration)
+    sel_in_clip_endtime = np.floor(end_time / duration)
+
+    if sel_in_clip_begintime == sel_in_clip_endtime:
+        start_clip = sel_in_clip_begintime * duration
+        return 'kept', start_clip, begin_time - start_clip, end_time - start_clip
+
+    if split_selections:
+        if np.abs(sel_in_clip_endtime * duration - begin_time) >= min_duration:
+            start_clip = sel_in_clip_begintime * duration
+            return 'split', start_clip, begin_time - start_clip, duration
+        if np.abs(end_time - sel_in_clip_endtime * duration) >= min_duration:
+            start_clip = sel_in_clip_endtime * duration
+            return 'split', start_clip, 0.0, end_time - start_clip
+
+    return 'ignored', None, None, None
+
+
+@pytest.mark.parametrize('split', [[True, 1], [True, 0.3], [False, 1]])
+def test_plan_equals_per_selection_plan(selection_table_df, make_export_settings, split):
+    export_settings = make_export_settings('plan')
+    export_settings['Selections']['Split export selections'] = split
+    duration = export_settings['Digital sampling']['Audio duration (s)']
+    probes = audiofiles.probe_audiofiles(selection_table_df['Begin Path'].unique().tolist())
+
+    plan_df = dataset.plan_benchmark_exports(selection_table_df, export_settings, 'Tag', probes)
+
+    # The selections are planned by audio file, in order of appearance, channel and selection
+    unique_audiofiles = list(selection_table_df['Begin Path'].unique())
+    order = sorted(range(len(selection_table_df)), key=lambda ind: (
+        unique_audiofiles.index(selection_table_df['Begin Path'].iloc[ind]), selection_table_df['Channel'].iloc[ind]))
+    assert plan_df['Selection #'].tolist() == order
+
+    for _, row in plan_df.iterrows():
+        selection = selection_table_df.iloc[row['Selection #']]
+        probe = probes[selection['Begin Path']]
+        status, start_clip, begin_time, end_time = plan_selection(selection, duration, split[0], split[1],
+                                                                  probe['Channels'])
+        assert row['Status'] == status
+        assert row['Label'] == selection['Tag']
+        if status == 'ignored':
+            assert row['Export filename'] is None
+            assert np.isnan(row['Start export clip'])
+            continue
+
+        assert row['Start export clip'] == start_clip
+        assert row['Begin Time (s)'] == pytest.approx(begin_time, abs=1e-9)
+        assert row['End Time (s)'] == pytest.approx(end_time, abs=1e-9)
+        assert row['Export filename'] == dataset.get_export_filename(
+            export_settings, selection['Begin Path'], dataset.get_print_fs(probe['fs (Hz)']),
+            selection['Channel'] - 1, start_clip)
+
+    assert (plan_df['Status'] != 'ignored').any()
+    assert (plan_df['Status'] == 'split').any() == split[0]
+
+
+@pytest.mark.parametrize('channel', [np.nan, 0, -1, 1.5, 3])
+def test_plan_ignores_channels_not_in_audio_file(selection_table_df, make_export_settings, channel):
+    export_settings = make_export_settings('plan')
+    probes = audiofiles.probe_audiofiles(selection_table_df['Begin Path'].unique().tolist())
+    selection_table_df['Channel'] = selection_table_df['Channel'].astype(float)
+    selection_table_df.loc[[0, 5], 'Channel'] = channel
+
+    plan_df = dataset.plan_benchmark_exports(selection_table_df, export_settings, 'Tag', probes)
+
+    ignored_df = plan_df[plan_df['Selection #'].isin([0, 5])]
+    assert (ignored_df['Status'] == 'ignored').all()
+    assert (ignored_df['Reason'] == 'Channel not in the audio file').all()
+    assert ignored_df['Export filename'].isna().all()
+
+    # The other selections are planned as without these selections
+    other_df = selection_table_df.drop(index=[0, 5])
+    other_plan_df = dataset.plan_benchmark_exports(other_df, export_settings, 'Tag', probes)
+    assert plan_df.loc[~plan_df['Selection #'].isin([0, 5]), 'Export filename'].tolist() == \
+        other_plan_df['Export filename'].tolist()
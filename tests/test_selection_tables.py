@@ -0,0 +1,98 @@
+# Benchmark Dataset Creator selection table tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+
+import pandas as pd
+import pytest
+
+from BenchmarkDatasetCreator import dataset
+from conftest import assert_same_export
+
+
+@pytest.fixture
+def selection_table_folder(selection_table_df, tmp_path):
+    """
+    Writes the selection table in three files of a folder.
+    """
+    folder = tmp_path / 'selection_tables'
+    folder.mkdir()
+    for ind, ind_rows in enumerate([slice(0, 10), slice(10, 25), slice(25, None)]):
+        selection_table_df.iloc[ind_rows].to_csv(folder / f'table_{ind}.txt', sep='\t', index=False)
+    return str(folder)
+
+
+def test_folder_equals_concatenated_tables(selection_table_folder):
+    selection_table_df = dataset.load_selection_table(selection_table_folder, max_workers=3)
+
+    expected_df = pd.concat([pd.read_csv(os.path.join(selection_table_folder, ff), sep='\t')
+                             for ff in os.listdir(selection_table_folder)], ignore_index=True)
+    pd.testing.assert_frame_equal(selection_table_df, expected_df)
+
+
+def test_folder_with_missing_fields_raises(selection_table_df, selection_table_folder):
+    selection_table_df.drop(columns=['File Offset (s)', 'Low Freq (Hz)']).to_csv(
+        os.path.join(selection_table_folder, 'incomplete.txt'), sep='\t', index=False)
+    with pytest.raises(ValueError, match='incomplete.txt'):
+        dataset.load_selection_table(selection_table_folder)
+
+
+def test_selection_table_keeps_integer_frequencies(selection_table_df, make_export_settings, tmp_path):
+    selection_table_df['Low Freq (Hz)'] = 100
+    selection_table_folder = tmp_path / 'selection_tables'
+    selection_table_folder.mkdir()
+    selection_table_df.to_csv(selection_table_folder / 'table.txt', sep='\t', index=False)
+
+    export_settings = make_export_settings('integer')
+    dataset.benchmark_creator(dataset.load_selection_table(str(selection_table_folder)), export_settings, 'Tag')
+
+    annotation_folder = export_settings['Export folders']['Annotation export folder']
+    filename = sorted(os.listdir(annotation_folder))[0]
+    with open(os.path.join(annotation_folder, filename)) as f:
+        lines = f.read().splitlines()
+    low_freq = lines[0].split('\t').index('Low Freq (Hz)')
+    assert [line.split('\t')[low_freq] for line in lines[1:]] == ['100'] * (len(lines) - 1)
+
+
+def test_cached_selection_table(selection_table_folder, tmp_path, monkeypatch):
+    calls = []
+    read_selection_table = dataset.read_selection_table
+    monkeypatch.setattr(dataset, 'read_selection_table', lambda *args: calls.append(args) or
+                        read_selection_table(*args))
+
+    cache_folder = str(tmp_path / 'cache')
+    selection_table_df = dataset.load_selection_table(selection_table_folder, cache_folder=cache_folder)
+    assert len(calls) == 3
+
+    # The unchanged selection tables are loaded from the cache
+    cached_df = dataset.load_selection_table(selection_table_folder, cache_folder=cache_folder)
+    assert len(calls) == 3
+    pd.testing.assert_frame_equal(cached_df, selection_table_df)
+
+    # A changed selection table invalidates the cache
+    filename = os.path.join(selection_table_folder, 'table_1.txt')
+    changed_df = pd.read_csv(filename, sep='\t')
+    changed_df['Tag'] = 'changed'
+    changed_df.to_csv(filename, sep='\t', index=False)
+    os.utime(filename, ns=(os.stat(filename).st_atime_ns, os.stat(filename).st_mtime_ns + 10 ** 9))
+
+    reloaded_df = dataset.load_selection_table(selection_table_folder, cache_folder=cache_folder)
+    assert len(calls) == 6
+    pd.testing.assert_frame_equal(reloaded_df, dataset.load_selection_table(selection_table_folder))
+    assert (reloaded_df['Tag'] == 'changed').sum() == len(changed_df)
+
+
+@pytest.mark.parametrize('label_key', [None, 'Tag'])
+def test_compact_selection_table_export(selection_table_df, make_export_settings, label_key):
+    compact_df = dataset.compact_selection_table(selection_table_df, label_key)
+    assert (compact_df.memory_usage(index=False, deep=True).sum()
+            < selection_table_df.memory_usage(index=False, deep=True).sum())
+    assert isinstance(compact_df['Begin Path'].dtype, pd.CategoricalDtype)
+
+    export_settings = make_export_settings('full')
+    compact_export_settings = make_export_settings('compact')
+    dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+    dataset.benchmark_creator(compact_df, compact_export_settings, 'Tag')
+    assert_same_export(export_settings, compact_export_settings)
@@ -0,0 +1,62 @@
+# Benchmark Dataset Creator shard export tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import io
+import os
+import tarfile
+
+import numpy as np
+import pandas as pd
+import soundfile as sf
+
+from BenchmarkDatasetCreator import dataset, shards
+
+
+def test_tar_members_equal_flac_export(selection_table_df, make_export_settings):
+    export_settings_flac = make_export_settings('flac')
+    dataset.benchmark_creator(selection_table_df, export_settings_flac, 'Tag')
+
+    # Export twice, the second export replaces the first one
+    export_settings = make_export_settings('tar')
+    export_settings['Export format'] = 'tar'
+    export_settings['Shard size (MB)'] = 0.3
+    for _ in range(2):
+        dataset.benchmark_creator(selection_table_df, export_settings, 'Tag')
+
+    shard_folder = shards.get_shard_folder(export_settings)
+    index_df = pd.read_csv(os.path.join(shard_folder, shards.SHARD_INDEX_FILENAME), sep='\t')
+    audio_folder = export_settings_flac['Export folders']['Audio export folder']
+    annotation_folder = export_settings_flac['Export folders']['Annotation export folder']
+    assert sorted(index_df['Export filename'] + '.flac') == sorted(os.listdir(audio_folder))
+    assert index_df['Shard'].nunique() > 1
+
+    for shard in index_df['Shard'].unique():
+        assert os.path.getsize(os.path.join(shard_folder, shard)) <= 0.3 * 2 ** 20
+        with tarfile.open(os.path.join(shard_folder, shard)) as tar:
+            members = {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+        with open(os.path.join(shard_folder, shard), 'rb') as f:
+            shard_data = f.read()
+
+        for _, row in index_df[index_df['Shard'] == shard].iterrows():
+            flac_data = members[row['Export filename'] + '.flac']
+            selection_table_data = members[row['Export filename'] + '.txt']
+
+            # The index gives the members in the shard
+            flac_offset, selection_table_offset = row['FLAC offset (bytes)'], row['Selection table offset (bytes)']
+            assert shard_data[flac_offset:flac_offset + row['FLAC size (bytes)']] == flac_data
+            assert shard_data[selection_table_offset:selection_table_offset + row['Selection table size (bytes)']] \
+                == selection_table_data
+
+            x, _ = sf.read(io.BytesIO(flac_data), dtype='int32')
+            x_flac, _ = sf.read(os.path.join(audio_folder, row['Export filename'] + '.flac'), dtype='int32')
+            np.testing.assert_array_equal(x, x_flac)
+            with open(os.path.join(annotation_folder, row['Export filename'] + '.txt'), 'rb') as f:
+                assert selection_table_data == f.read()
+
+    # The annotation CSV is the one of a single export
+    with open(export_settings['Export folders']['Annotation CSV file']) as f_tar, \
+            open(export_settings_flac['Export folders']['Annotation CSV file']) as f_flac:
+        assert f_tar.read() == f_flac.read()
+    assert not os.path.exists(export_settings['Export folders']['Audio-Seltab Map CSV file'])
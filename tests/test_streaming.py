@@ -0,0 +1,60 @@
+# Benchmark Dataset Creator streaming export tests
+#
+# Léa Bouffaut, Ph.D. -- K. Lisa Yang Center for Conservation Bioacoustics, Cornell University
+# lea.bouffaut@cornell.edu
+
+import os
+
+import pytest
+
+from BenchmarkDatasetCreator import dataset
+from conftest import assert_same_export
+
+
+@pytest.fixture
+def selection_table_folder(selection_table_df, tmp_path):
+    """
+    Writes the selection table in two files, with integer frequencies in the first one only.
+    """
+    folder = tmp_path / 'selection_tables'
+    folder.mkdir()
+    first_df = selection_table_df.iloc[:20].copy()
+    first_df['Low Freq (Hz)'] = 100
+    first_df.to_csv(folder / 'table_1.txt', sep='\t', index=False)
+    selection_table_df.iloc[20:].drop(columns='View').to_csv(folder / 'table_2.txt', sep='\t', index=False)
+    return str(folder)
+
+
+@pytest.mark.parametrize('chunksize', [7, 100000])
+def test_streaming_equals_in_memory_export(selection_table_folder, make_export_settings, chunksize):
+    export_settings = make_export_settings('in_memory')
+    dataset.benchmark_creator(dataset.load_selection_table(selection_table_folder), export_settings, 'Tag')
+
+    export_settings_streaming = make_export_settings('streaming')
+    dataset.benchmark_creator_streaming(selection_table_folder, export_settings_streaming, 'Tag',
+                                        chunksize=chunksize, workers=2)
+    assert_same_export(export_settings, export_settings_streaming)
+    assert not os.path.exists(os.path.join(export_settings_streaming['Export folders']['Export folder'],
+                                           dataset.SELECTION_TABLE_PARTITION_FOLDER))
+
+
+def test_partition_dtypes(selection_table_folder, tmp_path):
+    partitions, dtypes = dataset.partition_selection_tables(selection_table_folder, str(tmp_path / 'partitions'),
+                                                            chunksize=5)
+    selection_table_df = dataset.load_selection_table(selection_table_folder)
+    assert list(partitions) == list(selection_table_df['Begin Path'].unique())
+    assert dtypes == {col: 'float64' for col in selection_table_df.columns
+                      if selection_table_df[col].dtype == 'float64'}
+    assert 'Low Freq (Hz)' in dtypes
+    for partition in partitions.values():
+        partition_df = dataset.read_selection_table(partition, dtypes)
+        assert all(partition_df[col].dtype == 'float64' for col in dtypes)
+
+
+def test_streaming_removes_partitions_after_error(selection_table_folder, make_export_settings):
+    export_settings = make_export_settings('streaming')
+    export_settings['Digital sampling']['Bit depth'] = 12
+    with pytest.raises(Exception):
+        dataset.benchmark_creator_streaming(selection_table_folder, export_settings, 'Tag')
+    assert not os.path.exists(os.path.join(export_settings['Export folders']['Export folder'],
+                                           dataset.SELECTION_TABLE_PARTITION_FOLDER))